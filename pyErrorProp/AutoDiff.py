@@ -0,0 +1,395 @@
+from __future__ import division
+import math
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+#########
+# utils
+#########
+
+class _ScalarMath(object):
+  '''The elementary functions from the math module, using NumPy's names.'''
+  sqrt    = staticmethod(math.sqrt)
+  exp     = staticmethod(math.exp)
+  log     = staticmethod(math.log)
+  log10   = staticmethod(math.log10)
+  log2    = staticmethod(math.log2)
+  sin     = staticmethod(math.sin)
+  cos     = staticmethod(math.cos)
+  tan     = staticmethod(math.tan)
+  arcsin  = staticmethod(math.asin)
+  arccos  = staticmethod(math.acos)
+  arctan  = staticmethod(math.atan)
+  sinh    = staticmethod(math.sinh)
+  cosh    = staticmethod(math.cosh)
+  tanh    = staticmethod(math.tanh)
+
+  @staticmethod
+  def sign(x):
+    return math.copysign(1.0,x) if x != 0 else 0.0
+
+def _math_for(*values):
+  '''Return the module that should be used to evaluate elementary functions of values.'''
+  if numpy is not None:
+    for v in values:
+      if isinstance(v, numpy.ndarray):
+        return numpy
+  return _ScalarMath
+
+
+# The elementary functions that are supported, along with their derivatives.
+# Each entry maps a function name to (f(m,a), df(m,a,z)), where m is the
+# math module to use (math or numpy), a is the argument and z = f(m,a).
+UNARY_FUNCTIONS = {
+    'sqrt'    : ( lambda m,a: m.sqrt(a)   , lambda m,a,z: 0.5/z )
+  , 'exp'     : ( lambda m,a: m.exp(a)    , lambda m,a,z: z )
+  , 'log'     : ( lambda m,a: m.log(a)    , lambda m,a,z: 1/a )
+  , 'log10'   : ( lambda m,a: m.log10(a)  , lambda m,a,z: 1/(a*math.log(10)) )
+  , 'log2'    : ( lambda m,a: m.log2(a)   , lambda m,a,z: 1/(a*math.log(2)) )
+  , 'sin'     : ( lambda m,a: m.sin(a)    , lambda m,a,z: m.cos(a) )
+  , 'cos'     : ( lambda m,a: m.cos(a)    , lambda m,a,z: -m.sin(a) )
+  , 'tan'     : ( lambda m,a: m.tan(a)    , lambda m,a,z: 1 + z*z )
+  , 'arcsin'  : ( lambda m,a: m.arcsin(a) , lambda m,a,z: 1/m.sqrt(1 - a*a) )
+  , 'arccos'  : ( lambda m,a: m.arccos(a) , lambda m,a,z: -1/m.sqrt(1 - a*a) )
+  , 'arctan'  : ( lambda m,a: m.arctan(a) , lambda m,a,z: 1/(1 + a*a) )
+  , 'sinh'    : ( lambda m,a: m.sinh(a)   , lambda m,a,z: m.cosh(a) )
+  , 'cosh'    : ( lambda m,a: m.cosh(a)   , lambda m,a,z: m.sinh(a) )
+  , 'tanh'    : ( lambda m,a: m.tanh(a)   , lambda m,a,z: 1 - z*z )
+  , 'neg'     : ( lambda m,a: -a          , lambda m,a,z: -1 )
+  , 'abs'     : ( lambda m,a: abs(a)      , lambda m,a,z: m.sign(a) )
+  }
+
+# Each entry maps an operator name to (f(m,a,b), df(m,a,b,z)), where df
+# returns the partial derivatives with respect to a and b.
+BINARY_FUNCTIONS = {
+    'add'     : ( lambda m,a,b: a + b     , lambda m,a,b,z: (1, 1) )
+  , 'sub'     : ( lambda m,a,b: a - b     , lambda m,a,b,z: (1, -1) )
+  , 'mul'     : ( lambda m,a,b: a * b     , lambda m,a,b,z: (b, a) )
+  , 'truediv' : ( lambda m,a,b: a / b     , lambda m,a,b,z: (1/b, -z/b) )
+  , 'pow'     : ( lambda m,a,b: a ** b    , lambda m,a,b,z: (b*a**(b-1), _pow_exponent_derivative(m,a,z)) )
+  }
+
+def _pow_exponent_derivative(m,a,z):
+  '''Derivative of a**b with respect to b. It is only defined for positive a,
+     so zero is returned otherwise (i.e. for a negative base raised to a constant power).'''
+  if m is _ScalarMath:
+    return z*math.log(a) if a > 0 else 0.0
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    return numpy.where( a > 0, z*numpy.log(numpy.where(a > 0, a, 1)), 0.0 )
+
+
+##############
+# dual numbers
+##############
+
+def _scaled(derivatives, d):
+  return dict( (k, d*v) for k,v in derivatives.items() )
+
+def _combined(da, a, db, b):
+  derivatives = _scaled(a, da)
+  for k,v in b.items():
+    if k in derivatives:
+      derivatives[k] = derivatives[k] + db*v
+    else:
+      derivatives[k] = db*v
+  return derivatives
+
+
+class _Differentiable(object):
+  '''Operators and NumPy function support shared by the automatic differentiation number types.
+     Derived classes implement _unary(name) and _binary(name,other,reflected).'''
+
+  __slots__ = ()
+
+  def __float__(self):
+    raise TypeError("Cannot convert a %s to a float without losing its derivatives. Use NumPy functions instead of math module functions." % type(self).__name__)
+
+  def __add__(self,other):      return self._binary('add',other)
+  def __radd__(self,other):     return self._binary('add',other,True)
+  def __sub__(self,other):      return self._binary('sub',other)
+  def __rsub__(self,other):     return self._binary('sub',other,True)
+  def __mul__(self,other):      return self._binary('mul',other)
+  def __rmul__(self,other):     return self._binary('mul',other,True)
+  def __truediv__(self,other):  return self._binary('truediv',other)
+  def __rtruediv__(self,other): return self._binary('truediv',other,True)
+  __div__  = __truediv__
+  __rdiv__ = __rtruediv__
+  def __pow__(self,other):      return self._binary('pow',other)
+  def __rpow__(self,other):     return self._binary('pow',other,True)
+
+  def __neg__(self):            return self._unary('neg')
+  def __pos__(self):            return self
+  def __abs__(self):            return self._unary('abs')
+
+  # comparisons only look at the value
+  def __eq__(self,other):       return self.value == getattr(other,'value',other)
+  def __ne__(self,other):       return self.value != getattr(other,'value',other)
+  def __lt__(self,other):       return self.value <  getattr(other,'value',other)
+  def __le__(self,other):       return self.value <= getattr(other,'value',other)
+  def __gt__(self,other):       return self.value >  getattr(other,'value',other)
+  def __ge__(self,other):       return self.value >= getattr(other,'value',other)
+  __hash__ = None
+
+# NumPy calls these methods when a ufunc is applied to an object.
+for _name in UNARY_FUNCTIONS:
+  if _name not in ('neg','abs'):
+    setattr( _Differentiable, _name, (lambda name: lambda self: self._unary(name))(_name) )
+_Differentiable.absolute = _Differentiable.__abs__
+_Differentiable.negative = _Differentiable.__neg__
+
+
+class Dual(_Differentiable):
+  '''A dual number for forward mode automatic differentiation.
+
+     A dual number carries a value, and the derivatives of that value with respect
+     to any number of independent variables, stored in a dict keyed by variable.
+     Arithmetic on dual numbers applies the chain rule, so evaluating a function once
+     with dual number arguments gives the derivatives with respect to all arguments.
+
+     Dual numbers can be used as the magnitude of a pint Quantity. NumPy functions
+     (numpy.sin, numpy.sqrt, ...) are supported, the math module functions are not,
+     because they would convert the dual number to a float.'''
+
+  __slots__ = ('value','derivatives')
+
+  def __init__(self, value, derivatives = None):
+    self.value = value
+    self.derivatives = derivatives if derivatives is not None else dict()
+
+  def derivative(self, key, default = 0.0):
+    return self.derivatives.get(key, default)
+
+  def __repr__(self):
+    return "<Dual({0}, {1})>".format(self.value, self.derivatives)
+
+  def _binary(self, name, other, reflected = False):
+    f,df = BINARY_FUNCTIONS[name]
+    a_derivatives = self.derivatives
+    b_derivatives = dict()
+    a = self.value
+    b = other
+    if isinstance(other, Dual):
+      b = other.value
+      b_derivatives = other.derivatives
+    if reflected:
+      a,b = b,a
+      a_derivatives,b_derivatives = b_derivatives,a_derivatives
+
+    m = _math_for(a,b)
+    z = f(m,a,b)
+    da,db = df(m,a,b,z)
+    return Dual( z, _combined( da, a_derivatives, db, b_derivatives ) )
+
+  def _unary(self, name):
+    f,df = UNARY_FUNCTIONS[name]
+    m = _math_for(self.value)
+    z = f(m,self.value)
+    return Dual( z, _scaled( self.derivatives, df(m,self.value,z) ) )
+
+
+############################
+# reverse mode (a.k.a. tape)
+############################
+
+class TraceError(Exception):
+  '''Raised when a function can not be recorded as a kernel that is replayed for other input values,
+     i.e. because its control flow depends on the values of its inputs.'''
+
+
+class Tape(object):
+  '''A record of the elementary operations performed on tape variables.
+
+     Evaluating a function with tape variable arguments records every operation once.
+     The derivatives of the result with respect to all inputs are then computed with a
+     single backward sweep over the tape, at a cost that does not depend on the number of inputs.
+
+     A traced tape is recorded for a Kernel. Its variables raise a TraceError when they are compared,
+     or reduced over array values, since the kernel would replay the result for every other input.'''
+
+  def __init__(self, traced = False):
+    self.Variable = _TracedVariable if traced else TapeVariable
+    # for each node: the operation name and its operands (tape variables or constants)
+    self.operations = []
+    # for each node: the (node index, local derivative) pairs of the node's parents
+    self.partials = []
+    self.inputs = dict()
+
+  def __len__(self):
+    return len(self.operations)
+
+  def _record(self, value, name, operands, partials):
+    v = self.Variable( self, len(self.operations), value )
+    self.operations.append( (name,operands) )
+    self.partials.append( partials )
+    return v
+
+  def variable(self, key, value):
+    '''Create an input variable identified by key.'''
+    v = self._record( value, 'input', (key,), () )
+    self.inputs[key] = v.index
+    return v
+
+  def gradient(self, output):
+    '''Return a dict with the derivatives of output with respect to each input.'''
+    if not isinstance(output, TapeVariable) or output.tape is not self:
+      return dict( (k,0.0) for k in self.inputs )
+
+    adjoints = [0.0]*(output.index+1)
+    adjoints[output.index] = 1.0
+    for i in range(output.index,-1,-1):
+      a = adjoints[i]
+      for j,d in self.partials[i]:
+        adjoints[j] = adjoints[j] + d*a
+
+    return dict( (k,adjoints[i] if i <= output.index else 0.0) for k,i in self.inputs.items() )
+
+
+class TapeVariable(_Differentiable):
+  '''A number that records the operations performed on it to a tape for reverse mode differentiation.
+
+     Like dual numbers, tape variables can be used as the magnitude of a pint Quantity and with NumPy functions.'''
+
+  __slots__ = ('tape','index','value')
+
+  def __init__(self, tape, index, value):
+    self.tape = tape
+    self.index = index
+    self.value = value
+
+  def __repr__(self):
+    return "<TapeVariable({0}, {1})>".format(self.index, self.value)
+
+  def _binary(self, name, other, reflected = False):
+    if hasattr(other, 'magnitude'):
+      # let quantities wrap the result, so the units are kept.
+      return NotImplemented
+    f,df = BINARY_FUNCTIONS[name]
+    a = self
+    b = other
+    if reflected:
+      a,b = b,a
+    av = a.value if isinstance(a, TapeVariable) else a
+    bv = b.value if isinstance(b, TapeVariable) else b
+
+    m = _math_for(av,bv)
+    z = f(m,av,bv)
+    da,db = df(m,av,bv,z)
+    partials = []
+    if isinstance(a, TapeVariable):
+      partials.append( (a.index,da) )
+    if isinstance(b, TapeVariable):
+      partials.append( (b.index,db) )
+    return self.tape._record( z, name, (a,b), tuple(partials) )
+
+  def _unary(self, name):
+    f,df = UNARY_FUNCTIONS[name]
+    m = _math_for(self.value)
+    z = f(m,self.value)
+    return self.tape._record( z, name, (self,), ( (self.index,df(m,self.value,z)), ) )
+
+
+def _compared(self, other):
+  raise TraceError("The traced function compares an input (i.e. an if statement, min or max), so its result depends on a branch that a kernel can not replay.")
+
+def _reduced(self, *args, **kargs):
+  if getattr(self.value,'ndim',0) > 0:
+    raise TraceError("The traced function reduces an array input (i.e. with sum or mean), kernels only replay element-wise operations.")
+  return self
+
+class _TracedVariable(TapeVariable):
+  '''A tape variable that is recorded for a Kernel (see Tape).'''
+
+  __slots__ = ()
+
+  __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _compared
+  __hash__ = None
+
+  # NumPy calls these methods for its reductions of objects (numpy.sum, numpy.max, ...)
+  sum = mean = prod = max = min = std = var = cumsum = cumprod = any = all = argmax = argmin = _reduced
+
+
+class Kernel(object):
+  '''A recorded tape that can be evaluated again, on NumPy arrays.
+
+     The operations that the output of a tape depends on are replayed with new input
+     values (forward sweep), and the derivatives of the output with respect to each input
+     are computed with a backward sweep. Both sweeps operate on whole arrays, so a function
+     traced once with scalar values can be evaluated for many input values at NumPy speed.
+     The tape should be traced (see Tape), so that functions with control flow that depends on the
+     values of the inputs (which would be fixed by the trace) are rejected.'''
+
+  def __init__(self, tape, output):
+    self.inputs = dict( tape.inputs )
+    self.constant = None
+    self.operations = []
+
+    if not isinstance(output, TapeVariable) or output.tape is not tape:
+      # the output does not depend on the inputs
+      self.constant = output
+      return
+
+    # only keep the operations that the output depends on
+    needed = set( [output.index] )
+    for i in range(output.index,-1,-1):
+      if i in needed:
+        for j,d in tape.partials[i]:
+          needed.add(j)
+
+    # operands are stored as (True,index) for tape variables, and (False,value) for constants
+    slots = dict()
+    for i in sorted(needed):
+      name,operands = tape.operations[i]
+      if name == 'input':
+        ops = operands
+      else:
+        ops = tuple( (True,slots[o.index]) if isinstance(o,TapeVariable) else (False,o) for o in operands )
+      slots[i] = len(self.operations)
+      self.operations.append( (name,ops) )
+    self.inputs = dict( (k,slots[i]) for k,i in self.inputs.items() if i in slots )
+    self.output = slots[output.index]
+
+  def __call__(self, values):
+    '''Evaluate the kernel for a dict of input values (keyed like the tape inputs). Returns
+       the output value and a dict with the derivatives of the output with respect to each input.'''
+    if self.constant is not None:
+      return self.constant, dict( (k,0.0) for k in values )
+
+    m = numpy
+    z = [None]*len(self.operations)
+
+    def value(op):
+      return z[op[1]] if op[0] else op[1]
+
+    for i,(name,ops) in enumerate(self.operations):
+      if name == 'input':
+        z[i] = numpy.asarray( values[ops[0]], dtype=float )
+      elif len(ops) == 1:
+        z[i] = UNARY_FUNCTIONS[name][0]( m, value(ops[0]) )
+      else:
+        z[i] = BINARY_FUNCTIONS[name][0]( m, value(ops[0]), value(ops[1]) )
+
+    adjoints = [None]*len(self.operations)
+    adjoints[self.output] = numpy.ones_like( z[self.output] )
+    for i in range(self.output,-1,-1):
+      a = adjoints[i]
+      name,ops = self.operations[i]
+      if a is None or name == 'input':
+        continue
+      if len(ops) == 1:
+        partials = ( UNARY_FUNCTIONS[name][1]( m, value(ops[0]), z[i] ), )
+      else:
+        partials = BINARY_FUNCTIONS[name][1]( m, value(ops[0]), value(ops[1]), z[i] )
+      for op,d in zip(ops,partials):
+        if op[0]:
+          j = op[1]
+          adjoints[j] = d*a if adjoints[j] is None else adjoints[j] + d*a
+
+    derivatives = dict()
+    for k in values:
+      i = self.inputs.get(k)
+      derivatives[k] = adjoints[i] if i is not None and adjoints[i] is not None else 0.0
+    return z[self.output], derivatives
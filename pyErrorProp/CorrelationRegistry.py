@@ -1,8 +1,15 @@
-import array
+import array, weakref
 from weakref import WeakKeyDictionary
 from .util import isuncertain
 wdict = WeakKeyDictionary
 
+def _is_number(r):
+  try:
+    float(r)
+    return True
+  except TypeError:
+    return False
+
 class CorrelationRegistry(object):
   '''A registry that stores correlation coefficients between uncertain quantities. Coefficients
   are stored in a WeakKeyDictionary that is keyed using object instances. This allows the objects
@@ -54,6 +61,22 @@ class CorrelationRegistry(object):
     except TypeError:
       return default
 
+  def prune( self, cutoff ):
+    '''Remove the correlations that are smaller (in absolute value) than cutoff.
+       Returns the number of correlations removed, and the largest one.'''
+    removed,largest = 0,0.0
+    for x in list(self._correlations.keys()):
+      row = self._correlations.get(x)
+      if row is None:
+        continue
+      for y,r in list(row.items()):
+        if _is_number(r) and abs(r) < cutoff:
+          del row[y]
+          # each pair is stored twice, count it once.
+          removed += 0.5
+          largest = max( largest, abs(float(r)) )
+    return int(removed),largest
+
   def matrix( self, *args ):
     '''Return a correlation matrix for a set of arguments.'''
 
@@ -101,3 +124,250 @@ class CorrelationRegistry(object):
 
 
 
+class _RegistryRef(weakref.ref):
+  '''A weak reference to an object in a SparseCorrelationRegistry, that remembers the object's ID.'''
+  __slots__ = ('id','key')
+
+
+class SparseCorrelationRegistry(object):
+  '''A correlation registry that uses less memory per correlation than the CorrelationRegistry.
+
+  Each object that has a correlation is given an integer ID. The correlations are stored in a
+  sorted array of (ID,ID) keys (packed into a single 64 bit integer) and an array of values, with
+  both orderings of each pair stored so that all correlations of an object are a contiguous block.
+  New correlations are kept in a small dict buffer that is merged into the arrays when it gets large.
+  When an object is garbage collected, its correlations are dropped at the next merge, and its ID
+  can then be reused, so IDs only need to be unique among the objects that are alive.
+
+  Correlations take 32 bytes per pair (compared to several hundred for the CorrelationRegistry),
+  and the matrix method is vectorized. Requires NumPy.
+  '''
+
+  _SHIFT = 32
+  # keys are signed 64 bit integers, and dependencies() packs ID+1.
+  _MAX_ID = (1 << (63 - _SHIFT)) - 2
+
+  def __init__(self, buffer_size = 4096):
+    import numpy
+    self._numpy = numpy
+    self.buffer_size = buffer_size
+    # id(object) -> ID
+    self._ids = dict()
+    # ID -> weak reference to object
+    self._refs = dict()
+    self._next_id = 0
+    self._dead = []
+    # IDs of garbage collected objects whose correlations have been dropped
+    self._free = []
+    self._keys = numpy.zeros( 0, dtype=numpy.int64 )
+    self._values = numpy.zeros( 0, dtype=numpy.float64 )
+    # ID -> { ID : value } for correlations that haven't been merged yet
+    self._pending = dict()
+    self._npending = 0
+    # correlations that are not plain numbers (i.e. arrays) are stored as is
+    self._objects = dict()
+
+  def __len__(self):
+    '''The number of correlated pairs.'''
+    self._merge()
+    return len(self._keys)//2 + len(self._objects)//2
+
+  def _id( self, x, create = False ):
+    '''Return the ID of an object, or None if it doesn't have one.'''
+    i = self._ids.get( id(x) )
+    if i is not None:
+      ref = self._refs.get( i )
+      if ref is not None and ref() is x:
+        return i
+    if not create:
+      return None
+
+    ref = _RegistryRef( x, self._release )
+    i = self._new_id()
+    ref.id = i
+    ref.key = id(x)
+    self._ids[ref.key] = i
+    self._refs[i] = ref
+    return i
+
+  def _new_id( self ):
+    if not self._free and self._next_id > self._MAX_ID:
+      # recycle the IDs of objects that have been garbage collected
+      self._merge()
+    if self._free:
+      return self._free.pop()
+    if self._next_id > self._MAX_ID:
+      raise OverflowError("The correlation registry has run out of IDs ({0} objects with correlations are alive).".format(len(self._refs)))
+    i = self._next_id
+    self._next_id += 1
+    return i
+
+  def _release( self, ref ):
+    '''Called when an object with an ID is garbage collected. This can happen at any time,
+       so its correlations are only marked for removal here.'''
+    if self._ids.get( ref.key ) == ref.id:
+      del self._ids[ref.key]
+    self._refs.pop( ref.id, None )
+    self._dead.append( ref.id )
+
+  def _pack( self, i, j ):
+    return (i << self._SHIFT) | j
+
+  def _merge( self ):
+    '''Merge the buffer into the sorted arrays, and drop the correlations of dead objects.'''
+    numpy = self._numpy
+    if self._npending == 0 and not self._dead:
+      return
+
+    pending,self._pending,self._npending = self._pending,dict(),0
+    dead,self._dead = self._dead,[]
+
+    keys,values = [self._keys],[self._values]
+    if pending:
+      pk = []
+      pv = []
+      for i,row in pending.items():
+        for j,r in row.items():
+          pk.append( self._pack(i,j) )
+          pv.append( r )
+      keys.append( numpy.array( pk, dtype=numpy.int64 ) )
+      values.append( numpy.array( pv, dtype=numpy.float64 ) )
+    keys = numpy.concatenate( keys )
+    values = numpy.concatenate( values )
+
+    # newer values replace older ones. a stable sort keeps the buffer entries after
+    # the array entries with the same key, so we keep the last entry for each key.
+    order = numpy.argsort( keys, kind='stable' )
+    keys,values = keys[order],values[order]
+    last = numpy.ones( len(keys), dtype=bool )
+    last[:-1] = keys[1:] != keys[:-1]
+    keys,values = keys[last],values[last]
+
+    if dead:
+      mask = (1 << self._SHIFT)-1
+      dead_ids = numpy.array( dead, dtype=numpy.int64 )
+      alive = ~( numpy.isin( keys >> self._SHIFT, dead_ids ) | numpy.isin( keys & mask, dead_ids ) )
+      keys,values = keys[alive],values[alive]
+      dead = set(dead)
+      for k in [ k for k in self._objects if (k >> self._SHIFT) in dead or (k & mask) in dead ]:
+        del self._objects[k]
+      # the dead IDs don't have any correlations left, so they can be given to new objects.
+      self._free.extend( dead )
+
+    self._keys,self._values = keys,values
+
+  def correlated( self, x, y, r ):
+
+    try:
+      if not isuncertain(x) or not isuncertain(y):
+        return
+
+      i = self._id( x, True )
+      j = self._id( y, True )
+    except TypeError:
+      return
+
+    numpy = self._numpy
+    if numpy.ndim(r) == 0 and numpy.isrealobj(r) and _is_number(r):
+      # any real number (i.e. numpy.float64 or Decimal) is stored as a float
+      r = float(r)
+      self._objects.pop( self._pack(i,j), None )
+      self._objects.pop( self._pack(j,i), None )
+    else:
+      self._objects[ self._pack(i,j) ] = r
+      self._objects[ self._pack(j,i) ] = r
+      r = float('nan')
+
+    for a,b in ((i,j),(j,i)):
+      row = self._pending.setdefault( a, dict() )
+      if b not in row:
+        self._npending += 1
+      row[b] = r
+
+    if self._npending > max( self.buffer_size, len(self._keys)//4 ) or len(self._dead) > max( self.buffer_size, len(self._refs) ):
+      self._merge()
+
+  def correlation( self, x, y, default = 0 ):
+    if x is y:
+      return 1
+
+    i = self._id( x )
+    j = self._id( y )
+    if i is None or j is None:
+      return default
+
+    k = self._pack(i,j)
+    if k in self._objects:
+      return self._objects[k]
+
+    row = self._pending.get( i )
+    if row is not None and j in row:
+      return row[j]
+
+    n = self._keys.searchsorted( k )
+    if n < len(self._keys) and self._keys[n] == k:
+      return float( self._values[n] )
+
+    return default
+
+  def dependencies( self, x, default = [] ):
+    i = self._id( x )
+    if i is None:
+      return default
+
+    a = self._keys.searchsorted( self._pack(i,0) )
+    b = self._keys.searchsorted( self._pack(i+1,0) )
+    ids = set( ( self._keys[a:b] & ((1 << self._SHIFT)-1) ).tolist() )
+    ids.update( self._pending.get( i, () ) )
+
+    deps = []
+    for j in ids:
+      ref = self._refs.get( j )
+      v = ref() if ref is not None else None
+      if v is not None:
+        deps.append( v )
+    return deps
+
+  def prune( self, cutoff ):
+    '''Remove the correlations that are smaller (in absolute value) than cutoff.
+       Returns the number of correlations removed, and the largest one.'''
+    numpy = self._numpy
+    self._merge()
+    small = numpy.abs( self._values ) < cutoff
+    # object correlations are stored as nan, and are never removed.
+    largest = float( numpy.abs( self._values[small] ).max() ) if small.any() else 0.0
+    removed = int( small.sum() )//2
+    self._keys,self._values = self._keys[~small],self._values[~small]
+    return removed,largest
+
+  def matrix( self, *args ):
+    '''Return a correlation matrix for a set of arguments.'''
+    numpy = self._numpy
+    self._merge()
+
+    N = len(args)
+    ids = numpy.array( [ self._id(a) for a in args ], dtype=object )
+    known = ids != None
+    ids = numpy.where( known, ids, 0 ).astype( numpy.int64 )
+    k = ( ids[:,None] << self._SHIFT ) | ids[None,:]
+
+    R = numpy.zeros( (N,N) )
+    if len(self._keys):
+      n = numpy.minimum( self._keys.searchsorted( k ), len(self._keys)-1 )
+      found = ( self._keys[n] == k ) & known[:,None] & known[None,:]
+      R[found] = self._values[n][found]
+
+    # the same object is always fully correlated with itself
+    oids = numpy.array( [ id(a) for a in args ], dtype=numpy.int64 )
+    R[ oids[:,None] == oids[None,:] ] = 1.0
+
+    # correlations that are not plain numbers can't be put in a matrix
+    if self._objects:
+      for a,b in zip( *numpy.nonzero( known[:,None] & known[None,:] ) ):
+        if int(k[a,b]) in self._objects:
+          R[a,b] = numpy.nan
+
+    mat = CorrelationRegistry.Matrix( N )
+    mat._components = array.array( 'd' )
+    mat._components.frombytes( numpy.ascontiguousarray( R, dtype=numpy.float64 ).tobytes() )
+    return mat
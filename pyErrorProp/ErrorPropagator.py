@@ -1,6 +1,7 @@
 import copy
 from .util import *
 from .decorator import decorate
+from .AutoDiff import Dual, Tape, TapeVariable, Kernel, TraceError, BINARY_FUNCTIONS, _ScalarMath
 
 
 #########
@@ -87,6 +88,16 @@ class ErrorPropagator(object):
   def __call__(self, *args, **kargs):
     return self.propagate_errors(self.func, *args, **kargs)
 
+  async def __propagate_errors_async__(self, func, *args, **kargs):
+    '''Propagates error through a coroutine function. Propagators that support coroutine functions override this.'''
+    raise TypeError( "%s does not support coroutine functions." % type(self).__name__ )
+
+  def __propagate_operator__(self, name, a, da, b, db):
+    '''Propagates error through one of the arithmetic operators (add, sub, mul, truediv, pow) using plain numbers.
+       Returns the nominal value and the uncertainty contributions from a and b, or None if
+       the propagator does not have a closed form, in which case __propagate_errors__ is used.'''
+    return None
+
   def propagate_errors(self, func, *args, **kargs):
     '''Propagates error through a function returning the nominal value, total uncertainty (ignoring correlation)
        and (optionally) each uncertainty component. If correlations are needed, call __propagate_errors__
@@ -99,15 +110,69 @@ class ErrorPropagator(object):
     else:
       return ( nominal_value, uncertainty )
 
+def _call_remote( func, args, kargs ):
+  '''Call a function (in a worker process) and return the magnitude and units (as a string) of the result.'''
+  z = func( *args, **kargs )
+  units = unitsof(z)
+  return magof(z), None if units is None else str(units)
+
+def _rebuild( Quantity, magnitude, units ):
+  if units is None:
+    return magnitude
+  if Quantity is None:
+    raise TypeError("A function evaluated in another process returned a quantity, but there is no unit registry to rebuild it with.")
+  return Quantity( magnitude, units )
+
+class _FunctionReference(object):
+  '''A picklable reference to a function that has been replaced by its decorated version
+     (i.e. with @conv.WithError) in its module. The undecorated function is looked up when called.'''
+
+  def __init__(self, func):
+    self.module = func.__module__
+    self.qualname = func.__qualname__
+
+  def __call__(self, *args, **kargs):
+    import importlib
+    f = importlib.import_module( self.module )
+    for name in self.qualname.split('.'):
+      f = getattr( f, name )
+    f = getattr( f, '__wrapped__', f )
+    return f( *args, **kargs )
+
+def _remote_function( func ):
+  '''Return func, or a reference to it if it can not be pickled directly.'''
+  import pickle
+  try:
+    pickle.dumps( func )
+    return func
+  except (pickle.PicklingError, AttributeError, TypeError):
+    if '<locals>' in getattr( func, '__qualname__', '<locals>' ):
+      raise
+    return _FunctionReference( func )
+
 class PositiveIntervalPropagator( ErrorPropagator ):
   '''A simple, yet powerful, error propagation method
      that evaluates the function at the nominal
-     and upper extreme value for each argument.'''
+     and upper extreme value for each argument.
+
+     If batched is True, the nominal point and all of the perturbed points are
+     stacked along an extra leading axis and the function is called once. The
+     function must be vectorized (i.e. written with NumPy) for this to work.
+
+     If an executor (i.e. a concurrent.futures.ThreadPoolExecutor or ProcessPoolExecutor) is given, all of
+     the function evaluations are submitted to it at once and run concurrently.'''
 
   def __init__(self, *args, **kargs):
+    self.batched  = kargs.pop('batched', False)
+    self.executor = kargs.pop('executor', None)
     super( PositiveIntervalPropagator, self ).__init__( *args, **kargs )
 
   def __propagate_errors__(self, func, *args, **kargs):
+    if self.batched:
+      return self.__propagate_errors_batched__( func, *args, **kargs )
+    if self.executor is not None:
+      return self.__propagate_errors_concurrent__( func, *args, **kargs )
+
     # get nominal values for each argument
     nominal_args = []
     for i,a in enumerate(args):
@@ -143,6 +208,637 @@ class PositiveIntervalPropagator( ErrorPropagator ):
 
     return (nominal_value, uncertainties)
 
+  def __propagate_operator__(self, name, a, da, b, db):
+    # subclasses that change how errors are propagated should not get this closed form.
+    if type(self).__propagate_errors__ is not PositiveIntervalPropagator.__propagate_errors__:
+      return None
+
+    f = BINARY_FUNCTIONS[name][0]
+    z = f(_ScalarMath,a,b)
+    dza = f(_ScalarMath,a+da,b) - z
+    dzb = f(_ScalarMath,a,b+db) - z
+    return (z, dza, dzb)
+
+  def _evaluation_points(self, args, kargs):
+    '''Return the nominal args and kargs, and a list of (key,args,kargs) for each
+       perturbed function evaluation.'''
+    nominal_args = [ nominal(a) for a in args ]
+    nominal_kargs = dict( [ (k,nominal(v)) for k,v in kargs.items() ] )
+
+    points = []
+    for i in range(len(args)):
+      evalargs = copy.copy(nominal_args)
+      evalargs[i] = upper( args[i] )
+      points.append( (i,evalargs,nominal_kargs) )
+
+    for k in kargs:
+      evalkargs = copy.copy(nominal_kargs)
+      evalkargs[k] = upper( kargs[k] )
+      points.append( (k,nominal_args,evalkargs) )
+
+    return nominal_args, nominal_kargs, points
+
+  def __propagate_errors_concurrent__(self, func, *args, **kargs):
+    '''Propagates error by submitting all function evaluations to the executor and gathering the results.
+
+       Executors other than thread pools (i.e. a ProcessPoolExecutor) run the function in another process,
+       where quantities belong to a different unit registry. The function is then called through _call_remote,
+       which returns magnitudes and unit strings, and the quantities are rebuilt with this propagator's Quantity
+       class (or the class of the quantity arguments).'''
+    import concurrent.futures
+    nominal_args, nominal_kargs, points = self._evaluation_points( args, kargs )
+
+    submit = self.executor.submit
+    result = lambda future: future.result()
+    if not isinstance( self.executor, concurrent.futures.ThreadPoolExecutor ):
+      Quantity = self._quantity_class( nominal_args + list(nominal_kargs.values()) )
+      func = _remote_function( func )
+      submit = lambda f,*a,**k: self.executor.submit( _call_remote, f, a, k )
+      result = lambda future: _rebuild( Quantity, *future.result() )
+
+    nominal_future = submit( func, *nominal_args, **nominal_kargs )
+    futures = [ (k,submit( func, *evalargs, **evalkargs )) for k,evalargs,evalkargs in points ]
+
+    nominal_value = result( nominal_future )
+    uncertainties = dict()
+    for k,future in futures:
+      uncertainties[k] = result( future ) - nominal_value
+
+    return (nominal_value, uncertainties)
+
+  def _quantity_class(self, values):
+    '''Return the Quantity class that results of remote function evaluations should be rebuilt with.'''
+    Quantity = getattr( self, 'Quantity', None )
+    if Quantity is not None:
+      return Quantity
+    for v in values:
+      if hasattr( v, 'units' ):
+        return type(v)
+    return None
+
+  async def __propagate_errors_async__(self, func, *args, **kargs):
+    '''Propagates error through a coroutine function, awaiting all function evaluations concurrently.'''
+    import asyncio
+    nominal_args, nominal_kargs, points = self._evaluation_points( args, kargs )
+
+    values = await asyncio.gather( func(*nominal_args,**nominal_kargs), *[ func(*evalargs,**evalkargs) for k,evalargs,evalkargs in points ] )
+
+    nominal_value = values[0]
+    uncertainties = dict()
+    for (k,evalargs,evalkargs),value in zip(points,values[1:]):
+      uncertainties[k] = value - nominal_value
+
+    return (nominal_value, uncertainties)
+
+  def __propagate_errors_batched__(self, func, *args, **kargs):
+    '''Propagates error through a vectorized function with a single function call.'''
+    import numpy
+
+    keys   = list(range(len(args))) + list(kargs.keys())
+    values = list(args) + [ kargs[k] for k in kargs ]
+    N = len(values)
+    if N == 0:
+      return (func(), dict())
+
+    # only uncertain arguments are stacked, the others (exact values, flags, ...) are passed unchanged.
+    # row 0 of each stacked argument is the nominal value, row i+1 is the nominal
+    # value, except for the i'th uncertain argument, which is its upper value.
+    uncertain = [ i for i,v in enumerate(values) if isuncertain(v) ]
+    M = len(uncertain)
+    if M == 0:
+      nominal_value = func(*args,**kargs)
+      return (nominal_value, dict( (k,nominal_value - nominal_value) for k in keys ))
+    columns = dict()
+    for n,i in enumerate(uncertain):
+      v = values[i]
+      nom = nominal(v)
+      units = unitsof(nom)
+      up = upper(v)
+      if units is not None:
+        up = up.to(units)
+      rows = [ magof(nom) ]*(M+1)
+      rows[n+1] = magof(up)
+      columns[i] = (numpy.array(rows), nom, units)
+
+    # pad argument shapes so that they broadcast against each other (and the exact
+    # arrays) after the leading axis has been added.
+    exact = [ numpy.ndim( magof(v) ) + 1 for i,v in enumerate(values) if i not in columns and hasattr( magof(v), 'ndim' ) ]
+    ndim = max( [ c.ndim for c,nom,units in columns.values() ] + exact + [1] )
+    stacked = list(values)
+    for i,(c,nom,units) in columns.items():
+      c = c.reshape( c.shape[:1] + (1,)*(ndim-c.ndim) + c.shape[1:] )
+      if units is not None:
+        c = type(nom)(c,units)
+      stacked[i] = c
+
+    evalargs  = stacked[:len(args)]
+    evalkargs = dict( zip( keys[len(args):], stacked[len(args):] ) )
+
+    values = func(*evalargs,**evalkargs)
+
+    nominal_value = values[0]
+    uncertainties = dict()
+    for i,k in enumerate(keys):
+      # exact arguments don't contribute (like nominal_value - nominal_value for the other modes)
+      uncertainties[k] = nominal_value - nominal_value
+    for n,i in enumerate(uncertain):
+      uncertainties[keys[i]] = values[n+1] - nominal_value
+
+    return (nominal_value, uncertainties)
+
+
+class ForwardModePropagator( ErrorPropagator ):
+  '''An error propagator that uses forward mode automatic differentiation.
+
+     The function is evaluated once, with dual numbers that carry the derivative of each
+     argument with respect to itself, scaled by the argument's uncertainty. The uncertainty
+     contributions are then exact first order (linear) estimates, and the cost of propagating
+     error is roughly one function evaluation regardless of the number of arguments.
+
+     The function must be written with operators and NumPy functions (i.e. numpy.sin, not math.sin).
+     Values are converted to float for the evaluation.'''
+
+  def __init__(self, *args, **kargs):
+    super( ForwardModePropagator, self ).__init__( *args, **kargs )
+
+  def __propagate_operator__(self, name, a, da, b, db):
+    return _linear_operator(name, a, da, b, db)
+
+  def _seed(self, key, x):
+    '''Return a dual number version of an argument that can be passed to the function.'''
+    if not isuncertain(x):
+      return nominal(x)
+
+    nom,units,value,unc = _linearization_point(x)
+    return _with_units( Dual( value, { key : unc } ), nom, units )
+
+  def __propagate_errors__(self, func, *args, **kargs):
+    evalargs  = [ self._seed(i,a) for i,a in enumerate(args) ]
+    evalkargs = dict( [ (k,self._seed(k,v)) for k,v in kargs.items() ] )
+
+    return self._result( func(*evalargs,**evalkargs), args, kargs )
+
+  async def __propagate_errors_async__(self, func, *args, **kargs):
+    evalargs  = [ self._seed(i,a) for i,a in enumerate(args) ]
+    evalkargs = dict( [ (k,self._seed(k,v)) for k,v in kargs.items() ] )
+
+    return self._result( await func(*evalargs,**evalkargs), args, kargs )
+
+  def _result(self, result, args, kargs):
+    nominal_value, derivatives = _split_dual(result)
+
+    uncertainties = dict()
+    for k in list(range(len(args))) + list(kargs.keys()):
+      uncertainties[k] = derivatives.get(k, 0*nominal_value)
+
+    return (nominal_value, uncertainties)
+
+
+class ReverseModePropagator( ErrorPropagator ):
+  '''An error propagator that uses reverse mode (adjoint) automatic differentiation.
+
+     The function is evaluated once with arguments that record each operation to a tape,
+     and the derivatives with respect to all arguments are computed with one backward sweep
+     over the tape. The cost does not depend on the number of arguments, which makes this the
+     best choice for functions that reduce many uncertain inputs to a single result.
+
+     The same restrictions as the ForwardModePropagator apply.'''
+
+  def __init__(self, *args, **kargs):
+    super( ReverseModePropagator, self ).__init__( *args, **kargs )
+
+  def __propagate_operator__(self, name, a, da, b, db):
+    return _linear_operator(name, a, da, b, db)
+
+  def _seed(self, args, kargs):
+    '''Return a tape, and tape variable versions of the arguments that can be passed to the function.'''
+    tape = Tape()
+    tape.scales = dict()
+
+    def seed(key, x):
+      if not isuncertain(x):
+        return nominal(x)
+      nom,units,value,unc = _linearization_point(x)
+      tape.scales[key] = unc
+      return _with_units( tape.variable( key, value ), nom, units )
+
+    evalargs  = [ seed(i,a) for i,a in enumerate(args) ]
+    evalkargs = dict( [ (k,seed(k,v)) for k,v in kargs.items() ] )
+
+    return tape, evalargs, evalkargs
+
+  def __propagate_errors__(self, func, *args, **kargs):
+    tape, evalargs, evalkargs = self._seed( args, kargs )
+    return self._result( tape, func(*evalargs,**evalkargs), args, kargs )
+
+  async def __propagate_errors_async__(self, func, *args, **kargs):
+    tape, evalargs, evalkargs = self._seed( args, kargs )
+    return self._result( tape, await func(*evalargs,**evalkargs), args, kargs )
+
+  def _result(self, tape, result, args, kargs):
+    units = unitsof(result)
+    value = _unwrap_object_scalar( magof(result) )
+    gradient = tape.gradient(value)
+    if isinstance(value,TapeVariable):
+      value = value.value
+    nominal_value = value if units is None else type(result)(value,units)
+
+    uncertainties = dict()
+    for k in list(range(len(args))) + list(kargs.keys()):
+      uncertainties[k] = gradient.get(k,0.0)*tape.scales.get(k,0.0)
+      if units is not None:
+        uncertainties[k] = type(result)(uncertainties[k],units)
+
+    return (nominal_value, uncertainties)
+
+
+class CompiledPropagator( ErrorPropagator ):
+  '''An error propagator that traces a function once, and evaluates a NumPy kernel after that.
+
+     The first time the function is called with a given argument signature, it is evaluated with
+     tape variable arguments (like the ReverseModePropagator) and the recorded operations are kept
+     as a Kernel. Later calls with the same signature replay the kernel on the magnitudes of the arguments
+     instead of calling the function, so there is no Python dispatch or unit checking per operation. The
+     kernel works on whole arrays, so this is the fastest way to evaluate a formula for uncertain quantity arrays.
+
+     Uncertain arguments (and exact arrays) are kernel inputs, traced with their real shape. Every other argument
+     (exact numbers and quantities, ints, strings, flags, ...) is a constant of the kernel. The signature is the units
+     (and whether they are arrays) of each input, and the value (and units) of each constant.
+
+     The same restrictions as the ReverseModePropagator apply. In addition, the kernel only replays element-wise
+     operations, so the function must not compare its inputs (if statements, min/max, ...) or reduce array inputs
+     (sum, mean, ...). Element-wise functions with branches, like abs, are recorded and replayed correctly.
+     A TraceError is raised for functions that can not be replayed, or that have unhashable constants.
+     The last max_kernels kernels are kept.'''
+
+  def __init__(self, *args, **kargs):
+    max_kernels = kargs.pop('max_kernels', 256)
+    super( CompiledPropagator, self ).__init__( *args, **kargs )
+    self.kernels = LRUCache( max_kernels )
+
+  def _signature(self, keys, values):
+    signature = []
+    for k,x in zip(keys,values):
+      if _is_kernel_input(x):
+        signature.append( (k,unitsof(nominal(x)),getattr(magof(nominal(x)),'ndim',0) > 0) )
+      else:
+        signature.append( (k,None,magof(x),unitsof(x)) )
+    return tuple(signature)
+
+  def _trace(self, func, keys, values, nargs):
+    '''Evaluate the function with tape variable arguments and return the kernel, and the units of the result.'''
+    tape = Tape( traced = True )
+    evalvalues = []
+    for k,x in zip(keys,values):
+      if _is_kernel_input(x):
+        nom = nominal(x)
+        x = _with_units( tape.variable( k, _as_float(magof(nom)) ), nom, unitsof(nom) )
+      evalvalues.append(x)
+
+    result = func( *evalvalues[:nargs], **dict( zip( keys[nargs:], evalvalues[nargs:] ) ) )
+    units = unitsof(result)
+    kernel = Kernel( tape, _unwrap_object_scalar( magof(result) ) )
+    return kernel, units, type(result)
+
+  def kernel(self, func, args, kargs):
+    '''Return the kernel for a set of arguments, the units of its result and the quantity type to use for them.
+       The function is traced if it has not been called with the same signature before.'''
+    keys   = list(range(len(args))) + list(kargs.keys())
+    values = list(args) + [ kargs[k] for k in kargs ]
+
+    signature = self._signature( keys, values )
+    try:
+      entry = self.kernels.get(signature)
+    except TypeError:
+      raise TraceError("The constant arguments of a compiled function must be hashable.")
+    if entry is None:
+      try:
+        entry = self._trace( func, keys, values, len(args) )
+      except TraceError as e:
+        # remember that this signature can not be traced, so the function is not called again.
+        entry = e
+      self.kernels.put( signature, entry )
+    if isinstance( entry, TraceError ):
+      raise TraceError( *entry.args )
+    return entry
+
+  def evaluate(self, kernel, magnitudes, scales):
+    '''Evaluate a kernel for a dict of input magnitudes, and return the magnitude of the result
+       and a dict with the uncertainty contributions for the inputs that have a scale (uncertainty).'''
+    value,derivatives = kernel( magnitudes )
+
+    def scalar(v):
+      return float(v) if getattr(v,'ndim',None) == 0 else v
+
+    contributions = dict()
+    for k,unc in scales.items():
+      contributions[k] = scalar( derivatives.get(k,0.0)*unc )
+    return scalar(value), contributions
+
+  def __propagate_errors__(self, func, *args, **kargs):
+    kernel,units,Quantity = self.kernel( func, args, kargs )
+
+    magnitudes = dict()
+    scales = dict()
+    keys = list(range(len(args))) + list(kargs.keys())
+    for k in keys:
+      x = kargs[k] if k in kargs else args[k]
+      if isuncertain(x):
+        nom,u,magnitudes[k],scales[k] = _linearization_point(x)
+      elif _is_kernel_input(x):
+        magnitudes[k] = _as_float( magof(x) )
+
+    value,contributions = self.evaluate( kernel, magnitudes, scales )
+
+    def q(v):
+      return v if units is None else Quantity(v,units)
+
+    uncertainties = dict( (k,q(contributions.get(k,0.0))) for k in keys )
+    return (q(value), uncertainties)
+
+class MonteCarloPropagator( ErrorPropagator ):
+  '''An error propagator that uses Monte Carlo sampling.
+
+     Samples for all uncertain arguments are drawn as NumPy arrays from a (jointly correlated)
+     normal distribution and the function is evaluated once per batch of samples, so it must be
+     vectorized. Batches are added until the standard deviation is known to within a relative
+     tolerance, or max_samples have been drawn.
+
+     Correlations between arguments are taken from a CorrelationRegistry. An UncertaintyConvention
+     gives the propagator its registry automatically.
+
+     The nominal value returned is the sample mean. The uncertainty contributions of each argument
+     are the linear sensitivities estimated from the samples by least squares, scaled so that their
+     correlation weighted sum gives the standard deviation of the samples. Arguments must be scalars.
+
+     If workers is set, batches are evaluated in that many processes. Each batch draws from its
+     own random stream, spawned from the seed, and batches are always merged in the same order,
+     so the result for a given seed does not depend on the number of workers.'''
+
+  def __init__(self, *args, **kargs):
+    self.batch_size   = kargs.pop('batch_size', 10000)
+    self.tolerance    = kargs.pop('tolerance', 1e-2)
+    self.max_samples  = kargs.pop('max_samples', 10**7)
+    self.seed         = kargs.pop('seed', None)
+    self.correlations = kargs.pop('correlations', None)
+    self.workers      = kargs.pop('workers', None)
+    super( MonteCarloPropagator, self ).__init__( *args, **kargs )
+
+  def _correlation_factor(self, xs):
+    '''Return a matrix L such that L L^T is the correlation matrix for xs.'''
+    import numpy
+    N = len(xs)
+    R = numpy.identity(N)
+    if self.correlations is not None:
+      for i in range(N):
+        for j in range(i+1,N):
+          R[i,j] = R[j,i] = float( self.correlations.correlation(xs[i],xs[j]) )
+    try:
+      return numpy.linalg.cholesky(R)
+    except numpy.linalg.LinAlgError:
+      # the correlation matrix is only semi-definite (i.e. fully correlated arguments)
+      w,V = numpy.linalg.eigh(R)
+      return V*numpy.sqrt(numpy.clip(w,0,None))
+
+  def __propagate_errors__(self, func, *args, **kargs):
+    import numpy
+
+    keys   = list(range(len(args))) + list(kargs.keys())
+    values = list(args) + [ kargs[k] for k in kargs ]
+
+    uncertain = [ i for i,v in enumerate(values) if isuncertain(v) ]
+    points = [ _linearization_point(values[i]) for i in uncertain ]
+    for nom,units,value,unc in points:
+      if numpy.ndim(value) != 0:
+        raise TypeError("MonteCarloPropagator only supports scalar arguments.")
+
+    L = self._correlation_factor( [ values[i] for i in uncertain ] )
+    sampler = _MonteCarloSampler( func, len(args), keys, [ nominal(v) for v in values ], uncertain, points, L )
+
+    if len(uncertain) == 0:
+      nominal_value = sampler.evaluate( numpy.zeros( (1,0) ) )
+      return (nominal_value, dict( (k,0*nominal_value) for k in keys ))
+
+    # adaptive procedure (GUM Supplement 1, section 7.9): keep adding batches
+    # until the standard deviation is known to within the requested (relative) tolerance,
+    # using the spread of the per-batch estimates to judge.
+    # note: _batches always generates the same batches, in the same order, so that results are reproducible.
+    moments = None
+    stds = []
+    batches = self._batches( sampler )
+    for batch in batches:
+      moments = batch if moments is None else moments.merge(batch)
+      stds.append( batch.std() )
+
+      if len(stds) > 1 and 2*numpy.std(stds,ddof=1)/len(stds)**0.5 <= self.tolerance*moments.std():
+        break
+    batches.close()
+
+    if not sampler.evaluated:
+      # batches were evaluated in other processes, so we still need the units of the result.
+      sampler.evaluate( numpy.zeros( (1,len(uncertain)) ) )
+
+    return sampler.result( moments )
+
+
+  def _jobs(self):
+    '''Generate the (seed,size) of each batch.'''
+    import numpy
+    seeds = numpy.random.SeedSequence(self.seed)
+    n = 0
+    while n < self.max_samples:
+      size = min( self.batch_size, self.max_samples - n )
+      n += size
+      yield seeds.spawn(1)[0], size
+
+  def _batches(self, sampler):
+    '''Generate the moments of each batch, in order.'''
+    if self.workers is None:
+      for seed,size in self._jobs():
+        yield sampler( seed, size )
+      return
+
+    import collections, concurrent.futures, multiprocessing
+    # forked workers inherit the sampler (and the unit registry it uses) instead of pickling it.
+    try:
+      context = multiprocessing.get_context('fork')
+    except ValueError:
+      context = None
+    pool = concurrent.futures.ProcessPoolExecutor( self.workers, mp_context=context, initializer=_monte_carlo_worker_init, initargs=(sampler,) )
+    try:
+      pending = collections.deque()
+      for seed,size in self._jobs():
+        pending.append( pool.submit( _monte_carlo_worker_batch, seed, size ) )
+        if len(pending) >= self.workers:
+          yield pending.popleft().result()
+      while len(pending) > 0:
+        yield pending.popleft().result()
+    finally:
+      # batches that were started ahead of time are not needed if we are done.
+      pool.shutdown( wait=True, cancel_futures=True )
+
+
+_MONTE_CARLO_SAMPLER = None
+def _monte_carlo_worker_init(sampler):
+  global _MONTE_CARLO_SAMPLER
+  _MONTE_CARLO_SAMPLER = sampler
+
+def _monte_carlo_worker_batch(seed, size):
+  return _MONTE_CARLO_SAMPLER( seed, size )
+
+
+class _MonteCarloSampler(object):
+  '''Draws a batch of samples and evaluates the function for the MonteCarloPropagator.'''
+
+  def __init__(self, func, nargs, keys, nominals, uncertain, points, L):
+    import numpy
+    self.func = func
+    self.nargs = nargs
+    self.keys = keys
+    self.nominals = nominals
+    self.uncertain = uncertain
+    self.points = points
+    self.L = L
+    self.values = numpy.array( [ value for nom,units,value,unc in points ] )
+    self.uncs   = numpy.array( [ unc for nom,units,value,unc in points ] )
+    self.units  = None
+    self.evaluated = False
+
+  def evaluate(self, zeta):
+    '''Evaluate the function at the points given by correlated standard normal samples zeta.'''
+    evalargs = list(self.nominals)
+    for j,i in enumerate(self.uncertain):
+      nom,units,value,unc = self.points[j]
+      evalargs[i] = _with_units( value + unc*zeta[:,j], nom, units )
+
+    result = self.func( *evalargs[:self.nargs], **dict( zip( self.keys[self.nargs:], evalargs[self.nargs:] ) ) )
+    self.units = unitsof(result)
+    self.Quantity = type(result)
+    self.evaluated = True
+    return result
+
+  def __call__(self, seed, n):
+    import numpy
+    rng = numpy.random.default_rng(seed)
+    zeta = rng.standard_normal( (n,len(self.uncertain)) ).dot( self.L.T )
+    result = self.evaluate( zeta )
+    f = numpy.broadcast_to( numpy.asarray( magof(result), dtype=float ), (n,) )
+    return _Moments.from_samples( numpy.column_stack( (f,zeta) ) )
+
+  def result(self, moments):
+    '''Compute the nominal value and uncertainty contributions from the accumulated moments.'''
+    import numpy
+    cov = moments.covariance()
+    # least squares estimate of the (scaled) linear sensitivities
+    c = numpy.linalg.lstsq( cov[1:,1:], cov[1:,0], rcond=None )[0]
+    R = self.L.dot(self.L.T)
+    linear = c.dot(R).dot(c)
+    if linear > 0:
+      c = c*( cov[0,0]/linear )**0.5
+
+    def q(v):
+      return v if self.units is None else self.Quantity(v,self.units)
+
+    uncertainties = dict( (k,q(0.0)) for k in self.keys )
+    for j,i in enumerate(self.uncertain):
+      uncertainties[self.keys[i]] = q(c[j])
+
+    return (q(moments.mean[0]), uncertainties)
+
+
+class _Moments(object):
+  '''Running means and co-moments of a set of variables that can be merged in parallel (Chan et al.).'''
+
+  def __init__(self, n, mean, M):
+    self.n = n
+    self.mean = mean
+    self.M = M
+
+  @classmethod
+  def from_samples(cls, X):
+    '''Compute the moments of samples X, with one row per sample and one column per variable.'''
+    mean = X.mean(axis=0)
+    D = X - mean
+    return cls( X.shape[0], mean, D.T.dot(D) )
+
+  def merge(self, other):
+    n = self.n + other.n
+    delta = other.mean - self.mean
+    mean = self.mean + delta*(other.n/n)
+    M = self.M + other.M + (self.n*other.n/n)*delta[:,None]*delta[None,:]
+    return _Moments( n, mean, M )
+
+  def covariance(self):
+    return self.M/(self.n-1)
+
+  def std(self):
+    return (self.M[0,0]/(self.n-1))**0.5
+
+
+def _linearization_point(x):
+  '''Return the nominal value, its units, and the float magnitudes of the nominal value
+     and uncertainty (in units compatible with the nominal value) of an uncertain argument.'''
+  nom = nominal(x)
+  units = unitsof(nom)
+  unc = upper(x) - nom
+  if units is not None:
+    try:
+      unc = unc.to(units)
+    except:
+      pass
+
+  return nom, units, _as_float(magof(nom)), _as_float(magof(unc))
+
+def _is_kernel_input(x):
+  '''Check if an argument should be an input of a compiled kernel. Exact scalars are constants, only uncertain
+     values and exact float arrays (which can not be part of a signature) are inputs.'''
+  if isuncertain(x):
+    return True
+  m = magof(x)
+  return getattr(m,'ndim',0) > 0 and getattr(m.dtype,'kind',None) == 'f'
+
+def _with_units(value, nom, units):
+  if units is None:
+    return value
+  return type(nom)( value, units )
+
+def _unwrap_object_scalar(value):
+  '''NumPy functions may wrap automatic differentiation numbers in a 0-d object array.'''
+  if getattr(value,'shape',None) == () and getattr(value,'dtype',None) == object:
+    return value.item()
+  return value
+
+def _as_float(x):
+  if hasattr(x,'astype'):
+    return x.astype(float)
+  return float(x)
+
+def _linear_operator(name, a, da, b, db):
+  '''First order uncertainty contributions for an arithmetic operator, from its analytic partial derivatives.'''
+  a,da,b,db = float(a),float(da),float(b),float(db)
+  f,df = BINARY_FUNCTIONS[name]
+  z = f(_ScalarMath,a,b)
+  dfa,dfb = df(_ScalarMath,a,b,z)
+  return (z, dfa*da, dfb*db)
+
+def _split_dual(result):
+  '''Split a function result evaluated with dual numbers into its value and a dict of derivatives,
+     reattaching units if the result is a quantity.'''
+  units = unitsof(result)
+  value = _unwrap_object_scalar( magof(result) )
+
+  if isinstance(value, Dual):
+    derivatives = value.derivatives
+    value = value.value
+  else:
+    derivatives = dict()
+
+  if units is None:
+    return value, derivatives
+
+  Q = type(result)
+  return Q(value,units), dict( [ (k,Q(v,units)) for k,v in derivatives.items() ] )
+
 
 def WithError(func):
   propagator = PositiveIntervalPropagator()
@@ -0,0 +1,257 @@
+from __future__ import division
+
+import numpy
+import pandas
+from pandas.api.extensions import ExtensionDtype, ExtensionArray, ExtensionScalarOpsMixin, take
+
+from .util import *
+
+
+class _UncertainQuantityDtype(ExtensionDtype):
+  '''A pandas dtype for columns of uncertain quantities that share a unit.'''
+
+  _metadata = ('units',)
+  kind = 'O'
+  na_value = numpy.nan
+
+  def __init__(self, units = None):
+    # units are stored as a string so that the dtype is hashable and can be compared
+    self.units = '' if units is None else str( self.Quantity(1,units).units )
+
+  @property
+  def name(self):
+    return "uncertain[{0}]".format(self.units)
+
+  @property
+  def type(self):
+    return self._CONVENTION.UncertainQuantity
+
+  @property
+  def _is_numeric(self):
+    return True
+
+  @classmethod
+  def construct_array_type(cls):
+    return cls._ARRAY
+
+  @classmethod
+  def construct_from_string(cls, string):
+    if not isinstance(string,str):
+      raise TypeError("'construct_from_string' expects a string, got {0}".format(type(string)))
+    if string.startswith('uncertain[') and string.endswith(']'):
+      return cls( string[len('uncertain['):-1] or None )
+    raise TypeError("Cannot construct a '{0}' from '{1}'".format(cls.__name__, string))
+
+
+class _UncertainQuantityPandasArray(ExtensionArray, ExtensionScalarOpsMixin):
+  '''A pandas extension array of uncertain quantities, for DataFrame columns.
+
+     Like an UncertainQuantityArray, the nominal values and uncertainties are stored in two
+     float64 arrays that share a unit, instead of one Python object per element. Arithmetic is done
+     by the convention's UncertainQuantityArray (so correlations are handled the same way), and the sum
+     and mean reductions (including groupby) are computed with NumPy, treating elements as independent.
+     Missing values have a nan nominal value.
+
+     The nominal and uncertainty properties are quantities that wrap the stored arrays, without copying.'''
+
+  def __init__(self, values, copy = False):
+    UQA_ = self._CONVENTION.UncertainQuantityArray
+    if not isinstance( values, UQA_ ):
+      # a (nominal, uncertainty) tuple, or a sequence of (uncertain) quantities
+      values = self._CONVENTION._column( values if isinstance(values,tuple) else list(values) )
+      if not isinstance( values, UQA_ ):
+        values = UQA_( values )
+    nom = numpy.array( values._nom, dtype=float, copy=copy or None )
+    unc = numpy.array( values._unc, dtype=float, copy=copy or None )
+    if nom.ndim != 1:
+      raise ValueError("Uncertain quantity columns must be 1 dimensional.")
+    self._uqa = values._from_magnitudes( nom, unc, values._unit, values._unc_unit )
+    self._dtype = self._DTYPE( values._unit )
+
+  @classmethod
+  def _from_uqa(cls, uqa):
+    self = cls.__new__(cls)
+    self._uqa = uqa
+    self._dtype = cls._DTYPE( uqa._unit )
+    return self
+
+  @classmethod
+  def _from_sequence(cls, scalars, dtype = None, copy = False):
+    if isinstance( scalars, cls ):
+      return scalars.copy() if copy else scalars
+    if isinstance( dtype, str ):
+      dtype = cls._DTYPE.construct_from_string( dtype )
+    units = getattr( dtype, 'units', None ) or None
+
+    values = [ numpy.nan if x is None or x is pandas.NA else x for x in scalars ]
+    if len(values) == 0:
+      return cls( cls._CONVENTION.UncertainQuantityArray( numpy.zeros(0), unit=units ) )
+    array = cls( values )
+    if units is not None and str(array.units) != units:
+      array = cls._from_uqa( array._uqa.to(units) )
+    return array
+
+  @classmethod
+  def _from_factorized(cls, values, original):
+    return cls._from_uqa( original._uqa._from_magnitudes( values.real.copy(), values.imag.copy(), original._uqa._unit, original._uqa._unc_unit ) )
+
+  def _values_for_factorize(self):
+    # the nominal value and uncertainty are packed into a complex number, which pandas can hash
+    return self._uqa._nom + 1j*self._uqa._unc, numpy.nan
+
+  def _values_for_argsort(self):
+    # sort by nominal value (comparisons of uncertain quantities are statistical tests)
+    return self._uqa._nom
+
+  @property
+  def dtype(self):
+    return self._dtype
+
+  @property
+  def units(self):
+    return self._uqa._unit
+
+  @property
+  def nominal(self):
+    return self._uqa.nominal
+
+  @property
+  def uncertainty(self):
+    return self._uqa.uncertainty
+
+  def to_uncertainquantityarray(self):
+    return self._uqa
+
+  @property
+  def nbytes(self):
+    return self._uqa._nom.nbytes + self._uqa._unc.nbytes
+
+  def __len__(self):
+    return len(self._uqa._nom)
+
+  def __getitem__(self, key):
+    if isinstance(key,tuple) and len(key) == 1:
+      key = key[0]
+    key = pandas.api.indexers.check_array_indexer(self, key) if not isinstance(key,(int,numpy.integer,slice)) else key
+    if isinstance(key,(int,numpy.integer)):
+      if numpy.isnan( self._uqa._nom[key] ):
+        return self.dtype.na_value
+      return self._uqa[key]
+    uqa = self._uqa
+    return self._from_uqa( uqa._from_magnitudes( uqa._nom[key], uqa._unc[key], uqa._unit, uqa._unc_unit ) )
+
+  def __setitem__(self, key, value):
+    key = pandas.api.indexers.check_array_indexer(self, key) if not isinstance(key,(int,numpy.integer,slice)) else key
+    if value is None or value is pandas.NA or (isinstance(value,float) and numpy.isnan(value)):
+      self._uqa._nom[key] = numpy.nan
+      self._uqa._unc[key] = numpy.nan
+      return
+    scalar = numpy.ndim(value) == 0
+    if isinstance( value, type(self) ):
+      value = value._uqa
+    elif not isinstance( value, self._CONVENTION.UncertainQuantityArray ):
+      value = type(self)( [value] if scalar else value )._uqa
+    value = value.to( self._uqa._unit )
+    self._uqa._nom[key] = value._nom[0] if scalar else value._nom
+    self._uqa._unc[key] = value._unc[0] if scalar else value._unc
+
+  def isna(self):
+    return numpy.isnan( self._uqa._nom )
+
+  def copy(self):
+    uqa = self._uqa
+    return self._from_uqa( uqa._from_magnitudes( uqa._nom.copy(), uqa._unc.copy(), uqa._unit, uqa._unc_unit ) )
+
+  def take(self, indices, allow_fill = False, fill_value = None):
+    if fill_value is not None and not ( isinstance(fill_value,float) and numpy.isnan(fill_value) ):
+      raise ValueError("Only missing values (nan) can be used to fill uncertain quantity columns.")
+    uqa = self._uqa
+    nom = take( uqa._nom, indices, allow_fill=allow_fill, fill_value=numpy.nan )
+    unc = take( uqa._unc, indices, allow_fill=allow_fill, fill_value=numpy.nan )
+    return self._from_uqa( uqa._from_magnitudes( nom, unc, uqa._unit, uqa._unc_unit ) )
+
+  @classmethod
+  def _concat_same_type(cls, to_concat):
+    to_concat = list(to_concat)
+    first = to_concat[0]._uqa
+    uqas = [ a._uqa.to(first._unit) if a._uqa._unit != first._unit else a._uqa for a in to_concat ]
+    nom = numpy.concatenate( [ a._nom for a in uqas ] )
+    unc = numpy.concatenate( [ a._unc for a in uqas ] )
+    return cls._from_uqa( first._from_magnitudes( nom, unc, first._unit, first._unc_unit ) )
+
+  def __eq__(self, other):
+    if isinstance( other, (pandas.Series,pandas.Index,pandas.DataFrame) ):
+      return NotImplemented
+    if isinstance( other, type(self) ):
+      other = other._uqa
+    if isinstance( other, (self._CONVENTION.UncertainQuantity,self._CONVENTION.UncertainQuantityArray) ):
+      # scalars are broadcast, like comparisons with the other numeric dtypes.
+      uqa = self._uqa
+      try:
+        nom = other.nominal.to( uqa._unit ).magnitude
+        unc = other.uncertainty.to( uqa._unc_unit ).magnitude
+      except (TypeError,ValueError):
+        # incompatible units (pint's DimensionalityError is a TypeError)
+        return numpy.zeros( len(self), dtype=bool )
+      return numpy.broadcast_to( (uqa._nom == nom) & (uqa._unc == unc), (len(self),) ).copy()
+    return numpy.zeros( len(self), dtype=bool )
+
+  def __repr__(self):
+    return "<UncertainQuantityPandasArray({0}, {1}, {2})>".format(self._uqa._nom, self._uqa._unc, self._uqa._unit)
+
+  def _formatter(self, boxed = False):
+    return lambda x: 'NaN' if not isuncertain(x) else '{0} +/- {1}'.format( magof(x.nominal), magof(x.uncertainty) )
+
+  # arithmetic is done by the convention's uncertain quantity arrays
+  @classmethod
+  def _create_arithmetic_method(cls, op):
+    def method(self, other):
+      if isinstance( other, (pandas.Series,pandas.Index,pandas.DataFrame) ):
+        return NotImplemented
+      if isinstance( other, cls ):
+        other = other._uqa
+      result = op( self._uqa, other )
+      if isinstance( result, self._CONVENTION.UncertainQuantityArray ):
+        return cls._from_uqa( result )
+      return result
+    method.__name__ = '__{0}__'.format(op.__name__.strip('_'))
+    return method
+
+  def _reduce(self, name, skipna = True, keepdims = False, **kwargs):
+    nom,unc = self._uqa._nom,self._uqa._unc
+    if skipna:
+      mask = ~numpy.isnan(nom)
+      nom,unc = nom[mask],unc[mask]
+
+    if name == 'sum':
+      result = self._scalar( nom.sum(), numpy.sqrt( (unc**2).sum() ) )
+    elif name == 'mean':
+      result = self._scalar( nom.mean(), numpy.sqrt( (unc**2).sum() )/len(nom) )
+    else:
+      raise TypeError("'{0}' is not supported for uncertain quantity columns.".format(name))
+
+    if keepdims:
+      return type(self)._from_sequence( [result] )
+    return result
+
+  def _scalar(self, nom, unc):
+    Q_ = self._CONVENTION.UncertainQuantity.Quantity
+    return self._CONVENTION.UncertainQuantity( Q_( float(nom), self._uqa._unit ), Q_( float(unc), self._uqa._unc_unit ) )
+
+  def _groupby_op(self, *, how, has_dropped_na, min_count, ngroups, ids, **kwargs):
+    if how not in ('sum','mean'):
+      # pandas expects a TypeError for aggregations that a dtype does not support.
+      raise TypeError("'{0}' is not supported for uncertain quantity columns.".format(how))
+
+    nom,unc = self._uqa._nom,self._uqa._unc
+    mask = (ids >= 0) & ~numpy.isnan(nom)
+    ids,nom,unc = ids[mask],nom[mask],unc[mask]
+    counts = numpy.bincount( ids, minlength=ngroups )
+    nom = numpy.bincount( ids, weights=nom, minlength=ngroups )
+    unc = numpy.sqrt( numpy.bincount( ids, weights=unc**2, minlength=ngroups ) )
+    if how == 'mean':
+      with numpy.errstate(divide='ignore',invalid='ignore'):
+        nom = nom/counts
+        unc = unc/counts
+    uqa = self._uqa
+    return self._from_uqa( uqa._from_magnitudes( nom, unc, uqa._unit, uqa._unc_unit ) )
@@ -0,0 +1,141 @@
+from __future__ import division
+
+from .util import *
+
+
+class _RunningStatistics(object):
+  '''The running mean and variance of a data set, for data sets that don't fit in memory.
+
+     Values can be added one at a time, as arrays, or as iterators (i.e. a generator reading
+     chunks of a file). Single values are added with Welford's algorithm, and arrays (and other
+     accumulators) are merged with the parallel algorithm of Chan et al. Only the count, mean and
+     sum of squared deviations are stored, so memory use does not depend on the size of the data set.
+
+     Accumulators filled by different workers can be combined with merge(). Accumulators are not
+     picklable (their class belongs to a convention), but the state property is a plain tuple that
+     can be sent between processes and merged.
+
+     calc_UncertainQuantity() gives the same uncertain quantity (the mean, with the standard error
+     as uncertainty) as UncertaintyConvention.calc_UncertainQuantity would for the whole data set.'''
+
+  def __init__(self, data = None):
+    self.count = 0
+    self.mean  = 0
+    self.M2    = 0
+    self.units = None
+    if data is not None:
+      self.update(data)
+
+  def _magnitude(self, x):
+    '''Return the magnitude of x in the units of the accumulator.'''
+    units = unitsof(x)
+    if self.count == 0 and self.units is None:
+      self.units = units
+    if units is not None and units != self.units:
+      x = x.to(self.units)
+    return magof(x)
+
+  def add(self, x):
+    '''Add a single value.'''
+    x = self._magnitude(x)
+    self.count += 1
+    delta = x - self.mean
+    self.mean = self.mean + delta/self.count
+    self.M2 = self.M2 + delta*(x - self.mean)
+    return self
+
+  def update(self, data):
+    '''Add a value, an array of values, or all values (or arrays) generated by an iterable.'''
+    m = magof(data)
+    if getattr(m,'ndim',None) == 0:
+      return self.add(data)
+    if hasattr(m,'ndim'):
+      m = self._magnitude(data).ravel()
+      if m.size > 0:
+        mean = m.mean()
+        self._merge( m.size, mean, ((m - mean)**2).sum() )
+      return self
+
+    try:
+      values = iter(data)
+    except TypeError:
+      return self.add(data)
+    for x in values:
+      self.update(x)
+    return self
+
+  def _merge(self, count, mean, M2):
+    if count == 0:
+      return
+    if self.count == 0:
+      self.count,self.mean,self.M2 = count,mean,M2
+      return
+    n = self.count + count
+    delta = mean - self.mean
+    self.mean = self.mean + delta*count/n
+    self.M2 = self.M2 + M2 + delta*delta*self.count*count/n
+    self.count = n
+
+  @property
+  def state(self):
+    '''The count, mean, sum of squared deviations and units (as a string) of the accumulator.'''
+    return ( self.count, self.mean, self.M2, None if self.units is None else str(self.units) )
+
+  def merge(self, other):
+    '''Merge another accumulator (or the state of one) into this one.'''
+    if isinstance( other, tuple ):
+      count,mean,M2,units = other
+    else:
+      count,mean,M2,units = other.count,other.mean,other.M2,other.units
+
+    if units is not None and count > 0:
+      units = self.Quantity(1,units).units
+      if self.count == 0 and self.units is None:
+        self.units = units
+      if units != self.units:
+        # the mean is converted like a value, the sum of squared deviations like a squared difference.
+        convert = lambda v: magof( self.Quantity(v,units).to(self.units) )
+        scale = convert(1) - convert(0)
+        mean = convert(mean)
+        M2 = M2*scale**2
+    self._merge( count, mean, M2 )
+    return self
+
+  def _quantity(self, x):
+    return x if self.units is None else self.Quantity(x,self.units)
+
+  @property
+  def nominal(self):
+    return self._quantity(self.mean)
+
+  @property
+  def variance(self):
+    '''The (unbiased) variance of the data set.'''
+    v = self.M2/(self.count - 1)
+    return v if self.units is None else self.Quantity(v,self.units**2)
+
+  # note: the standard deviation and error are computed from magnitudes, since
+  # quantities with offset units (i.e. degC) can't be multiplied or raised to a power.
+  @property
+  def std_dev(self):
+    return self._quantity( special_square_root( self.M2/(self.count - 1) ) )
+
+  @property
+  def std_err(self):
+    std_dev = special_square_root( self.M2/(self.count - 1) )
+    return self._quantity( std_dev / type(std_dev)(self.count**0.5) )
+
+  def calc_UncertainQuantity(self, round = False):
+    '''Return the mean of the data set, with the standard error as uncertainty.'''
+    q = self._CONVENTION.UncertainQuantity( self.nominal, self.std_err )
+    if round:
+      q = self._CONVENTION.__round__( q )
+    return q
+
+  calc_UQ = calc_UncertainQuantity
+
+  def __len__(self):
+    return self.count
+
+  def __repr__(self):
+    return "<RunningStatistics({0}, {1}, {2}, {3})>".format(self.count, self.mean, self.M2, self.units)
@@ -0,0 +1,108 @@
+'''A compact binary file format for data sets of uncertain quantities.
+
+A file starts with a magic string, a format version, and the length of a JSON header
+that holds the names, shapes and units of the columns (and the correlations between them).
+The data blocks follow the header. Each column is stored as an array of NumPy structured
+(nominal, uncertainty) float64 records, and each element-wise correlation block as an
+array of float64 coefficients. Blocks are aligned, so they can be memory mapped.'''
+
+import json, struct, os
+
+import numpy
+
+MAGIC     = b'\x93PYERRPROP'
+VERSION   = 1
+ALIGNMENT = 64
+RECORD_DTYPE      = numpy.dtype( [('nominal','<f8'),('uncertainty','<f8')] )
+CORRELATION_DTYPE = numpy.dtype( '<f8' )
+
+# columns are written in chunks of this many records, so large columns are not copied all at once.
+CHUNK_SIZE = 1 << 20
+
+
+def _padding(n):
+  return -n % ALIGNMENT
+
+def write_dataset( stream, columns, correlations = (), **attributes ):
+  '''Write a data set to a (binary) stream.
+
+     columns is a list of (name, nominal values, uncertainties, units, uncertainty units) tuples, and
+     correlations is a list of (name, name, coefficient) tuples, where the coefficient is a number
+     or an array of element-wise coefficients. Extra attributes are stored in the header.'''
+  header = dict( attributes, version = VERSION, columns = [], correlations = [] )
+  blocks = []
+  offset = 0
+  for name,nom,unc,units,unc_units in columns:
+    nom,unc = numpy.broadcast_arrays( numpy.asarray(nom,dtype=float), numpy.asarray(unc,dtype=float) )
+    header['columns'].append( { 'name' : name, 'units' : units, 'unc_units' : unc_units, 'shape' : list(nom.shape), 'offset' : offset } )
+    blocks.append( (nom,unc) )
+    offset += nom.size*RECORD_DTYPE.itemsize
+    offset += _padding(offset)
+
+  for x,y,r in correlations:
+    if numpy.ndim(r) == 0:
+      header['correlations'].append( { 'x' : x, 'y' : y, 'value' : float(r) } )
+      continue
+    r = numpy.asarray( r, dtype=float )
+    header['correlations'].append( { 'x' : x, 'y' : y, 'shape' : list(r.shape), 'offset' : offset } )
+    blocks.append( (r,) )
+    offset += r.size*CORRELATION_DTYPE.itemsize
+    offset += _padding(offset)
+
+  text = json.dumps( header ).encode('utf-8')
+  # pad the header with spaces so that the data starts on an aligned offset.
+  start = len(MAGIC) + 6 + len(text)
+  text += b' '*_padding(start)
+  stream.write( MAGIC )
+  stream.write( struct.pack( '<HI', VERSION, len(text) ) )
+  stream.write( text )
+
+  for block in blocks:
+    if len(block) == 2:
+      nom,unc = block[0].ravel(),block[1].ravel()
+      for i in range( 0, nom.size, CHUNK_SIZE ):
+        records = numpy.empty( min(CHUNK_SIZE,nom.size-i), dtype=RECORD_DTYPE )
+        records['nominal'] = nom[i:i+CHUNK_SIZE]
+        records['uncertainty'] = unc[i:i+CHUNK_SIZE]
+        stream.write( records.tobytes() )
+      n = nom.size*RECORD_DTYPE.itemsize
+    else:
+      stream.write( block[0].astype(CORRELATION_DTYPE,copy=False).tobytes() )
+      n = block[0].size*CORRELATION_DTYPE.itemsize
+    stream.write( b'\0'*_padding(n) )
+
+def read_dataset( file, mmap_mode = None ):
+  '''Read a data set written by write_dataset from a file name (or an open binary file).
+
+     Returns the header, a list of (name, records, units, uncertainty units) tuples and a list of
+     (name, name, coefficient) tuples. If mmap_mode is given ('r', 'r+' or 'c', see numpy.memmap),
+     the records and correlation blocks are memory maps of the file, so data is only read when it is used.'''
+  if isinstance( file, (str,os.PathLike) ):
+    with open( file, 'rb' ) as f:
+      return read_dataset( f, mmap_mode )
+
+  if file.read( len(MAGIC) ) != MAGIC:
+    raise ValueError("Not an uncertain quantity data set (the file does not start with {0}).".format(MAGIC))
+  version,length = struct.unpack( '<HI', file.read(6) )
+  if version > VERSION:
+    raise ValueError("Unsupported data set format version {0} (the latest supported version is {1}).".format(version,VERSION))
+  header = json.loads( file.read(length).decode('utf-8') )
+  start = file.tell()
+
+  def block( offset, dtype, shape ):
+    shape = tuple(shape)
+    count = int( numpy.prod(shape) )
+    if count == 0:
+      return numpy.zeros( shape, dtype=dtype )
+    if mmap_mode is not None:
+      return numpy.memmap( file, dtype=dtype, mode=mmap_mode, offset=start+offset, shape=(count,) ).reshape(shape)
+    data = numpy.empty( count, dtype=dtype )
+    file.seek( start+offset )
+    if file.readinto( data.view(numpy.uint8) ) != data.nbytes:
+      raise ValueError("The data set is truncated.")
+    return data.reshape(shape)
+
+  columns = [ ( c['name'], block( c['offset'], RECORD_DTYPE, c['shape'] ), c['units'], c['unc_units'] ) for c in header['columns'] ]
+  correlations = [ ( c['x'], c['y'], c['value'] if 'value' in c else block( c['offset'], CORRELATION_DTYPE, c['shape'] ) ) for c in header['correlations'] ]
+
+  return header, columns, correlations
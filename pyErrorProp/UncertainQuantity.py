@@ -8,10 +8,22 @@ from .unicode import *
 ureg = pint.UnitRegistry()
 
 class _UncertainQuantity(object):
-  '''A quantity with uncertainty.'''
+  '''A quantity with uncertainty.
+
+     To keep instances small, the nominal value and uncertainty are stored as magnitudes
+     and units (which are shared by all instances with the same units). The nominal and
+     uncertainty properties return a new Quantity each time, so modifying one in place (i.e. with ito)
+     does not change the uncertain quantity. Classes derived from this one should define __slots__ too.
+
+     If the convention is lazy, operators return uncertain quantities that only store the
+     operation (in _expr), and are evaluated by the convention when they are first used.'''
+
+  __slots__ = ('_nom_mag','_unc_mag','_unit','_unc_unit','_expr','__weakref__')
 
   _REGISTRY = ureg
   Quantity = _REGISTRY.Quantity
+  _DELTA_UNITS = dict()
+  _UNITS = dict()
   Decimal = decimal.Decimal
 
   def __init__( self, nom, unc = None, unit = None ):
@@ -41,24 +53,66 @@ class _UncertainQuantity(object):
     # pint seems to automatically convert any offset units to deltas
     # for derived units, so for now we will just try to convert
     # to a delta unit if possible.
-    try:
-      unc = self.Quantity(unc.magnitude, self._delta(unc.units) )
-    except:
-      pass
+    delta = self._delta_units( unc._units )
+    if delta is not None:
+      unc = self.Quantity(unc.magnitude, delta )
 
     # make sure units on unc and nom are compatible
     try:
       tmp = nom + unc
+      self._store( nom, unc )
     except Exception as e:
       e.extra_msg = " Nominal value and uncertainty do not have compatible types."
       raise e
 
-      
-    self._nom = nom
-    self._unc = unc
+  def _store(self, nom, unc):
+    '''Store the nominal value and uncertainty. The uncertainty is converted to the
+       units returned by the uncertainty property (the delta version of the nominal
+       units for offset units) here, once, so the properties don't need to convert anything.'''
+    if self._is_a_delta( unc ) and not self._is_a_delta( nom ):
+      unc = unc.to( self._delta(nom.units) )
+    elif unc._units != nom._units:
+      unc = unc.to( nom.units )
+
+    self._nom_mag = nom.magnitude
+    self._unc_mag = unc.magnitude
+    self._unit = self._intern( nom.units )
+    self._unc_unit = self._intern( unc.units )
+    self._expr = None
+
+  @classmethod
+  def _intern(cls, unit):
+    '''Return a shared instance of unit.'''
+    return cls._UNITS.setdefault( unit._units, unit )
+
+  @classmethod
+  def _from_magnitudes(cls, nom, unc, unit, unc_unit):
+    '''Create an uncertain quantity directly from magnitudes and (interned) units, skipping all checks and conversions.'''
+    self = cls.__new__(cls)
+    self._nom_mag = nom
+    self._unc_mag = unc
+    self._unit = unit
+    self._unc_unit = unc_unit
+    self._expr = None
+    return self
 
-    self._unit = self._nom.units
+  @classmethod
+  def _lazy(cls, name, a, b):
+    '''Create an uncertain quantity that will be evaluated (by the convention) when it is used.'''
+    self = cls.__new__(cls)
+    self._unit = None
+    self._expr = (name,a,b)
+    return self
+
+  def _evaluated(self):
+    '''Make sure a lazy uncertain quantity has been evaluated.'''
+    if self._unit is None:
+      self._CONVENTION.__evaluate_lazy__(self)
 
+  @property
+  def _unc_is_delta(self):
+    self._evaluated()
+    return self._unc_unit != self._unit
 
   def make(self,*args,**kwargs):
     '''Create an instance of the class, using the uncertainty convension if necessary.'''
@@ -70,15 +124,14 @@ class _UncertainQuantity(object):
 
   @property
   def nominal(self):
-    return self._nom.to(self._unit)
+    self._evaluated()
+    return self.Quantity( self._nom_mag, self._unit )
   value = nominal
 
   @property
   def uncertainty(self):
-    if self._is_a_delta( self._unc ):
-      return self._unc.to(self._delta(self._unit))
-    else:
-      return self._unc.to(self._unit)
+    self._evaluated()
+    return self.Quantity( self._unc_mag, self._unc_unit )
   error = uncertainty
 
   @property
@@ -109,8 +162,7 @@ class _UncertainQuantity(object):
 
     # __round__ already does what we need, we just need to do it in place.
     tmp = self.__round__(n)
-    self._nom = tmp._nom
-    self._unc = tmp._unc
+    self._store( tmp.nominal, tmp.uncertainty )
 
     return self
 
@@ -118,20 +170,20 @@ class _UncertainQuantity(object):
 
   def correlated( self, var, corr ):
     '''Set the correlation between another variable.'''
+    self._evaluated()
     self._CONVENTION._CORRREGISTRY.correlated(self,var,corr)
 
 
   def correlation( self, var, default = 0.0 ):
     '''Get the correlation between another variable.'''
+    self._evaluated()
     return self._CONVENTION._CORRREGISTRY.correlation(self,var,default)
 
 
   def __repr__(self):
-    nom = self._nom.to(self._unit).magnitude
-    if self._is_a_delta( self._unc ):
-      unc = self._unc.to(self._delta(self._unit)).magnitude
-    else:
-      unc = self._unc.to(self._unit).magnitude
+    self._evaluated()
+    nom = self._nom_mag
+    unc = self._unc_mag
 
     template = "<UncertainQuantity({0}, {1}, {2})>" 
 
@@ -141,79 +193,15 @@ class _UncertainQuantity(object):
     return template.format(nom_s,unc_s,self._unit)
 
   def __format__(self, fmtspec):
+    self._evaluated()
     # see if formatting is handled by the uncertainty convention
     # so that the user can overload it if they want.
-    try:
+    if hasattr( self._CONVENTION, '__format_uncertainquantity__' ):
       return self._CONVENTION.__format_uncertainquantity__(self,fmtspec)
-    except:
-      pass
-
 
-    # An uncertain quantity should be formatted so that the
-    # nominal value matches the decimal position of the uncertainty (Taylor, 1997).
-    #
-    # In general, the uncertainty should be rounded to 1 significant figure when displayed (Taylor, 1997).
-    #
-    # However, if the leading significant figure is '1', two significant figures may be retained (Taylor, 1997).
-    #
-    # So, for an uncertain quantity, we interpret the precision spec in the format string to be the 
-    # number of significant figures that should be displayed in the uncertainty, rather than the number
-    # of figures after the decimal point. The nominal value's precision will set to match
-    # the uncertainties.
-    #
-    # The __round__ function already does this. It uses the Decimal type internally, but converts
-    # back to the actual type used for storing the nominal and uncertainty values. So, if
-    # we just create an uncertain quantity that uses Decimal and round it, we will have
-    # what we need.
-    #
-    #
-    # Pint already handles formatting of units (and does a nice job), so we just need to format the value portion.
-    # 
-
-    # split the format spec into its value specific and unit specific parts
-    v_fmtspec = fmtspec.replace('Lx','')
-    v_fmtspec = pint.formatting.remove_custom_flags(v_fmtspec)
-    u_fmtspec = fmtspec.replace(v_fmtspec,'')
-
-
-    # get number of sigfigs requested
-    psre = re.compile(r'\.([0-9]+)')
-    match = psre.search( v_fmtspec )
-    nsig = None
-    if match:
-      nsig = match.group(1)
-      nsig = int(nsig)
-      if nsig < 0:
-        nsig = 0
-
-    # now we can remove the precision spec
-    v_fmtspec = psre.sub( r'', v_fmtspec )
-
-    # create an uncertain quantity that uses Decimal for storate and round
-    units = self.nominal.units
-    nom = self.Quantity( decimal.Decimal(str(self.nominal.magnitude)), units )
-    unc = self.Quantity( decimal.Decimal(str(self.error.to(units).magnitude)), units )
-    uq = self.make( nom, unc ).__round__(nsig)
-
-    # now get the nominal and uncertainty values
-    nom = uq.nominal.magnitude
-    unc = uq.error.magnitude
-
-    # Use pint to create a template string with the units already formatted
-    # by creating a quantity with a string replacement (%s) as a magnitude.
-    tmpl = ('{:'+u_fmtspec+'}').format( self.Quantity( '%s', self._unit ) )
-
-
-    # Format the value
-    sepstr = ' +/- '
-    if 'Lx' in u_fmtspec:
-      sepstr = ' +- '
-
-    valstr = ('{:%s}%s{:%s}'%(v_fmtspec,sepstr,v_fmtspec)).format(nom,unc)
-    
-    ret = tmpl % valstr
-
-    return ret
+    # the nominal value and uncertainty magnitudes are stored in the same units (the uncertainty may be
+    # in the delta version of them), so the convention can format them directly.
+    return self._CONVENTION._format_magnitudes( self._nom_mag, self._unc_mag, self._unit, fmtspec )
 
   @staticmethod
   def parse_string(text):
@@ -262,52 +250,70 @@ class _UncertainQuantity(object):
   def _delta(self,unit):
     return 'delta_'+str(unit)
 
+  def _delta_units(self,units):
+    '''Return the delta version of units, or None if there isn't one. Looking up units that are
+       not defined is slow, so the results are cached.'''
+    try:
+      return self._DELTA_UNITS[units]
+    except KeyError:
+      pass
+
+    try:
+      delta = self.Quantity( 1, self._delta(self.Quantity(1,units).units) ).units
+    except:
+      delta = None
+    self._DELTA_UNITS[units] = delta
+    return delta
+
   def _is_a_delta(self,q):
     return len(q._units) == 1 and str(q.units).startswith('delta_')
 
   def to(self,unit):
-    if self._is_a_delta( self._unc ):
-      return self.make( self._nom.to(unit), self._unc.to(self._delta(unit)) )
+    nom = self.nominal.to(unit)
+    if self._unc_is_delta:
+      return self.make( nom, self.uncertainty.to(self._delta(nom.units)) )
     else:
-      return self.make( self._nom.to(unit), self._unc.to(unit) )
+      return self.make( nom, self.uncertainty.to(nom.units) )
 
   def ito(self,unit):
-    self._nom.ito(unit)
-    self._unc.ito(unit)
-    self._unit = self._nom.units
+    # the nominal value and uncertainty may be shared, so they are replaced, not converted in place.
+    nom = self.nominal.to(unit)
+    if self._unc_is_delta:
+      self._store( nom, self.uncertainty.to(self._delta(nom.units)) )
+    else:
+      self._store( nom, self.uncertainty.to(nom.units) )
 
   def __neg__(self):
-    return self._CONVENTION.__propagate_errors__( operator.__sub__, (0,self) )
+    return self._CONVENTION.__propagate_operator__( 'sub', 0, self )
 
   def __abs__(self):
     if self.nominal.magnitude >= 0:
-      return self._CONVENTION.__propagate_errors__( operator.__add__, (0,self) )
+      return self._CONVENTION.__propagate_operator__( 'add', 0, self )
     else:
-      return self._CONVENTION.__propagate_errors__( operator.__sub__, (0,self) )
+      return self._CONVENTION.__propagate_operator__( 'sub', 0, self )
 
   def __add__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__add__, (self,other) )
+    return self._CONVENTION.__propagate_operator__( 'add', self, other )
 
   __radd__ = __add__
 
   def __sub__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__sub__, (self,other) )
+    return self._CONVENTION.__propagate_operator__( 'sub', self, other )
 
   def __rsub__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__sub__, (other,self) )
-    return -self.__sub__(other)
+    return self._CONVENTION.__propagate_operator__( 'sub', other, self )
 
   def __mul__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__mul__, (self,other) )
+    return self._CONVENTION.__propagate_operator__( 'mul', self, other )
 
   def __rmul__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__mul__, (other,self) )
+    return self._CONVENTION.__propagate_operator__( 'mul', other, self )
 
   def __truediv__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__truediv__, (self,other) )
+    return self._CONVENTION.__propagate_operator__( 'truediv', self, other )
 
   def __rtruediv__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__truediv__, (other,self) )
+    return self._CONVENTION.__propagate_operator__( 'truediv', other, self )
 
   def __div__(self,other):
     return self._CONVENTION.__propagate_errors__( operator.__div__, (self,other) )
@@ -317,7 +323,7 @@ class _UncertainQuantity(object):
 
 
   def __pow__(self,other):
-    return self._CONVENTION.__propagate_errors__( operator.__pow__, (self,other) )
+    return self._CONVENTION.__propagate_operator__( 'pow', self, other )
 
 
 
@@ -0,0 +1,273 @@
+from __future__ import division
+import operator, weakref
+
+import numpy
+
+
+class _UncertainQuantityArray(object):
+  '''An array of quantities with uncertainty that share a single unit.
+
+     The nominal values and uncertainties are stored as two NumPy arrays, so
+     arithmetic, unit conversions, indexing and slicing are all done with
+     a handful of vectorized operations instead of one Python object per element.
+
+     Elements of an array are treated as independent of each other. Correlations
+     between arrays (and between arrays and scalar uncertain quantities) are
+     stored element-wise in the convention's correlation registry.'''
+
+  # let NumPy defer to our reflected operators instead of
+  # broadcasting over the array as an object.
+  __array_ufunc__ = None
+
+  def __init__( self, nom, unc = None, unit = None ):
+    if not isinstance( nom, self.Quantity ):
+      if unit is None:
+        nom = self.Quantity( numpy.asarray( nom, dtype=float ) )
+      else:
+        nom = self.Quantity( numpy.asarray( nom, dtype=float ), unit )
+
+    if unc is None:
+      unc = 0
+
+    if not isinstance( unc, self.Quantity ):
+      if isinstance(unc,str):
+        unc = unc.replace('%','percent')
+        unc = self.Quantity( unc )
+      elif unit is None:
+        unc = self.Quantity( numpy.asarray( unc, dtype=float ) )
+      else:
+        unc = self.Quantity( numpy.asarray( unc, dtype=float ), unit )
+
+    if str(unc.units) == 'percent':
+      unc = nom*unc.to('')
+
+    # uncertainties should be "delta" units
+    unc = self.Quantity( unc.magnitude, self._delta( unc.units ) )
+    unc_unit = self._delta( nom.units )
+
+    if unc.dimensionless and not nom.dimensionless and numpy.all( unc.magnitude == 0 ):
+      # a zero (or missing) uncertainty can be given without units.
+      unc = self.Quantity( unc.magnitude, unc_unit )
+
+    try:
+      unc = unc.to( unc_unit )
+    except Exception as e:
+      e.extra_msg = " Nominal value and uncertainty do not have compatible types."
+      raise e
+
+    nom_mag = numpy.asarray( nom.magnitude, dtype=float )
+    unc_mag = numpy.asarray( unc.magnitude, dtype=float )
+    if unc_mag.shape != nom_mag.shape:
+      unc_mag = numpy.array( numpy.broadcast_to( unc_mag, nom_mag.shape ) )
+
+    self._nom = nom_mag
+    self._unc = unc_mag
+    self._unit = nom.units
+    self._unc_unit = unc_unit
+
+  def _delta(self,unit):
+    '''Return the unit that should be used for uncertainties of quantities in unit.'''
+    try:
+      return self.Quantity( 1, 'delta_'+str(unit) ).units
+    except:
+      return self.Quantity( 1, unit ).units
+
+  @classmethod
+  def _from_magnitudes(cls, nom, unc, unit, unc_unit):
+    '''Create an array directly from magnitude arrays, skipping all checks and conversions.'''
+    self = cls.__new__(cls)
+    self._nom = nom
+    self._unc = unc
+    self._unit = unit
+    self._unc_unit = unc_unit
+    return self
+
+  @property
+  def nominal(self):
+    return self.Quantity( self._nom, self._unit )
+  value = nominal
+
+  @property
+  def uncertainty(self):
+    return self.Quantity( self._unc, self._unc_unit )
+  error = uncertainty
+
+  @property
+  def relative_uncertainty(self):
+    return self.uncertainty/self.nominal
+  relative_error = relative_uncertainty
+
+  @property
+  def upper(self):
+    return self.nominal + self.uncertainty
+
+  @property
+  def lower(self):
+    return self.nominal - self.uncertainty
+
+  @property
+  def interval(self):
+    return 2*self.uncertainty
+
+  @property
+  def units(self):
+    return self._unit
+
+  @property
+  def shape(self):
+    return self._nom.shape
+
+  @property
+  def ndim(self):
+    return self._nom.ndim
+
+  @property
+  def size(self):
+    return self._nom.size
+
+  def __len__(self):
+    return len(self._nom)
+
+  def __getitem__(self,key):
+    '''Index or slice the array. Slices are views that share memory with this array,
+       single elements are returned as scalar uncertain quantities.
+
+       Indexing the same elements twice returns the same object (while it is alive), and the
+       elements keep the correlations of this array, so i.e. x[0] - x[0] is exactly zero.'''
+    nom = self._nom[key]
+    unc = self._unc[key]
+    vkey = self._view_key(key)
+    view = self._views.get(vkey) if vkey is not None and self.__dict__.get('_views') is not None else None
+    if view is not None:
+      return view
+
+    if numpy.ndim(nom) == 0:
+      # the magnitudes are already checked and converted, so the constructor (which would apply
+      # the relative uncertainty rule to percent units again) is skipped.
+      UQ_ = self._CONVENTION.UncertainQuantity
+      view = UQ_._from_magnitudes( float(nom), float(unc), UQ_._intern(self._unit), UQ_._intern(self._unc_unit) )
+    else:
+      view = self._from_magnitudes( nom, unc, self._unit, self._unc_unit )
+
+    if vkey is not None:
+      if self.__dict__.get('_views') is None:
+        self._views = weakref.WeakValueDictionary()
+      self._views[vkey] = view
+    self._correlate_view( key, vkey, view )
+
+    return view
+
+  def _view_key(self,key):
+    '''Return a hashable key for the elements selected by an int/slice index (or a tuple of them), or None.'''
+    if not isinstance(key,tuple):
+      key = (key,)
+    if len(key) > self.ndim:
+      return None
+    vkey = []
+    for k,n in zip( key + (slice(None),)*(self.ndim-len(key)), self.shape ):
+      if isinstance(k,(int,numpy.integer)) and not isinstance(k,bool):
+        vkey.append( int(k) % n )
+      elif isinstance(k,slice):
+        vkey.append( k.indices(n) )
+      else:
+        return None
+    return tuple(vkey)
+
+  def _correlate_view(self, key, vkey, view):
+    '''Give a view (or element) of this array the element-wise correlations of the array. Arrays are
+       correlated through their views with the same key, which keep the correlation from both sides.'''
+    creg = self._CONVENTION._CORRREGISTRY
+    for v in creg.dependencies(self):
+      if v is self:
+        continue
+      r = creg.correlation(self,v)
+      if isinstance( v, _UncertainQuantityArray ):
+        if vkey is None or v.shape != self.shape or v.__dict__.get('_views') is None:
+          continue
+        v = v._views.get(vkey)
+        if v is None:
+          continue
+      if numpy.ndim(r) > 0:
+        r = numpy.broadcast_to( r, self.shape )[key]
+        r = float(r) if numpy.ndim(r) == 0 else numpy.array(r)
+      creg.correlated( view, v, r )
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def to(self,unit):
+    nom = self.nominal.to(unit)
+    unc_unit = self._delta(nom.units)
+    unc = self.uncertainty.to(unc_unit)
+    return self._from_magnitudes( numpy.asarray(nom.magnitude), numpy.asarray(unc.magnitude), nom.units, unc_unit )
+
+  def ito(self,unit):
+    tmp = self.to(unit)
+    self._nom = tmp._nom
+    self._unc = tmp._unc
+    self._unit = tmp._unit
+    self._unc_unit = tmp._unc_unit
+    self._views = None
+
+  def __round__(self,n=None):
+    return self._CONVENTION.__round__(self,n)
+
+  def normalize(self,n=None):
+    '''Normalize the array in place (see UncertainQuantity.normalize). All elements
+       are rounded at once, with arithmetic instead of Decimal strings.'''
+    tmp = self.__round__(n)
+    self._nom[...] = tmp._nom
+    self._unc[...] = tmp._unc
+    # elements are copies, they are created again when they are used.
+    self._views = None
+    return self
+
+  def correlated( self, var, corr ):
+    '''Set the (element-wise) correlation between another variable.'''
+    self._CONVENTION._CORRREGISTRY.correlated(self,var,corr)
+
+  def correlation( self, var, default = 0.0 ):
+    '''Get the (element-wise) correlation between another variable.'''
+    return self._CONVENTION._CORRREGISTRY.correlation(self,var,default)
+
+  def __repr__(self):
+    template = "<UncertainQuantityArray({0}, {1}, {2})>"
+    return template.format(self._nom,self._unc,self._unit)
+
+  def __neg__(self):
+    return self._CONVENTION.__propagate_errors__( operator.__sub__, (0,self) )
+
+  def __abs__(self):
+    sign = numpy.where( self._nom >= 0, 1., -1. )
+    return self._CONVENTION.__propagate_errors__( operator.__mul__, (sign,self) )
+
+  def __add__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__add__, (self,other) )
+
+  def __radd__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__add__, (other,self) )
+
+  def __sub__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__sub__, (self,other) )
+
+  def __rsub__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__sub__, (other,self) )
+
+  def __mul__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__mul__, (self,other) )
+
+  def __rmul__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__mul__, (other,self) )
+
+  def __truediv__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__truediv__, (self,other) )
+
+  def __rtruediv__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__truediv__, (other,self) )
+
+  def __pow__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__pow__, (self,other) )
+
+  def __rpow__(self,other):
+    return self._CONVENTION.__propagate_errors__( operator.__pow__, (other,self) )
@@ -1,32 +1,95 @@
-import decimal
+import decimal, copy, math, operator, os, collections, collections.abc, itertools, re
 
 import pint
 from pint import UnitRegistry
 
-from .ErrorPropagator import PositiveIntervalPropagator, nominal, uncertainty
-from .CorrelationRegistry import CorrelationRegistry
+from .ErrorPropagator import PositiveIntervalPropagator, ReverseModePropagator, CompiledPropagator, TraceError, _is_kernel_input, nominal, uncertainty
+from .CorrelationRegistry import CorrelationRegistry, SparseCorrelationRegistry
 from .util import *
 
 from .unicode import *
 
-from .decorator import decorate
+from .decorator import decorate, iscoroutinefunction
 
 UR = UnitRegistry()
 EP = PositiveIntervalPropagator
 
+LineageInfo = collections.namedtuple('LineageInfo', ['pruned','compacted','max_pruned'])
+
+# "nominal [units] [+/- uncertainty [%] [units]]", see UncertainQuantity.parse_string
+NUMBER_PATTERN = r'[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf)'
+UNITS_PATTERN = r'(?:[^\d\s+\-*/^().].*?)?'
+PARSE_PATTERN = re.compile( r'^\s*(?P<nom>{0})\s*(?P<nomu>{1})\s*(?:\+/?-\s*(?P<unc>{0})(?P<pct>%)?\s*(?P<uncu>{1}))?\s*$'.format(NUMBER_PATTERN,UNITS_PATTERN), re.IGNORECASE )
+
+OPERATORS = { 'add'     : operator.__add__
+            , 'sub'     : operator.__sub__
+            , 'mul'     : operator.__mul__
+            , 'truediv' : operator.__truediv__
+            , 'pow'     : operator.__pow__
+            }
+
 class UncertaintyConvention(object):
-  def __init__(self, _UR = UR, _EP = EP):
+  def __init__(self, _UR = UR, _EP = EP, _CR = CorrelationRegistry, correlation_cutoff = 0.0, max_dependencies = None, lazy = False):
     self._UNITREGISTRY = _UR
     self._ERRORPROPAGATOR = _EP
     self.UncertainQuantity = build_uncertainquantity_class(self, self._UNITREGISTRY)
-    self.ErrorPropagator = EP()
-
-    self._CORRREGISTRY = CorrelationRegistry()
+    try:
+      self.UncertainQuantityArray = build_uncertainquantityarray_class(self, self._UNITREGISTRY)
+    except ImportError:
+      # NumPy is not installed
+      self.UncertainQuantityArray = None
+    self.RunningStatistics = build_runningstatistics_class(self, self._UNITREGISTRY)
+    # the pandas extension classes are built when they are first used
+    self._PANDAS = None
+    # the error propagator can be given as a class or an instance
+    self.ErrorPropagator = _EP() if isinstance(_EP,type) else _EP
+
+    # the correlation registry can be given as a class or an instance
+    self._CORRREGISTRY = _CR() if isinstance(_CR,type) else _CR
+
+    # limits on the correlations that results inherit from their inputs (see lineage_info).
+    # new correlations smaller than correlation_cutoff are not stored, and results keep at most
+    # max_dependencies (the largest) correlations.
+    self.correlation_cutoff = correlation_cutoff
+    self.max_dependencies = max_dependencies
+    self._lineage_pruned = 0
+    self._lineage_compacted = 0
+    self._lineage_max_pruned = 0.0
+
+    # in lazy mode, operators build an expression graph that is evaluated (with one call to the lazy propagator)
+    # when the result is used. lazy may be True (reverse mode automatic differentiation is used), or a propagator.
+    self.LazyPropagator = None
+    if lazy is True:
+      self.LazyPropagator = ReverseModePropagator()
+    elif lazy:
+      self.LazyPropagator = lazy() if isinstance(lazy,type) else lazy
+    # keys include the exponents of pow, so the number of entries is limited.
+    self._OPERATOR_UNITS = LRUCache(1024)
+    self._FORMAT_SPECS = dict()
+    self._PARSED_UNITS = dict()
+
+    # propagators that sample correlated arguments need the correlation registry
+    if getattr(self.ErrorPropagator,'correlations',False) is None:
+      self.ErrorPropagator.correlations = self._CORRREGISTRY
 
   @property
   def correlations(self):
     return self._CORRREGISTRY
 
+  @property
+  def UncertainQuantityDtype(self):
+    '''The pandas dtype for columns of uncertain quantities (pandas is only imported when it is used).'''
+    if self._PANDAS is None:
+      self._PANDAS = build_pandas_classes(self, self._UNITREGISTRY)
+    return self._PANDAS[0]
+
+  @property
+  def UncertainQuantityPandasArray(self):
+    '''The pandas extension array for columns of uncertain quantities, see UncertainQuantityDtype.'''
+    if self._PANDAS is None:
+      self._PANDAS = build_pandas_classes(self, self._UNITREGISTRY)
+    return self._PANDAS[1]
+
   def z(self,a,b):
     z = ( nominal(a) - nominal(b) ) / special_square_root(uncertainty(a)**2 + uncertainty(b)**2)
     try:
@@ -34,55 +97,677 @@ class UncertaintyConvention(object):
     except:
       return z
 
-  def __propagate_errors__(self, f, args, kwargs = {}):
-    '''Propagates error through a function.'''
-    # assume we are calculating z = f(x,y,...)
-    zbar,dzs= self.ErrorPropagator.__propagate_errors__( f, *args, **kwargs )
+  def _has_arrays(self, args, kwargs):
+    '''Check if any of the arguments are uncertain quantity arrays.'''
+    if self.UncertainQuantityArray is None:
+      return False
+    for a in args:
+      if isinstance(a, self.UncertainQuantityArray):
+        return True
+    for a in kwargs.values():
+      if isinstance(a, self.UncertainQuantityArray):
+        return True
+    return False
+
+  def _cache_key(self, args, kwargs):
+    '''Return a key identifying the nominal values and uncertainties of a set of function arguments,
+       or None if the arguments can't be used as a key (arrays and unhashable arguments).'''
+
+    def key(x):
+      if isuncertain(x):
+        nom,unc = nominal(x),uncertainty(x)
+        return ( magof(nom), str(unitsof(nom)), magof(unc), str(unitsof(unc)) )
+      if unitsof(x) is not None:
+        return ( magof(x), str(unitsof(x)) )
+      return x
+
+    k = ( tuple( key(a) for a in args ), tuple( (n,key(kwargs[n])) for n in sorted(kwargs) ) )
+    try:
+      hash(k)
+    except TypeError:
+      return None
+    return k
+
+  def __propagate_errors__(self, f, args, kwargs = {}, propagator = None, cache = None):
+    '''Propagates error through a function. The convention's error propagator is used unless another is given.
+
+       If a cache (LRUCache) is given, the function evaluations are looked up in it
+       before calling the propagator. Correlations are registered for the new result either way.'''
+    if self._has_arrays(args, kwargs):
+      return self.__propagate_array_errors__( f, args, kwargs, propagator )
+
+    if propagator is None:
+      propagator = self.ErrorPropagator
+
+    key = None if cache is None else self._cache_key( args, kwargs )
+    entry = None if key is None else cache.get( key )
+
+    if entry is None:
+      # assume we are calculating z = f(x,y,...)
+      entry = propagator.__propagate_errors__( f, *args, **kwargs )
+      if key is not None:
+        cache.put( key, entry )
+
+    zbar,dzs = entry
+    return self.__combine_errors__( zbar, dzs, args, kwargs )
+
+  async def __propagate_errors_async__(self, f, args, kwargs = {}, propagator = None, cache = None):
+    '''Propagates error through a coroutine function. The function evaluations are awaited
+       concurrently, the uncertainty and correlations are then computed as usual.'''
+    if propagator is None:
+      propagator = self.ErrorPropagator
+
+    key = None if cache is None or self._has_arrays(args, kwargs) else self._cache_key( args, kwargs )
+    entry = None if key is None else cache.get( key )
+
+    if entry is None:
+      entry = await propagator.__propagate_errors_async__( f, *args, **kwargs )
+      if key is not None:
+        cache.put( key, entry )
+
+    zbar,dzs = entry
+    if self._has_arrays(args, kwargs):
+      return self.__combine_array_errors__( zbar, dzs, args, kwargs )
+    return self.__combine_errors__( zbar, dzs, args, kwargs )
+
+  def __combine_errors__(self, zbar, dzs, args, kwargs = {}):
+    '''Create an uncertain quantity from a nominal value and the uncertainty contributions of
+       each argument, and register its correlations.'''
 
     # dzs is a dict of the uncertainty contributions from args and kwargs.
     # it will be more convienient to have a list of quantities paired with their uncertainty...
     dzs = [ ( dzs[k], kwargs[k] if k in kwargs else args[k] ) for k in dzs ]
 
+    dz = self._total_uncertainty( dzs )
+    z = self.UncertainQuantity(zbar,dz)
+    self._register_correlations( z, dz, dzs )
+
+    return z
+
+  def _total_uncertainty(self, dzs):
+    '''Compute the total uncertainty from a list of (uncertainty contribution, argument) pairs.'''
+    creg = self._CORRREGISTRY
+    related = self._related_arguments( dzs )
+
+    # uncorrelated pairs don't contribute, so we skip them to avoid
+    # doing quantity arithmetic for every pair of arguments.
+    dz = 0
+    for dzx,x in dzs:
+      for dzy,y in related(x):
+        r = creg.correlation(x,y)
+        if r != 0:
+          dz += r * dzx * dzy
+    if dz < 0:
+      # fully correlated contributions that cancel can leave a (tiny) negative variance from rounding.
+      dz = dz*0
+    return special_square_root(dz)
+
+  def _related_arguments(self, dzs):
+    '''Return a function that gives the entries of a list of (value, argument) pairs
+       whose argument may be correlated with a quantity (in their original order).
+
+       For a few arguments, that is just the whole list. For many arguments (i.e. a lazy
+       expression graph with many leaves), the registry is asked for the quantity's
+       dependencies instead of checking every pair of arguments.'''
+    if len(dzs) <= 8:
+      return lambda v: dzs
+
+    positions = dict()
+    for k,(d,y) in enumerate(dzs):
+      positions.setdefault( id(y), [] ).append(k)
+
+    def related(v):
+      ks = list( positions.get( id(v), () ) )
+      for u in self._CORRREGISTRY.dependencies(v):
+        ks.extend( positions.get( id(u), () ) )
+      return [ dzs[k] for k in sorted(set(ks)) ]
+
+    return related
+
+  def _register_correlations(self, z, dz, dzs):
+    '''Set the correlations for a result z with uncertainty dz, computed from a list of
+       (uncertainty contribution, argument) pairs.'''
+    creg = self._CORRREGISTRY
+
+    # the result may be correlated to each of the inputs, but
+    # may also be correlated to all of the quantities that the inputs are correlated to.
+
+    try:
+      # WORKAROUND
+      # always store correlations as float, even if inputs parameters
+      # are decimal.Decimal.
+      ratios = [ float(dzy / dz) for dzy,y in dzs ]
+    except ZeroDivisionError:
+      # if dz is zero, then z is not correlated to anything
+      ratios = [ 0.0 for dzy,y in dzs ]
+
+    ratios = [ (ratio,y) for ratio,(dzy,y) in zip(ratios,dzs) ]
+    related = self._related_arguments( ratios )
+
+    def correlation(v):
+      r = 0.0
+      for ratio,y in related(v):
+        if ratio != 0:
+          r += ratio * creg.correlation( v, y )
+      return r
+
+    # collect the correlations first (by object id, since the same quantity
+    # may be an input and a dependency), so that the lineage limits can be applied.
+    correlations = dict()
+    for dzx,x in dzs:
+      if not isuncertain(x):
+        continue
+      correlations[id(x)] = (x,correlation(x))
+      for v in creg.dependencies(x):
+        if id(v) not in correlations:
+          correlations[id(v)] = (v,correlation(v))
+    correlations = list(correlations.values())
+
+    if self.correlation_cutoff > 0 or self.max_dependencies is not None:
+      correlations = self._prune_lineage( correlations )
+
+    for v,r in correlations:
+      creg.correlated( z, v, r )
+
+  def _prune_lineage(self, correlations):
+    '''Drop the correlations of a new result that are smaller than the correlation cutoff,
+       and all but the largest max_dependencies correlations.'''
+    keep = []
+    dropped = []
+    for v,r in correlations:
+      if abs(r) < self.correlation_cutoff:
+        dropped.append(r)
+      else:
+        keep.append( (v,r) )
+
+    if self.max_dependencies is not None and len(keep) > self.max_dependencies:
+      keep.sort( key = lambda vr: -abs(vr[1]) )
+      dropped += [ r for v,r in keep[self.max_dependencies:] ]
+      keep = keep[:self.max_dependencies]
+
+    if dropped:
+      self._lineage_pruned += len(dropped)
+      self._lineage_max_pruned = max( self._lineage_max_pruned, max( abs(r) for r in dropped ) )
+
+    return keep
+
+  def compact(self, cutoff = None):
+    '''Remove all correlations in the registry that are smaller than cutoff (the convention's
+       correlation_cutoff by default). Returns the number of correlations that were removed.'''
+    if cutoff is None:
+      cutoff = self.correlation_cutoff
+    removed,largest = self._CORRREGISTRY.prune( cutoff )
+    self._lineage_compacted += removed
+    if removed:
+      self._lineage_max_pruned = max( self._lineage_max_pruned, largest )
+    return removed
+
+  def lineage_info(self):
+    '''Return statistics on the correlations that were dropped by the lineage limits and compact().
+       max_pruned is the largest (absolute) correlation coefficient that was dropped. Neglecting a correlation r
+       between two quantities changes the variance of a result computed from both by at most 2*|r|*dz1*dz2,
+       where dz1 and dz2 are the uncertainty contributions of the two quantities.'''
+    return LineageInfo( self._lineage_pruned, self._lineage_compacted, self._lineage_max_pruned )
+
+  def __propagate_operator__(self, name, a, b):
+    '''Propagates error through one of the arithmetic operators (add, sub, mul, truediv, pow).
+
+       Operators are the hot path for uncertain quantities, so if both operands are plain
+       floats underneath, and the propagator has a closed form for the operator, the
+       result is computed directly from the magnitudes. Otherwise (offset units, Decimal
+       magnitudes, arrays, ...), it falls back to __propagate_errors__.
+
+       In lazy mode, the operation is recorded instead, see __evaluate_lazy__.'''
+    if self.LazyPropagator is not None and not self._has_arrays( (a,b), {} ):
+      return self.UncertainQuantity._lazy( name, a, b )
+
+    z = self._propagate_operator_magnitudes( name, a, b )
+    if z is None:
+      z = self.__propagate_errors__( OPERATORS[name], (a,b) )
+    return z
+
+  def __evaluate_lazy__(self, z):
+    '''Evaluate a lazy uncertain quantity.
+
+       The operations recorded in z (and the lazy quantities it was computed from) form an expression
+       graph whose leaves are the (not lazy) uncertain quantities they were computed from. Error is
+       propagated through the whole graph with a single call to the lazy propagator, and the result
+       is only correlated to the leaves (and their dependencies), so the intermediate results are never
+       evaluated or added to the correlation registry. Once a lazy quantity is evaluated, its expression is dropped
+       and it is a leaf of the graphs that use it, like an eager result. Its correlations with the leaves (and their
+       dependencies) are registered, so an expression that uses several evaluated quantities still accounts for their
+       shared leaves, and the cost of evaluating a result does not grow with the number of results it was computed from.'''
+    UQ = self.UncertainQuantity
+
+    # order the graph so that each operation comes after its operands.
+    # this is done without recursion since the graph for a long loop can be very deep.
+    leaves = []
+    nodes = []
+    seen = set()
+    stack = [ (z,False) ]
+    while stack:
+      x,expanded = stack.pop()
+      if expanded:
+        nodes.append(x)
+        continue
+      if not isinstance(x,UQ) or id(x) in seen:
+        continue
+      seen.add(id(x))
+      if x._expr is None:
+        leaves.append(x)
+      else:
+        name,a,b = x._expr
+        stack.append( (x,True) )
+        stack.append( (b,False) )
+        stack.append( (a,False) )
+
+    def f(*args):
+      values = dict( (id(x),v) for x,v in zip(leaves,args) )
+      for x in nodes:
+        name,a,b = x._expr
+        a = values[id(a)] if isinstance(a,UQ) else a
+        b = values[id(b)] if isinstance(b,UQ) else b
+        values[id(x)] = OPERATORS[name]( a, b )
+      return values[id(z)]
+
+    zbar,dzs = self.LazyPropagator.__propagate_errors__( f, *leaves )
+    dzs = [ ( dzs[k], leaves[k] ) for k in dzs ]
+    dz = self._total_uncertainty( dzs )
+
+    tmp = UQ(zbar,dz)
+    z._store( tmp.nominal, tmp.uncertainty )
+    self._register_correlations( z, dz, dzs )
+
+  def _operand(self, x):
+    '''Return the magnitude, uncertainty magnitude and units of an operand, or None if
+       it is not supported by the operator fast path.'''
+    if isinstance( x, self.UncertainQuantity ):
+      if x._unc_unit is not x._unit:
+        return None
+      m,u,units = x._nom_mag,x._unc_mag,x._unit
+    elif isinstance( x, self.UncertainQuantity.Quantity ):
+      m,u,units = x._magnitude,0,x.units
+    else:
+      m,u,units = x,0,None
+
+    if type(m) not in (float,int) or type(u) not in (float,int):
+      return None
+    return m,u,units
+
+  def _operator_units(self, name, ua, ub, a, b):
+    '''Return the units of an operator's result, the units of its uncertainty and the factor that
+       converts b to the units of a (for add and sub), or None if the operator fast path can't be used.
+       Results are cached, since only a few different combinations of units are normally used.'''
+    key = (name,ua,ub,b) if name == 'pow' else (name,ua,ub,ua is None and a == 0,ub is None and b == 0)
+    # None is cached for unsupported operations, so False marks a miss.
+    result = self._OPERATOR_UNITS.get( key, False )
+    if result is not False:
+      return result
+
+    Q_ = self.UncertainQuantity.Quantity
+    result = None
+    try:
+      qa = Q_( 1.0, ua ) if ua is not None else 1.0
+      qb = Q_( 1.0, ub ) if ub is not None else 1.0
+      for q in (qa,qb):
+        # offset units need special care that only pint knows about
+        if hasattr(q,'_is_multiplicative') and not q._is_multiplicative:
+          raise ValueError()
+
+      factor = 1.0
+      if name in ('add','sub'):
+        # zero can be added to, or subtracted from, anything
+        if ub is None and b == 0:
+          qz = qa
+        elif ua is None and a == 0:
+          qz = qb
+        else:
+          factor = Q_(qb).to( Q_(qa).units ).magnitude
+          qz = qa
+      elif name == 'pow':
+        if ub is not None:
+          raise ValueError()
+        qz = qa**b
+      else:
+        qz = OPERATORS[name]( qa, qb )
+
+      # the operator should not have scaled the magnitude, i.e. by reducing units
+      if name != 'pow' and magof(qz) != 1.0:
+        raise ValueError()
+
+      unit = self.UncertainQuantity._intern( Q_(qz).units )
+      try:
+        unc_unit = Q_( 1, 'delta_'+str(unit) ).units
+      except:
+        unc_unit = unit
+      unc_unit = self.UncertainQuantity._intern( unc_unit )
+      result = (unit,unc_unit,factor)
+    except Exception:
+      result = None
+
+    self._OPERATOR_UNITS.put( key, result )
+    return result
+
+  def _propagate_operator_magnitudes(self, name, a, b):
+    '''Compute the result of an operator directly from the operand magnitudes.'''
+    propagator = self.ErrorPropagator
+    pa,pb = self._operand(a),self._operand(b)
+    if pa is None or pb is None:
+      return None
+    (ma,da,ua),(mb,db,ub) = pa,pb
+    if name == 'pow' and db != 0:
+      return None
+
+    # units are hashable, but a fractional exponent may not be
+    try:
+      units = self._operator_units( name, ua, ub, ma, mb )
+    except TypeError:
+      return None
+    if units is None:
+      return None
+    unit,unc_unit,factor = units
+
+    try:
+      result = propagator.__propagate_operator__( name, ma, da, mb*factor, db*factor )
+    except (ArithmeticError,ValueError,TypeError):
+      return None
+    if result is None:
+      return None
+    zbar,dza,dzb = result
+    if type(zbar) not in (float,int):
+      return None
+
+    dzs = []
+    if da != 0:
+      dzs.append( (dza,a) )
+    if db != 0:
+      dzs.append( (dzb,b) )
+
+    dz = self._total_uncertainty( dzs )
+    z = self.UncertainQuantity._from_magnitudes( zbar, dz, unit, unc_unit )
+    self._register_correlations( z, dz, dzs )
+
+    return z
+
+  def _propagate_compiled_magnitudes(self, propagator, f, args, kwargs):
+    '''Evaluate a compiled function directly from the magnitudes of its inputs, like the operator fast path.
+       Uncertain quantity arrays (and exact arrays) are evaluated element-wise, with the kernel replayed on their
+       magnitude arrays. Exact scalars and other constants are part of the kernel. Returns None unless all
+       inputs have float magnitudes and multiplicative units.'''
+    import numpy
+    magnitudes = dict()
+    scales = dict()
+    dzs = []
+    arrays = False
+    for k,x in itertools.chain( enumerate(args), kwargs.items() ):
+      if not _is_kernel_input(x):
+        # a constant of the kernel
+        continue
+      if isinstance( x, self.UncertainQuantityArray ):
+        if x._unc_unit != x._unit:
+          return None
+        magnitudes[k] = x._nom
+        scales[k] = x._unc
+        dzs.append( (k,x) )
+        arrays = True
+        continue
+      if not isuncertain(x):
+        # an exact array
+        magnitudes[k] = numpy.asarray( magof(x), dtype=float )
+        arrays = True
+        continue
+
+      if isinstance( x, self.UncertainQuantity ):
+        x._evaluated()
+      p = self._operand(x)
+      if p is None:
+        return None
+      magnitudes[k] = float(p[0])
+      if p[1] != 0:
+        scales[k] = p[1]
+        dzs.append( (k,x) )
+
+    kernel,units,Quantity = propagator.kernel( f, args, kwargs )
+    units = self._compiled_units( units )
+    if units is None:
+      return None
+    unit,unc_unit = units
+
+    zbar,contributions = propagator.evaluate( kernel, magnitudes, scales )
+    dzs = [ (contributions[k],x) for k,x in dzs ]
+
+    if arrays:
+      return self._combine_array_magnitudes( zbar, dzs, unit, unc_unit )
+
+    if type(zbar) is not float:
+      return None
+    dz = self._total_uncertainty( dzs )
+    z = self.UncertainQuantity._from_magnitudes( zbar, dz, unit, unc_unit )
+    self._register_correlations( z, dz, dzs )
+
+    return z
+
+  def _combine_array_magnitudes(self, zbar, dzs, unit, unc_unit):
+    '''Same as __combine_array_errors__, for the magnitudes of the result and uncertainty contributions.'''
+    import numpy
+    creg = self._CORRREGISTRY
+
+    dz = 0.0
+    for dzx,x in dzs:
+      for dzy,y in dzs:
+        r = creg.correlation(x,y)
+        if numpy.any( r != 0 ):
+          dz = dz + r * dzx * dzy
+    zbar,dz = numpy.broadcast_arrays( numpy.asarray(zbar,dtype=float), numpy.sqrt(dz) )
+    z = self.UncertainQuantityArray._from_magnitudes( numpy.array(zbar), numpy.array(dz), unit, unc_unit )
+
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+      ratios = [ numpy.nan_to_num( dzy/z._unc, nan=0.0, posinf=0.0, neginf=0.0 ) for dzy,y in dzs ]
+
+    for dzx,x in dzs:
+      for v in [x] + list( creg.dependencies(x) ):
+        if isinstance( v, self.UncertainQuantityArray ) and v.shape != z.shape:
+          continue
+        r = 0.0
+        for ratio,(dzy,y) in zip(ratios,dzs):
+          r = r + ratio * creg.correlation( v, y )
+        creg.correlated( z, v, r )
+
+    return z
+
+  def _compiled_units(self, units):
+    '''Return the (interned) units and uncertainty units for the result of a compiled function, or None if
+       the result is not a quantity with multiplicative units. Results are cached with the operator units.'''
+    key = ('compiled',units)
+    result = self._OPERATOR_UNITS.get( key, False )
+    if result is not False:
+      return result
+
+    result = None
+    if units is not None:
+      q = self.UncertainQuantity.Quantity( 1.0, units )
+      if getattr(q,'_is_multiplicative',True):
+        unit = self.UncertainQuantity._intern( q.units )
+        result = (unit,unit)
+
+    self._OPERATOR_UNITS.put( key, result )
+    return result
+
+  def __propagate_array_errors__(self, f, args, kwargs = {}, propagator = None):
+    '''Propagates error through a function element-wise. At least one of the arguments
+       should be an uncertain quantity array, the function is evaluated on whole arrays.'''
+    if propagator is None:
+      propagator = self.ErrorPropagator
+
+    zbar,dzs= propagator.__propagate_errors__( f, *args, **kwargs )
+
+    return self.__combine_array_errors__( zbar, dzs, args, kwargs )
+
+  def __combine_array_errors__(self, zbar, dzs, args, kwargs = {}):
+    '''Same as __combine_errors__, but element-wise for uncertain quantity arrays.'''
+    import numpy
+
+    dzs = [ ( dzs[k], kwargs[k] if k in kwargs else args[k] ) for k in dzs ]
+
     creg = self._CORRREGISTRY
 
     # calculate the total uncertainty
+    # note: correlations may be arrays of element-wise coefficients here.
     dz = 0
     for dzx,x in dzs:
       for dzy,y in dzs:
-        dz += creg.correlation(x,y) * dzx * dzy
+        dz = dz + creg.correlation(x,y) * dzx * dzy
     dz = special_square_root(dz)
 
-    z = self.UncertainQuantity(zbar,dz)
+    z = self.UncertainQuantityArray(zbar,dz)
 
-    # set correlations for the result
-    # the result may be correlated to each of the inputs, but
-    # may also be correlated to all of the quantities that the inputs are correlated to.
+    # set correlations for the result.
+    # same as for scalar quantities, but coefficients are computed element-wise and
+    # elements with zero uncertainty are not correlated to anything.
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+      ratios = [ numpy.nan_to_num( magof( (dzy/dz).to('') ), nan=0.0, posinf=0.0, neginf=0.0 ) for dzy,y in dzs ]
 
     for dzx,x in dzs:
       r = 0.0
-      for dzy,y in dzs:
-        try:
-          # WORKAROUND
-          # always store correlations as float, even if inputs parameters
-          # are decimal.Decimal.
-          r += float(dzy / dz) * creg.correlation( x, y )
-        except ZeroDivisionError:
-          # if dz is zero, then z is not correlated to anything
-          break
+      for ratio,(dzy,y) in zip(ratios,dzs):
+        r = r + ratio * creg.correlation( x, y )
       creg.correlated( z, x, r )
 
       for v in creg.dependencies(x):
+        if isinstance( v, self.UncertainQuantityArray ) and v.shape != z.shape:
+          # element-wise correlations with an array of another shape (i.e. an earlier result of a scalar argument)
+          continue
         r = 0.0
-        for dzy,y in dzs:
-          try:
-            r += float(dzy / dz) * creg.correlation( v, y )
-          except ZeroDivisionError:
-            # if dz is zero, then z is not correlated to anything
-            break
+        for ratio,(dzy,y) in zip(ratios,dzs):
+          r = r + ratio * creg.correlation( v, y )
         creg.correlated( z, v, r )
 
     return z
 
+  def propagate_many(self, func, columns, chunk_size = 65536, propagator = None):
+    '''Propagate error through a function for many sets of arguments, and return an uncertain quantity array with the results.
+
+       columns is either a mapping of argument names to columns, or a sequence of argument tuples (rows).
+       A column can be an uncertain quantity array, a (nominal, uncertainty) tuple of arrays or quantities,
+       a sequence of uncertain quantities, or an array (or quantity) of exact values. Scalars are used for every row.
+
+       The function is evaluated on chunks of chunk_size rows at a time if it supports arrays, and once for each row
+       otherwise. Unlike calling a decorated function for each row, no uncertain quantity is created for each row and
+       nothing is added to the correlation registry, so the results are not correlated to their arguments. Correlations
+       between the arguments of a row are taken from the registry.'''
+    import numpy
+
+    if propagator is None:
+      propagator = self.ErrorPropagator
+    creg = self._CORRREGISTRY
+
+    if isinstance( columns, collections.abc.Mapping ):
+      keys = list(columns)
+      given = [ columns[k] for k in keys ]
+      values = [ self._column(x) for x in given ]
+      # correlations between uncertain quantity arrays (or scalars) are in the registry
+      pairs = [ (i,j) for i in range(len(keys)) for j in range(i+1,len(keys)) if isuncertain(given[i]) and isuncertain(given[j]) ]
+      correlations = dict( ( (i,j), creg.correlation( given[i], given[j] ) ) for i,j in pairs )
+    else:
+      rows = [ tuple(row) for row in columns ]
+      keys = list( range( len(rows[0]) if len(rows) > 0 else 0 ) )
+      given = [ [ row[i] for row in rows ] for i in keys ]
+      values = [ self._column(x) for x in given ]
+      correlations = dict()
+      for i in keys:
+        for j in keys[i+1:]:
+          if isinstance( values[i], self.UncertainQuantityArray ) and isinstance( values[j], self.UncertainQuantityArray ):
+            correlations[(i,j)] = numpy.array( [ float( creg.correlation( x, y ) ) for x,y in zip( given[i], given[j] ) ] )
+    correlations = dict( (ij,r) for ij,r in correlations.items() if numpy.any( numpy.asarray(r) != 0 ) )
+
+    if len(keys) == 0:
+      # no rows (or no arguments), there is nothing to evaluate.
+      return self.UncertainQuantityArray( numpy.zeros(0), numpy.zeros(0) )
+
+    n = max( [ len(x) for x in values if numpy.ndim(x) > 0 ] or [1] )
+    if chunk_size is None:
+      chunk_size = n
+
+    def evaluate(index):
+      # index is a slice (a chunk of rows) or an int (a single row)
+      args = [ x[index] if numpy.ndim(x) > 0 else x for x in values ]
+      kwargs = dict( (k,x) for k,x in zip(keys,args) if isinstance(k,str) )
+      args = [ x for k,x in zip(keys,args) if not isinstance(k,str) ]
+      return propagator.__propagate_errors__( func, *args, **kwargs )
+
+    vectorized = True
+    units = None
+    noms = []
+    uncs = []
+    for a in range( 0, n, chunk_size ):
+      b = min( a + chunk_size, n )
+      entries = None
+      if vectorized:
+        try:
+          entries = [ evaluate( slice(a,b) ) ]
+        except (TypeError,ValueError):
+          # the function does not support arrays, evaluate it for each row instead.
+          vectorized = False
+      if entries is None:
+        entries = [ evaluate(r) for r in range(a,b) ]
+
+      for zbar,dzs in entries:
+        if units is None:
+          units = unitsof(zbar)
+        m = b - a if vectorized else 1
+        noms.append( numpy.broadcast_to( self._magnitude( zbar, units ), (m,) ) )
+        uncs.append( [ numpy.broadcast_to( self._magnitude( dzs.get(k,0.0), units ), (m,) ) for k in keys ] )
+
+    nom = numpy.concatenate( noms ) if noms else numpy.zeros(0)
+    dzs = [ numpy.concatenate( [ u[i] for u in uncs ] ) if uncs else numpy.zeros(0) for i in range(len(keys)) ]
+
+    # total uncertainty, with the correlations between the arguments of each row
+    var = sum( [ dz**2 for dz in dzs ], numpy.zeros(len(nom)) )
+    for (i,j),r in correlations.items():
+      var = var + 2*r*dzs[i]*dzs[j]
+    unc = numpy.sqrt( numpy.clip( var, 0, None ) )
+
+    if units is None:
+      return self.UncertainQuantityArray( nom, unc )
+    return self.UncertainQuantityArray( self.UncertainQuantity.Quantity( nom, units ), self.UncertainQuantity.Quantity( unc, units ) )
+
+  def _column(self, x):
+    '''Convert a column of arguments for propagate_many to an uncertain quantity array (or an array of exact values).'''
+    import numpy
+
+    if isinstance( x, self.UncertainQuantityArray ) or isinstance( x, self.UncertainQuantity.Quantity ) or isinstance( x, numpy.ndarray ):
+      return x
+    if isinstance( x, tuple ) and len(x) == 2:
+      return self.UncertainQuantityArray( x[0], x[1] )
+    if not isinstance( x, (list,tuple) ):
+      return x
+
+    units = None
+    for v in x:
+      units = unitsof( nominal(v) )
+      if units is not None:
+        break
+    nom = [ self._magnitude( nominal(v), units ) for v in x ]
+    if not any( isuncertain(v) for v in x ):
+      return numpy.array(nom) if units is None else self.UncertainQuantity.Quantity( numpy.array(nom), units )
+
+    unc = [ self._magnitude( uncertainty(v), units ) for v in x ]
+    if units is None:
+      return self.UncertainQuantityArray( nom, unc )
+    return self.UncertainQuantityArray( self.UncertainQuantity.Quantity( numpy.array(nom,dtype=float), units ), self.UncertainQuantity.Quantity( numpy.array(unc,dtype=float), units ) )
+
+  def _magnitude(self, q, units):
+    '''Return the magnitude of a quantity in units. Uncertainties (which may be in delta units) are converted by magnitude only.'''
+    if units is None or unitsof(q) is None:
+      return magof(q)
+    if unitsof(q) != units:
+      try:
+        q = q.to(units)
+      except Exception:
+        # uncertainties of quantities with offset units are in delta units
+        q = q.to( 'delta_'+str(units) )
+    return magof(q)
+
   def __round__( self, uq, n = None ):
     '''Round an uncertain quantity based on the following conventions
        1. Normally, uncertainty should be rounded to one significant figure.
@@ -90,12 +775,38 @@ class UncertaintyConvention(object):
        3. The nominal value should be rounded to the same decimal position as the uncertainty.
     '''
 
+    if isinstance( uq, self.UncertainQuantityArray ):
+      # arrays are rounded numerically, all elements at once.
+      import numpy
+      nom,unc,exponent = self._round_arrays( uq._nom, uq._unc, n )
+      rnom,runc = scale10(nom,exponent), scale10(unc,exponent)
+      # coefficients with more digits than a float holds (or exponents without an exact power of 10) would be
+      # rounded twice by the rescale, so these elements are converted from their Decimals, like the scalar path.
+      inexact = ~( (numpy.abs(nom) < 2**53) & (numpy.abs(unc) < 2**53) & (numpy.abs(exponent) <= 22) ) & numpy.isfinite(unc)
+      for i in numpy.flatnonzero( inexact ):
+        dn,du = self._round_decimals( decimal.Decimal(str(uq._nom.flat[i])), decimal.Decimal(str(uq._unc.flat[i])), n )
+        rnom.flat[i] = float(dn)
+        runc.flat[i] = float(du)
+      return uq._from_magnitudes( rnom, runc, uq._unit, uq._unc_unit )
+
     # we use the Decimal class to handle rounding correctly
     # we converting to a string first allows this to work with float and Decimal types
     # without losing precision 
     nom = decimal.Decimal(str(uq.nominal.magnitude))
     unc = decimal.Decimal(str(uq.error.magnitude))
 
+    nom,unc = self._round_decimals( nom, unc, n )
+
+    # now create quantities for the nominal and uncertainty, making sure to use the same types for each magnitude that were used in uq.
+    nom = uq.Quantity( type(uq.nominal.magnitude)(nom), uq.nominal.units )
+    unc = uq.Quantity( type(uq.error.magnitude)(unc), uq.error.units )
+
+
+    return uq.make( nom, unc )
+
+  def _round_decimals( self, nom, unc, n = None ):
+    '''Round a Decimal nominal value and uncertainty with the conventions of __round__. Returns the rounded (nom, unc).'''
+
     # if n was not given, then we round uncertainty to 1 sigfig.
     ndig = n
     if ndig is None:
@@ -139,13 +850,347 @@ class UncertaintyConvention(object):
     # now round nominal value to the same decimal position as the uncertainty.
     nom = nom.quantize(unc)
 
+    return nom, unc
+
+  def _round_arrays( self, nom, unc, n = None ):
+    '''Round float arrays of nominal values and uncertainties with the conventions of __round__,
+       using arithmetic instead of Decimal strings.
+
+       Returns the rounded nominal values and uncertainties as integer coefficients (stored in float arrays)
+       and the decimal exponent of their last digit, i.e. the rounded uncertainty is unc*10**exponent.
+       The results are the same as _round_decimals (applied to the string representation of each float).
+       Exact ties are rounded half up for the uncertainty and half to even for the nominal value, and
+       the few elements that are too close to a tie to decide with float arithmetic (or that have too many
+       digits, or a decimal exponent beyond the exact powers of 10) are rounded with _round_decimals.'''
+    import numpy
+
+    nom = numpy.asarray( nom, dtype=float )
+    unc = numpy.abs( numpy.asarray( unc, dtype=float ) )
+    nom,unc = numpy.broadcast_arrays( nom, unc )
+    zero = unc == 0
+    finite = numpy.isfinite(unc) & ~zero
+    ones = numpy.where( finite, unc, 1 )
+
+    with numpy.errstate(divide='ignore',invalid='ignore',over='ignore'):
+      # decimal exponent of the leading digit. log10 can be off by one near powers of 10.
+      e = numpy.floor( numpy.log10( ones ) )
+      lead = scale10( ones, -e )
+      e = numpy.where( lead >= 10, e + 1, numpy.where( lead < 1, e - 1, e ) )
+      lead = scale10( ones, -e )
+
+      if n is None:
+        # keep 2 sigfigs if the leading digit is 1 (after rounding to 11 sigfigs, like _round_decimals)
+        lead = numpy.round( lead, 10 )
+        ndig = numpy.where( (numpy.floor(lead) == 1) | (lead >= 10), 2, 1 )
+        unsure = (numpy.abs(lead - 2) < 1e-9) | (numpy.abs(lead - 10) < 1e-9)
+      else:
+        ndig = numpy.full( unc.shape, n )
+        unsure = numpy.zeros( unc.shape, dtype=bool )
+
+      # the uncertainty, scaled to have ndig digits before the decimal point
+      k = ndig - 1 - e
+      s = scale10( unc, k )
+      q = round_half( s, even = False )
+      # rounding can carry into the next decade (i.e. 0.96 -> 1)
+      carry = q >= scale10( numpy.ones_like(q), ndig )
+      q = numpy.where( carry, q/10, q )
+      k = numpy.where( carry, k - 1, k )
+
+      # a zero uncertainty keeps the (single) decimal place of its string representation
+      k = numpy.where( zero, 1, k )
+      q = numpy.where( zero, 0., q )
+
+      # now round nominal value to the same decimal position as the uncertainty.
+      t = scale10( nom, k )
+      p = round_half( t, even = True )
+
+      # powers of 10 beyond 10**22 are not exact, so the scaled values are not either.
+      unsure |= near_half( s ) | near_half( t ) | (numpy.abs(t) >= 1e12) | (numpy.abs(k) > 22)
+      unsure &= finite | zero
+
+    q = numpy.where( finite | zero, q, numpy.nan )
+    p = numpy.where( finite | zero, p, numpy.nan )
+    exponent = numpy.where( finite | zero, -k, 0 ).astype(int)
+
+    for i in numpy.flatnonzero( unsure ):
+      dn,du = self._round_decimals( decimal.Decimal(str(nom.flat[i])), decimal.Decimal(str(unc.flat[i])), n )
+      exponent.flat[i] = du.as_tuple().exponent
+      p.flat[i] = float( dn.scaleb( -int(exponent.flat[i]) ) )
+      q.flat[i] = float( du.scaleb( -int(exponent.flat[i]) ) )
+
+    return p, q, exponent
+
+  def _format_spec( self, units, fmtspec ):
+    '''Return the value format spec, number of significant figures, template (with the units formatted)
+       and separator used to format uncertain quantities in units with fmtspec. Results are cached,
+       since only a few different combinations are normally used.'''
+    key = (units,fmtspec)
+    try:
+      return self._FORMAT_SPECS[key]
+    except KeyError:
+      pass
 
-    # now create quantities for the nominal and uncertainty, making sure to use the same types for each magnitude that were used in uq.
-    nom = uq.Quantity( type(uq.nominal.magnitude)(nom), uq.nominal.units )
-    unc = uq.Quantity( type(uq.error.magnitude)(unc), uq.error.units )
-
-
-    return uq.make( nom, unc )
+    # split the format spec into its value specific and unit specific parts
+    v_fmtspec = fmtspec.replace('Lx','')
+    v_fmtspec = pint.formatting.remove_custom_flags(v_fmtspec)
+    u_fmtspec = fmtspec.replace(v_fmtspec,'')
+
+    # get number of sigfigs requested
+    psre = re.compile(r'\.([0-9]+)')
+    match = psre.search( v_fmtspec )
+    nsig = None
+    if match:
+      nsig = match.group(1)
+      nsig = int(nsig)
+      if nsig < 0:
+        nsig = 0
+
+    # now we can remove the precision spec
+    v_fmtspec = psre.sub( r'', v_fmtspec )
+
+    # Use pint to create a template string with the units already formatted
+    # by creating a quantity with a string replacement (%s) as a magnitude.
+    tmpl = ('{:'+u_fmtspec+'}').format( self.UncertainQuantity.Quantity( '%s', units ) )
+
+    sepstr = ' +/- '
+    if 'Lx' in u_fmtspec:
+      sepstr = ' +- '
+
+    spec = ( '{:%s}%s{:%s}'%(v_fmtspec,sepstr,v_fmtspec), nsig, tmpl )
+    self._FORMAT_SPECS[key] = spec
+    return spec
+
+  def _format_magnitudes( self, nom, unc, units, fmtspec ):
+    '''Format an uncertain quantity, given the magnitudes of its nominal value and uncertainty (in units).'''
+    # An uncertain quantity should be formatted so that the
+    # nominal value matches the decimal position of the uncertainty (Taylor, 1997).
+    #
+    # In general, the uncertainty should be rounded to 1 significant figure when displayed (Taylor, 1997).
+    #
+    # However, if the leading significant figure is '1', two significant figures may be retained (Taylor, 1997).
+    #
+    # So, for an uncertain quantity, we interpret the precision spec in the format string to be the
+    # number of significant figures that should be displayed in the uncertainty, rather than the number
+    # of figures after the decimal point. The nominal value's precision will set to match
+    # the uncertainties. _round_decimals does this, with the Decimal type.
+    #
+    # Pint already handles formatting of units (and does a nice job), so we just need to format the value portion.
+    valspec,nsig,tmpl = self._format_spec( units, fmtspec )
+    nom,unc = self._round_decimals( decimal.Decimal(str(nom)), decimal.Decimal(str(unc)), nsig )
+    return tmpl % valspec.format(nom,unc)
+
+  def iformat_many( self, values, fmtspec = '' ):
+    '''Generate the formatted strings for many uncertain quantities, i.e. an uncertain quantity array.
+       Each string is the same as '{:fmtspec}'.format(value), but the unit and format spec handling is
+       only done once for the whole array.'''
+    # pandas columns (and arrays) of uncertain quantities
+    values = getattr( values, 'array', values )
+    if hasattr( values, 'to_uncertainquantityarray' ):
+      values = values.to_uncertainquantityarray()
+
+    if hasattr( self, '__format_uncertainquantity__' ):
+      # formatting is overloaded by the convention
+      for x in values:
+        yield ('{:'+fmtspec+'}').format(x)
+      return
+
+    if isinstance( values, self.UncertainQuantityArray ):
+      units = values._unit
+      valspec,nsig,tmpl = self._format_spec( units, fmtspec )
+      # the whole array is rounded at once, so only the Decimals need to be created for each element.
+      nom,unc = values._nom.ravel(),values._unc.ravel()
+      rnom,runc,exponent = self._round_arrays( nom, unc, nsig )
+      for x,dx,p,q,e in zip( nom.tolist(), unc.tolist(), rnom.tolist(), runc.tolist(), exponent.tolist() ):
+        if not abs(p) < 2**53:
+          # nan, or too many digits for a float
+          yield self._format_magnitudes( x, dx, units, fmtspec )
+          continue
+        p = decimal.Decimal( int(abs(p)) ).scaleb( e )
+        if math.copysign( 1, x ) < 0:
+          p = p.copy_negate()
+        yield tmpl % valspec.format( p, decimal.Decimal( int(q) ).scaleb( e ) )
+      return
+
+    for x in values:
+      if isinstance( x, self.UncertainQuantity ):
+        x._evaluated()
+        yield self._format_magnitudes( x._nom_mag, x._unc_mag, x._unit, fmtspec )
+      else:
+        yield ('{:'+fmtspec+'}').format(x)
+
+  def format_many( self, values, fmtspec = '' ):
+    '''Return a list with the formatted strings for many uncertain quantities, see iformat_many.'''
+    return list( self.iformat_many( values, fmtspec ) )
+
+  def write_many( self, stream, columns, fmtspec = '', delimiter = ', ', header = True, chunk_size = 10000 ):
+    '''Write many uncertain quantities to a stream (i.e. an open file), one per line, without
+       building the whole report in memory.
+
+       columns can be a single column (an uncertain quantity array or sequence of uncertain quantities),
+       or a mapping of column names to columns, in which case each line is a row of the table, with
+       entries separated by delimiter, and the column names are written first if header is True.
+       Lines are written in chunks of chunk_size. Returns the number of rows written.'''
+    if isinstance( columns, collections.abc.Mapping ):
+      if header:
+        stream.write( delimiter.join( str(k) for k in columns ) + '\n' )
+      rows = zip( *[ self.iformat_many( columns[k], fmtspec ) for k in columns ] )
+      lines = ( delimiter.join(row) for row in rows )
+    else:
+      lines = self.iformat_many( columns, fmtspec )
+
+    n = 0
+    while True:
+      chunk = list( itertools.islice( lines, chunk_size ) )
+      if len(chunk) == 0:
+        break
+      stream.write( '\n'.join(chunk) + '\n' )
+      n += len(chunk)
+    return n
+
+  def parse_many( self, strings ):
+    '''Parse many strings like "9.81 +/- 0.02 m/s^2" or "1.5 +- 1 %" (i.e. a column read from a CSV file)
+       into an uncertain quantity array, with the units of the first string.
+
+       Strings are interpreted the same way as UncertainQuantity(string), but each one is only tokenized with
+       a single compiled pattern. Units are parsed once for each distinct unit string, and the strings that share
+       units are converted all at once with NumPy. Strings that don't match the pattern are parsed by UncertainQuantity.'''
+    import numpy
+
+    # (nominal units, uncertainty units) -> (indices, nominal values, uncertainties)
+    groups = collections.OrderedDict()
+    n = 0
+    match = PARSE_PATTERN.match
+    for i,text in enumerate(strings):
+      n += 1
+      m = match(text)
+      if m is None:
+        q = self.UncertainQuantity(text)
+        key,nom,unc = (q._unit,q._unc_unit),q._nom_mag,q._unc_mag
+      else:
+        nom,nomu,unc,pct,uncu = m.group('nom','nomu','unc','pct','uncu')
+        nomu,uncu = nomu or '',uncu or ''
+        if unc is None:
+          unc,uncu = '0',''
+        # same rules as parse_string
+        if nomu == '':
+          nomu = uncu
+        if nomu == '':
+          nomu = 'dimensionless'
+        if pct:
+          uncu = 'percent'
+        elif uncu == '':
+          uncu = 'dimensionless'
+        key = (nomu,uncu)
+
+      try:
+        group = groups[key]
+      except KeyError:
+        group = groups[key] = ([],[],[])
+      group[0].append(i)
+      group[1].append(nom)
+      group[2].append(unc)
+
+    if n == 0:
+      return self.UncertainQuantityArray( numpy.zeros(0) )
+
+    nom = numpy.empty(n)
+    unc = numpy.empty(n)
+    result = None
+    for (nomu,uncu),(index,noms,uncs) in groups.items():
+      Q_ = self.UncertainQuantity.Quantity
+      x = self.UncertainQuantityArray( Q_( numpy.array(noms,dtype=float), self._parse_units(nomu) ),
+                                       Q_( numpy.array(uncs,dtype=float), self._parse_units(uncu) ) )
+      if result is None:
+        result = x
+      elif x._unit != result._unit:
+        x = x.to( result._unit )
+      nom[index] = x._nom
+      unc[index] = x._unc
+
+    return result._from_magnitudes( nom, unc, result._unit, result._unc_unit )
+
+  def save( self, file, data, correlations = True ):
+    '''Save uncertain quantities in a compact binary file (see Storage), which can be loaded with load().
+
+       data is an uncertain quantity array (or a single uncertain quantity), or a mapping of names to them
+       (columns that propagate_many accepts, i.e. lists of uncertain quantities and pandas columns, can also be used).
+       Values are stored as float64. If correlations is True, the (element-wise) correlations between the
+       columns in the correlation registry are stored too. file can be a file name or an open binary file.'''
+    import numpy
+    from .Storage import write_dataset
+
+    single = not isinstance( data, collections.abc.Mapping )
+    if single:
+      data = { 'data' : data }
+
+    columns = []
+    objects = []
+    for name,x in data.items():
+      x = getattr( x, 'array', x )
+      if hasattr( x, 'to_uncertainquantityarray' ):
+        x = x.to_uncertainquantityarray()
+      if isinstance( x, self.UncertainQuantity ):
+        x._evaluated()
+        columns.append( (name, float(x._nom_mag), float(x._unc_mag), str(x._unit), str(x._unc_unit)) )
+      else:
+        x = self._column(x)
+        if not isinstance( x, self.UncertainQuantityArray ):
+          x = self.UncertainQuantityArray(x)
+        columns.append( (name, x._nom, x._unc, str(x._unit), str(x._unc_unit)) )
+      objects.append( (name,x) )
+
+    pairs = []
+    if correlations:
+      creg = self._CORRREGISTRY
+      for i,(xname,x) in enumerate(objects):
+        for yname,y in objects[i+1:]:
+          r = creg.correlation( x, y, 0 )
+          if numpy.any( numpy.asarray(r) != 0 ):
+            pairs.append( (xname,yname,r) )
+
+    if isinstance( file, (str,os.PathLike) ):
+      with open( file, 'wb' ) as f:
+        write_dataset( f, columns, pairs, single = single )
+    else:
+      write_dataset( file, columns, pairs, single = single )
+
+  def load( self, file, mmap_mode = None ):
+    '''Load uncertain quantities saved by save(). Returns what was saved: an uncertain quantity array
+       (or uncertain quantity), or a dict of names to them. Correlations that were saved are added to the correlation registry.
+
+       If mmap_mode is given ('r', 'r+' or 'c', see numpy.memmap), the arrays are memory maps of the file, so large
+       data sets open immediately and are only read from disk when they are used.'''
+    from .Storage import read_dataset
+
+    header,columns,correlations = read_dataset( file, mmap_mode )
+
+    UQ_ = self.UncertainQuantity
+    data = dict()
+    for name,records,units,unc_units in columns:
+      units,unc_units = UQ_._intern( self._parse_units(units) ),UQ_._intern( self._parse_units(unc_units) )
+      if records.ndim == 0:
+        data[name] = UQ_._from_magnitudes( float(records['nominal']), float(records['uncertainty']), units, unc_units )
+      else:
+        data[name] = self.UncertainQuantityArray._from_magnitudes( records['nominal'], records['uncertainty'], units, unc_units )
+
+    for x,y,r in correlations:
+      self._CORRREGISTRY.correlated( data[x], data[y], r )
+
+    if header.get('single'):
+      return data['data']
+    return data
+
+  def _parse_units( self, units ):
+    '''Return the pint units for a unit string, parsing each string only once.'''
+    if not isinstance( units, str ):
+      return units
+    try:
+      return self._PARSED_UNITS[units]
+    except KeyError:
+      pass
+    result = self.UncertainQuantity.Quantity( 1, units.replace('%','percent') ).units
+    self._PARSED_UNITS[units] = result
+    return result
 
   def __lt__( self, a, b ):
     '''Check that a is less than b.'''
@@ -163,8 +1208,19 @@ class UncertaintyConvention(object):
     z = abs( self.z(a,b) )
     return z <= 2
 
-  def calc_UncertainQuantity( self, data, round = False ):
-    '''Computes an uncertain quantity from a data set (computes the standard error)'''
+  def calc_UncertainQuantity( self, data, round = False, axis = None ):
+    '''Computes an uncertain quantity from a data set (computes the standard error)
+       For data sets that don't fit in memory, use RunningStatistics.
+
+       If data is a NumPy array (or a quantity wrapping one) of numbers, the mean and standard
+       error are computed with NumPy reductions. axis may then be given to reduce many data sets
+       at once, the result is an uncertain quantity array (with the other axes) in that case.'''
+    m = magof(data)
+    if getattr(m,'ndim',0) > 0 and getattr(m,'dtype',None) is not None and m.dtype.kind in 'biuf':
+      return self._calc_UncertainQuantity_array( m, unitsof(data), round, axis )
+    if axis is not None:
+      raise TypeError("axis can only be given for NumPy array data.")
+
     nominal = sum( data ) / len(data)
     variance = ( sum( [ (x - nominal)**2 for x in data ] ) / (len(data)-1) ) # Note: using the 'unbiased' estimate
     std_dev = special_square_root(variance)
@@ -176,14 +1232,139 @@ class UncertaintyConvention(object):
 
     return q
 
+  def _calc_UncertainQuantity_array( self, m, units, round, axis ):
+    '''Same as calc_UncertainQuantity, for the magnitudes of an array data set.'''
+    n = m.size if axis is None else m.shape[axis]
+    nominal = m.mean( axis=axis )
+    std_err = m.std( axis=axis, ddof=1 ) / n**0.5
+
+    def q(v):
+      return v if units is None else self.UncertainQuantity.Quantity( v, units )
+
+    if getattr(nominal,'ndim',0) > 0:
+      q = self.UncertainQuantityArray( q(nominal), q(std_err) )
+      if round:
+        q = self.__round__( q )
+      return q
+
+    q = self.UncertainQuantity( q(float(nominal)), q(float(std_err)) )
+    if round:
+      q = self.__round__( q )
+
+    return q
+
   calc_UQ = calc_UncertainQuantity
 
-  def WithError(self,func):
+  def calc_UncertainQuantity_grouped( self, values, keys ):
+    '''Computes an uncertain quantity (the mean, with the standard error as uncertainty) for each group of a data set.
+
+       values is an array (or a quantity wrapping one) of readings, and keys is an array of the same length that
+       gives the group (i.e. a channel or sample ID) of each reading. All groups are reduced at once with NumPy.
+       Returns the sorted unique keys, and an uncertain quantity array with the result for each key. Groups with a
+       single reading have a nan uncertainty.'''
+    import numpy
+
+    units = unitsof(values)
+    m = numpy.asarray( magof(values), dtype=float )
+    keys = numpy.asarray( keys )
+    if m.shape != keys.shape or m.ndim != 1:
+      raise ValueError("values and keys must be 1 dimensional arrays with the same length.")
+
+    groups,index = numpy.unique( keys, return_inverse=True )
+    index = index.ravel()
+    counts = numpy.bincount( index, minlength=len(groups) )
+    nominal = numpy.bincount( index, weights=m, minlength=len(groups) )/counts
+    # the squared deviations are computed from the group means (two passes) for accuracy.
+    squares = numpy.bincount( index, weights=( m - nominal[index] )**2, minlength=len(groups) )
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+      std_err = numpy.sqrt( squares/(counts-1) )/numpy.sqrt(counts)
+
+    if units is None:
+      return groups, self.UncertainQuantityArray( nominal, std_err )
+    Q_ = self.UncertainQuantity.Quantity
+    return groups, self.UncertainQuantityArray( Q_(nominal,units), Q_(std_err,units) )
+
+  calc_UQ_grouped = calc_UncertainQuantity_grouped
+
+  def WithError(self,func=None,executor=None,cache=None):
+    '''Decorator that propagates error through a function.
+
+       If an executor (i.e. a concurrent.futures.ThreadPoolExecutor) is given, the function
+       evaluations needed to propagate error are submitted to it and run concurrently. Use it
+       as @conv.WithError(executor=pool). A process pool can be used for module level functions, the arguments
+       are then pickled (with pint's application registry, so only units it knows can be used) and the results
+       are sent back as magnitudes. Executors require the convention's propagator to be a PositiveIntervalPropagator.
+
+       Coroutine functions (async def) are supported too, the decorated function is then
+       also a coroutine function, and the function evaluations are awaited concurrently.
+
+       If cache is given, the function evaluations for the last `cache` distinct sets of
+       arguments (compared by nominal value, uncertainty and units) are kept, and calling
+       the function again with the same arguments does not evaluate it. The result is still a new
+       uncertain quantity with its own correlations. The decorated function has cache_info()
+       and cache_clear() methods, like functools.lru_cache. Only use this for pure functions.'''
+
+    if func is None:
+      return lambda func: self.WithError(func,executor,cache)
+
+    propagator = None
+    if executor is not None:
+      if not isinstance( self.ErrorPropagator, PositiveIntervalPropagator ) or self.ErrorPropagator.batched:
+        raise TypeError("An executor can only be used with a (non-batched) PositiveIntervalPropagator, not {0}.".format(type(self.ErrorPropagator).__name__))
+      propagator = copy.copy(self.ErrorPropagator)
+      propagator.executor = executor
+      propagator.Quantity = self.UncertainQuantity.Quantity
+
+    if cache is not None:
+      cache = LRUCache(cache)
+
+    if iscoroutinefunction(func):
+      # the decorated function will be a coroutine function too.
+      async def wrapper(f,*args,**kwargs):
+        return await self.__propagate_errors_async__( f, args, kwargs, propagator, cache )
+    else:
+      def wrapper(f,*args,**kwargs):
+        return self.__propagate_errors__( f, args, kwargs, propagator, cache )
+
+    decorated = decorate(func,wrapper)
+    if cache is not None:
+      decorated.cache_info = cache.info
+      decorated.cache_clear = cache.clear
+
+    return decorated
+
+  def compile(self,func):
+    '''Decorator that propagates error through a function with a kernel that is traced on the first call.
+
+       The function is evaluated once (for each set of argument units) with tape variables, and the recorded
+       operations are then replayed on NumPy arrays of magnitudes for every call, with the derivatives computed
+       analytically. Use it instead of WithError for formulas that are evaluated many times, or on large
+       uncertain quantity arrays, which are evaluated element-wise on their magnitude arrays. Exact numbers and
+       quantities are constants of the kernel, so a new kernel is traced for each of their values.
+
+       The function must only use operations supported by the ReverseModePropagator. Functions that can not be
+       replayed from a trace (they compare their inputs, i.e. with if statements or min/max, or have unhashable
+       arguments) are evaluated with the convention's error propagator instead, like WithError. Functions of uncertain
+       quantity arrays must be element-wise, reductions (sum, mean, ...) and comparisons raise a TypeError.
+       See CompiledPropagator.'''
+
+    propagator = CompiledPropagator()
 
     def wrapper(f,*args,**kwargs):
-      return self.__propagate_errors__( f, args, kwargs )
+      try:
+        z = self._propagate_compiled_magnitudes( propagator, f, args, kwargs )
+        if z is None:
+          z = self.__propagate_errors__( f, args, kwargs, propagator )
+      except TraceError as e:
+        if any( isinstance( x, self.UncertainQuantityArray ) for x in itertools.chain( args, kwargs.values() ) ):
+          raise TypeError( "{0} Compiled functions of uncertain quantity arrays must be element-wise.".format(e) )
+        z = self.__propagate_errors__( f, args, kwargs )
+      return z
 
-    return decorate(func,wrapper)
+    decorated = decorate(func,wrapper)
+    decorated.kernels = propagator.kernels
+
+    return decorated
 
   def WithAutoError(self,sigfigs=3):
     '''Automatically calculate uncertainty in a function return value assuming all arguments are uncertain
@@ -288,10 +1469,12 @@ def build_uncertainquantity_class(conv, ureg):
   from .UncertainQuantity import _UncertainQuantity
 
   class UncertainQuantity(_UncertainQuantity):
-      pass
+      __slots__ = ()
 
   UncertainQuantity._CONVENTION = conv
   UncertainQuantity.Quantity    = ureg.Quantity
+  UncertainQuantity._DELTA_UNITS = dict()
+  UncertainQuantity._UNITS = dict()
 
   ureg.define('percent = 0.01 * radian = perc = %')
 
@@ -330,3 +1513,61 @@ def build_uncertainquantity_class(conv, ureg):
 
   
   return UncertainQuantity
+
+def build_uncertainquantityarray_class(conv, ureg):
+  from .UncertainQuantityArray import _UncertainQuantityArray
+
+  class UncertainQuantityArray(_UncertainQuantityArray):
+      pass
+
+  UncertainQuantityArray._CONVENTION = conv
+  UncertainQuantityArray.Quantity    = ureg.Quantity
+
+  # same as for UncertainQuantity, quantities need to return NotImplemented for uncertain arrays
+  # so that the UncertainQuantityArray __r* methods can take over.
+  UQA_ = UncertainQuantityArray
+  def disable_for_UQA(f):
+    def new_f(self,other):
+      if type(other) is UQA_:
+        return NotImplemented
+      return f(self, other)
+
+    return new_f
+
+  UncertainQuantityArray.Quantity.__add__ = disable_for_UQA( UncertainQuantityArray.Quantity.__add__ )
+  UncertainQuantityArray.Quantity.__sub__ = disable_for_UQA( UncertainQuantityArray.Quantity.__sub__ )
+  UncertainQuantityArray.Quantity.__mul__ = disable_for_UQA( UncertainQuantityArray.Quantity.__mul__ )
+  UncertainQuantityArray.Quantity.__div__ = disable_for_UQA( UncertainQuantityArray.Quantity.__div__ )
+  UncertainQuantityArray.Quantity.__truediv__ = disable_for_UQA( UncertainQuantityArray.Quantity.__truediv__ )
+
+  return UncertainQuantityArray
+
+def build_runningstatistics_class(conv, ureg):
+  from .RunningStatistics import _RunningStatistics
+
+  class RunningStatistics(_RunningStatistics):
+      pass
+
+  RunningStatistics._CONVENTION = conv
+  RunningStatistics.Quantity    = ureg.Quantity
+
+  return RunningStatistics
+
+def build_pandas_classes(conv, ureg):
+  from .PandasExtension import _UncertainQuantityDtype, _UncertainQuantityPandasArray
+
+  class UncertainQuantityDtype(_UncertainQuantityDtype):
+      pass
+
+  class UncertainQuantityPandasArray(_UncertainQuantityPandasArray):
+      pass
+
+  UncertainQuantityPandasArray._add_arithmetic_ops()
+
+  for cls in (UncertainQuantityDtype,UncertainQuantityPandasArray):
+    cls._CONVENTION = conv
+    cls.Quantity    = ureg.Quantity
+    cls._DTYPE      = UncertainQuantityDtype
+    cls._ARRAY      = UncertainQuantityPandasArray
+
+  return UncertainQuantityDtype, UncertainQuantityPandasArray
@@ -1,4 +1,4 @@
-import math, decimal, copy, sys
+import math, decimal, copy, sys, collections, threading
 
 
 
@@ -74,7 +74,48 @@ def sigfig_round( v, n = 2 ):
     return type(v)( float(dv) )
 
 
+def scale10( x, k ):
+  '''Multiply (an array) x by 10**k, for (arrays of) integers k.
+
+  Dividing by 10**-k for negative k gives the correctly rounded result, since
+  powers of 10 are exact floats (up to 10**22), but negative powers are not. Only the
+  selected operation is done for each element, so there are no spurious overflow warnings.'''
+  import numpy
+  k = numpy.asarray(k)
+  p = 10.0**numpy.abs(k)
+  return numpy.where( k >= 0, x*numpy.where( k >= 0, p, 1.0 ), x/numpy.where( k >= 0, 1.0, p ) )
+
+def near_half( x, ulps = 4 ):
+  '''Check if (an array) x is within a few ulps of a half integer.'''
+  import numpy
+  x = numpy.asarray( x, dtype=float )
+  return numpy.abs( x - numpy.floor(x) - 0.5 ) <= ulps*numpy.finfo(float).eps*numpy.maximum( numpy.abs(x), 1 )
+
+def round_half( x, even = False ):
+  '''Round (an array) x to integers, rounding ties half up (away from zero) or half to even.
+
+  x is normally a scaled decimal number (i.e. 0.25*10), so ties are detected with
+  a tolerance of a few ulps instead of exactly.'''
+  import numpy
+  x = numpy.asarray( x, dtype=float )
+  f = numpy.floor(x)
+  d = x - f
+  tie = near_half( x )
+  r = numpy.where( d > 0.5, f + 1, f )
+  if even:
+    t = numpy.where( numpy.fmod(f,2) == 0, f, f + 1 )
+  else:
+    t = numpy.where( x < 0, f, f + 1 )
+  return numpy.where( tie, t, r )
+
+
 def isuncertain(v):
+  # check the type first, hasattr on an instance evaluates properties, which
+  # can involve unit conversions.
+  t = type(v)
+  if hasattr( t, 'uncertainty' ) or hasattr( t, 'error' ) or hasattr( t, 'std_dev' ):
+    return True
+
   if hasattr( v, 'uncertainty' ):
     return True
   
@@ -130,5 +171,47 @@ def special_square_root(x):
     raise TypeError(f"Could not take the square root of {str(x)} (type: {type(x)}) to compute total uncertainty. The underlying type used for the input quantities are probably not supported by Pint.")
 
 
-
-
+CacheInfo = collections.namedtuple('CacheInfo', ['hits','misses','maxsize','currsize'])
+
+class LRUCache(object):
+  '''A least-recently-used cache with a maximum size and hit/miss statistics.
+     get() and put() may be called from multiple threads.'''
+
+  def __init__(self, maxsize = 128):
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key, default = None):
+    '''Return the entry for key, or default if it is not in the cache.'''
+    with self._lock:
+      try:
+        value = self._entries[key]
+      except KeyError:
+        self.misses += 1
+        return default
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    '''Add an entry, evicting the least recently used entry if the cache is full.'''
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def info(self):
+    return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
@@ -16,6 +16,8 @@ setup(
   download_url = f'https://github.com/CD3/pyErrorProp/archive/{VERSION}.tar.gz',
   keywords = ['physics', 'uncertainty', 'units'],
   install_requires = ['pint'],
+  # uncertain quantity arrays need NumPy, and the DataFrame columns need pandas.
+  extras_require = { 'arrays' : ['numpy'], 'pandas' : ['numpy','pandas'] },
   classifiers=[
     'Development Status :: 4 - Beta',
     'Intended Audience :: Developers',
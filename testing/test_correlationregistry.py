@@ -17,3 +17,102 @@ def test_construction():
   assert creg.correlation(x,y) == 0.6
 
   assert str(creg.matrix(x,y)) == '1.0 0.6 \n0.6 1.0 \n'
+
+def test_sparse_registry():
+  import gc
+  from pyErrorProp import SparseCorrelationRegistry
+
+  x = UQ_( '2 +/- 0.2 m/s' )
+  y = UQ_( '2 m/s +/- 1%' )
+  z = UQ_( '3 m/s +/- 1%' )
+
+  creg = SparseCorrelationRegistry( buffer_size = 2 )
+  creg.correlated(x,y,0.6)
+  creg.correlated(x,z,-0.2)
+  creg.correlated(x,y,0.5)
+
+  assert creg.correlation(x,y) == 0.5
+  assert creg.correlation(y,x) == 0.5
+  assert creg.correlation(z,x) == -0.2
+  assert creg.correlation(y,z) == 0
+  assert creg.correlation(x,x) == 1
+  assert creg.correlation(x,1) == 0
+  assert set( map(id,creg.dependencies(x)) ) == set( [id(y),id(z)] )
+
+  assert str(creg.matrix(x,y)) == '1.0 0.5 \n0.5 1.0 \n'
+  assert str(creg.matrix(x,z,x)) == '1.0 -0.2 1.0 \n-0.2 1.0 -0.2 \n1.0 -0.2 1.0 \n'
+  assert len(creg) == 2
+
+  # correlations are dropped when objects are garbage collected
+  del y
+  gc.collect()
+  assert [ id(v) for v in creg.dependencies(x) ] == [ id(z) ]
+  assert len(creg) == 1
+
+  assert creg.prune(0.1) == (0,0.0)
+  assert creg.prune(0.3) == (1,0.2)
+  assert creg.correlation(x,z) == 0
+
+def test_sparse_registry_numpy_scalars():
+  import numpy, decimal
+  from pyErrorProp import SparseCorrelationRegistry
+
+  x = UQ_( '2 +/- 0.2 m/s' )
+  y = UQ_( '2 m/s +/- 1%' )
+  z = UQ_( '3 m/s +/- 1%' )
+
+  # real scalars are stored as floats, so they can be put in a matrix
+  creg = SparseCorrelationRegistry( buffer_size = 2 )
+  creg.correlated(x,y,numpy.float64(0.5))
+  creg.correlated(x,z,decimal.Decimal('-0.25'))
+  assert len(creg._objects) == 0
+  assert type( creg.correlation(x,y) ) is float
+  assert creg.correlation(x,z) == -0.25
+  assert str(creg.matrix(x,y,z)) == '1.0 0.5 -0.25 \n0.5 1.0 0.0 \n-0.25 0.0 1.0 \n'
+
+  # arrays are stored as is
+  creg.correlated(y,z,numpy.array([0.1,0.2]))
+  assert creg.correlation(y,z).tolist() == [0.1,0.2]
+
+def test_sparse_registry_convention():
+  from pyErrorProp import SparseCorrelationRegistry
+
+  sconv = UncertaintyConvention( _CR = SparseCorrelationRegistry )
+  x = sconv.UncertainQuantity( '2.5 +/- 0.5 m' )
+  y = sconv.UncertainQuantity( '2.5 +/- 0.5 m' )
+  x.correlated(y,1)
+
+  z = x - y
+  assert abs( z.uncertainty.magnitude ) < 1e-10
+
+  z = x + y
+  assert abs( z.uncertainty.magnitude - 1 ) < 1e-10
+  assert abs( z.correlation(x) - 1 ) < 1e-10
+
+def test_sparse_registry_reuses_ids():
+  from pyErrorProp import SparseCorrelationRegistry
+
+  creg = SparseCorrelationRegistry( buffer_size = 2 )
+  creg._MAX_ID = 9
+
+  x = UQ_( '2 +/- 0.2 m/s' )
+  for n in range(100):
+    y = UQ_( '2 m/s +/- 1%' )
+    creg.correlated(x,y,0.5)
+    assert creg.correlation(x,y) == 0.5
+    del y
+
+  # IDs of garbage collected objects are reused, and they don't inherit old correlations
+  assert creg._next_id <= 10
+  assert len(creg) == 0
+  y = UQ_( '2 m/s +/- 1%' )
+  z = UQ_( '2 m/s +/- 1%' )
+  creg.correlated(y,z,0.1)
+  assert creg.correlation(x,y) == 0
+  assert creg.correlation(y,z) == 0.1
+
+  # running out of IDs for objects that are alive is an error
+  alive = [ UQ_( '2 m/s +/- 1%' ) for n in range(10) ]
+  with pytest.raises(OverflowError):
+    for v in alive:
+      creg.correlated(x,v,0.5)
@@ -158,3 +158,194 @@ def test_multiple_funcs():
   assert Close(  V,     Volume.magnitude, 0.001 )
   assert Close( dV,     VolumeUnc.magnitude, 0.001 )
 
+
+def test_batched_propagation():
+  calls = [0]
+  def func(x,y,z):
+    calls[0] += 1
+    return x*numpy.sin(y)/z
+
+  x = UQ_(2.5, 0.1, 'm')
+  y = UQ_(0.5, 0.01, 'radian')
+  z = UQ_(33, 2, 'ms')
+
+  propagator = PositiveIntervalPropagator()
+  nominal_value, uncertainties = propagator.__propagate_errors__( func, x, y, z=z )
+  assert calls[0] == 4
+
+  propagator = PositiveIntervalPropagator(batched=True)
+  batched_nominal_value, batched_uncertainties = propagator.__propagate_errors__( func, x, y, z=z )
+  assert calls[0] == 5
+
+  assert Close( batched_nominal_value, nominal_value, 1e-10 )
+  for k in uncertainties:
+    assert Close( batched_uncertainties[k], uncertainties[k], 1e-10 )
+
+  # array arguments are broadcast against the scalar arguments
+  x = Q_(numpy.array([1.,2.,3.]),'m')
+  batched_nominal_value, batched_uncertainties = propagator.__propagate_errors__( func, x, y, z=z )
+  assert batched_nominal_value.shape == (3,)
+  assert batched_uncertainties[1].shape == (3,)
+  assert Close( batched_uncertainties[1][2], uncertainties[1]*3/2.5, 1e-10 )
+
+  # exact and non-numeric arguments are passed unchanged
+  def gunc(x,y,scale,mode='single'):
+    z = scale*x*numpy.sin(y)
+    if mode == 'double':
+      z = 2*z
+    return z
+
+  propagator = PositiveIntervalPropagator()
+  nominal_value, uncertainties = propagator.__propagate_errors__( gunc, UQ_(2.5,0.1,'m'), y, 3.0, mode='double' )
+  propagator = PositiveIntervalPropagator(batched=True)
+  batched_nominal_value, batched_uncertainties = propagator.__propagate_errors__( gunc, UQ_(2.5,0.1,'m'), y, 3.0, mode='double' )
+  assert Close( batched_nominal_value, nominal_value, 1e-10 )
+  for k in (0,1):
+    assert Close( batched_uncertainties[k], uncertainties[k], 1e-10 )
+  assert batched_uncertainties[2] == 0
+  assert batched_uncertainties['mode'] == 0
+
+def test_forward_mode_propagation():
+  uconv = UncertaintyConvention(_EP=ForwardModePropagator)
+  UQ_ = uconv.UncertainQuantity
+  Q_  = UQ_.Quantity
+
+  x = UQ_( Q_(2.5,'m'), Q_(0.5,'m') )
+  y = UQ_( Q_(2.0,'m'), Q_(0.25,'m') )
+
+  # linear approximation is exact for division now
+  z = x/y
+  assert Close( z.nominal.magnitude, 2.5/2.0, 1e-10 )
+  assert Close( z.uncertainty.magnitude, ( (0.5/2.0)**2 + (2.5*0.25/2.0**2)**2 )**0.5, 1e-10 )
+
+  z = x - x
+  assert z.uncertainty.magnitude == 0
+
+  @uconv.WithError
+  def calc( theta, length ):
+    return length*numpy.sin(theta) + length**2/Q_(1,'m')
+
+  theta = UQ_( Q_(30,'degree'), Q_(1,'degree') )
+  z = calc( theta, length=x )
+
+  dzdtheta = 2.5*numpy.cos(numpy.pi/6)*numpy.pi/180
+  dzdlength = (numpy.sin(numpy.pi/6) + 2*2.5)*0.5
+  assert Close( z.nominal.magnitude, 2.5*0.5 + 2.5**2, 1e-10 )
+  assert Close( z.uncertainty.magnitude, (dzdtheta**2 + dzdlength**2)**0.5, 1e-10 )
+  assert str(z.nominal.units) == 'meter'
+
+  # the function is only evaluated once
+  calls = [0]
+  def func(a,b,c):
+    calls[0] += 1
+    return a*b*c
+
+  nominal_value, uncertainties = ForwardModePropagator().__propagate_errors__( func, x, y, Q_(2,'s') )
+  assert calls[0] == 1
+  assert Close( uncertainties[0].magnitude, 0.5*2.0*2, 1e-10 )
+  assert Close( uncertainties[1].magnitude, 2.5*0.25*2, 1e-10 )
+  assert uncertainties[2].magnitude == 0
+
+def test_reverse_mode_propagation():
+  fconv = UncertaintyConvention(_EP=ForwardModePropagator)
+  rconv = UncertaintyConvention(_EP=ReverseModePropagator)
+
+  def calibration( offset, *masses ):
+    total = offset
+    for m in masses:
+      total = total + m*numpy.exp(-m/offset)
+    return total
+
+  results = []
+  for uconv in (fconv,rconv):
+    UQ_ = uconv.UncertainQuantity
+    Q_  = UQ_.Quantity
+    offset = UQ_( Q_(10.,'g'), Q_(0.5,'g') )
+    masses = [ UQ_( Q_(1.+0.1*i,'g'), Q_(0.01*(i+1),'g') ) for i in range(50) ]
+    # correlations should be included
+    masses[0].correlated( masses[1], 0.5 )
+
+    results.append( uconv.WithError(calibration)( offset, *masses ) )
+
+  assert Close( results[0].nominal.magnitude, results[1].nominal.magnitude, 1e-12 )
+  assert Close( results[0].uncertainty.magnitude, results[1].uncertainty.magnitude, 1e-12 )
+  assert str(results[1].nominal.units) == 'gram'
+
+  # the function is only evaluated once
+  calls = [0]
+  def func(a,b):
+    calls[0] += 1
+    return a/b
+
+  x = UQ_(2.5, 0.5, 'm')
+  y = UQ_(2.0, 0.25, 's')
+  nominal_value, uncertainties = ReverseModePropagator().__propagate_errors__( func, x, b=y )
+  assert calls[0] == 1
+  assert Close( nominal_value, Q_(1.25,'m/s'), 1e-10 )
+  assert Close( uncertainties[0], Q_(0.5/2.0,'m/s'), 1e-10 )
+  assert Close( uncertainties['b'], Q_(-2.5*0.25/2.0**2,'m/s'), 1e-10 )
+
+def test_monte_carlo_propagation():
+  uconv = UncertaintyConvention(_EP=MonteCarloPropagator(seed=2, tolerance=2e-3))
+  UQ_ = uconv.UncertainQuantity
+  Q_  = UQ_.Quantity
+
+  assert uconv.ErrorPropagator.correlations is uconv.correlations
+
+  x = UQ_( Q_(2.5,'m'), Q_(0.5,'m') )
+  y = UQ_( Q_(2.0,'m'), Q_(0.25,'m') )
+
+  # the exact variance of a product of independent normals includes a second order term
+  z = x*y
+  assert Close( z.nominal.magnitude, 5.0, 0.01 )
+  assert Close( z.uncertainty.magnitude, (2.5**2*0.25**2 + 2.0**2*0.5**2 + 0.5**2*0.25**2)**0.5, 0.01 )
+  assert str(z.nominal.units) == 'meter ** 2'
+
+  # correlations are taken from the convention's registry
+  x.correlated(y,1)
+  z = x - y
+  assert Close( z.uncertainty.magnitude, 0.25, 0.01 )
+  assert Close( z.correlation(x), 1, 0.01 )
+
+  # samples are drawn in batches, with one function evaluation per batch
+  calls = []
+  def func(a,b):
+    calls.append( a.shape )
+    return a + b
+
+  propagator = MonteCarloPropagator( batch_size=1000, tolerance=0.05, seed=1 )
+  nominal_value, uncertainties = propagator.__propagate_errors__( func, x, y )
+  assert len(calls) > 1
+  assert calls[0] == (1000,)
+  assert Close( propagator.total_uncertainty( list(uncertainties.values()) ), Q_(0.5**2 + 0.25**2,'m**2')**0.5, 0.05 )
+
+  # the same seed gives the same result
+  assert propagator.__propagate_errors__( func, x, y )[0] == nominal_value
+
+  propagator = MonteCarloPropagator( batch_size=1000, tolerance=0.0, max_samples=2500, seed=1 )
+  calls[:] = []
+  propagator.__propagate_errors__( func, x, y )
+  assert calls == [ (1000,), (1000,), (500,) ]
+
+def test_parallel_monte_carlo_propagation():
+  uconv = UncertaintyConvention()
+  UQ_ = uconv.UncertainQuantity
+  Q_  = UQ_.Quantity
+
+  def model(a,b):
+    return a*numpy.exp(-b/Q_(1,'m'))
+
+  x = UQ_( Q_(2.5,'m'), Q_(0.5,'m') )
+  y = UQ_( Q_(2.0,'m'), Q_(0.25,'m') )
+  x.correlated(y,0.3)
+
+  results = []
+  for workers in (None,1,3):
+    propagator = MonteCarloPropagator( seed=7, workers=workers, batch_size=5000, tolerance=5e-3, correlations=uconv.correlations )
+    results.append( propagator.__propagate_errors__( model, x, b=y ) )
+
+  # results are bit-identical, regardless of the number of workers
+  for nominal_value, uncertainties in results[1:]:
+    assert nominal_value == results[0][0]
+    assert uncertainties[0] == results[0][1][0]
+    assert uncertainties['b'] == results[0][1]['b']
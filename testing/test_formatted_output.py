@@ -1 +1,54 @@
+from pyErrorProp import UncertaintyConvention
+from Utils import *
 
+import io
+import pytest
+import numpy
+
+uconv = UncertaintyConvention()
+UQ_  = uconv.UncertainQuantity
+UQA_ = uconv.UncertainQuantityArray
+Q_   = UQ_.Quantity
+
+
+def test_format_many():
+  x = UQA_( [1.2345,22.5,-301.], [0.0123,0.5,12.], 'm/s' )
+
+  for spec in ( '', '.2', '.3e', 'Lx', '~P' ):
+    assert uconv.format_many( x, spec ) == [ ('{:'+spec+'}').format(v) for v in x ]
+
+  assert uconv.format_many( x, '.1' ) == [ '1.23 +/- 0.01 meter / second', '22.5 +/- 0.5 meter / second', '-3.0E+2 +/- 1E+1 meter / second' ]
+
+  # sequences of uncertain quantities can have different units
+  xs = [ UQ_( Q_(2.,'m'), Q_(1.5,'cm') ), UQ_( Q_(20.,'degC'), Q_(1.23,'delta_degC') ) ]
+  assert uconv.format_many( xs ) == [ '2.000 +/- 0.015 meter', '20.0 +/- 1.2 degree_Celsius' ]
+
+def test_write_many():
+  x = UQA_( [1.2345,22.5,-301.], [0.0123,0.5,12.], 'm' )
+
+  stream = io.StringIO()
+  assert uconv.write_many( stream, x, '.1~', chunk_size=2 ) == 3
+  assert stream.getvalue() == '1.23 +/- 0.01 m\n22.5 +/- 0.5 m\n-3.0E+2 +/- 1E+1 m\n'
+
+  stream = io.StringIO()
+  uconv.write_many( stream, { 'x' : x, '2x' : 2*x }, '.1~', delimiter='; ' )
+  lines = stream.getvalue().splitlines()
+  assert lines[0] == 'x; 2x'
+  assert lines[1] == '1.23 +/- 0.01 m; 2.47 +/- 0.02 m'
+  assert len(lines) == 4
+
+def test_format_overload():
+  class Convention(UncertaintyConvention):
+    def __format_uncertainquantity__(self, x, fmtspec):
+      if fmtspec == 'bad':
+        raise ValueError("unsupported format spec")
+      return 'x = {0}'.format(x.nominal.magnitude)
+
+  conv = Convention()
+  x = conv.UncertainQuantity( Q_(2.,'m'), Q_(1.5,'cm') )
+  assert '{}'.format(x) == 'x = 2.0'
+  assert conv.format_many( [x] ) == [ 'x = 2.0' ]
+
+  # errors in the overload are not hidden by the default formatting
+  with pytest.raises(ValueError):
+    '{:bad}'.format(x)
@@ -0,0 +1,82 @@
+from pyErrorProp import UncertaintyConvention
+from Utils import *
+
+import numpy
+import pytest
+
+pandas = pytest.importorskip('pandas')
+
+uconv = UncertaintyConvention()
+UQ_  = uconv.UncertainQuantity
+UQA_ = uconv.UncertainQuantityArray
+Q_   = UQ_.Quantity
+PA_  = uconv.UncertainQuantityPandasArray
+
+
+def test_construction():
+  h = PA_( UQA_( [1.5,1.6,1.7], [0.01,0.01,0.02], 'm' ) )
+  assert len(h) == 3
+  assert str(h.dtype) == 'uncertain[meter]'
+  assert h.nbytes == 2*3*8
+
+  # the nominal values and uncertainties are not copied
+  assert h.nominal.magnitude is h.to_uncertainquantityarray()._nom
+  assert h.uncertainty.magnitude.tolist() == [0.01,0.01,0.02]
+
+  t = PA_( ( Q_([550.,570.],'ms'), Q_(20,'ms') ) )
+  assert Close( t[1].uncertainty.magnitude, 20 )
+
+  s = pandas.Series( [ UQ_( Q_(1.,'m'), Q_(0.1,'m') ), None, UQ_( Q_(20.,'cm'), Q_(1,'cm') ) ], dtype=uconv.UncertainQuantityDtype('m') )
+  assert s.isna().tolist() == [False,True,False]
+  assert Close( s[2].nominal.magnitude, 0.2 )
+  assert str(s[2].nominal.units) == 'meter'
+
+def test_dataframes():
+  df = pandas.DataFrame( { 'h'   : PA_( UQA_( [1.5,1.6,1.7,1.8], [0.01,0.01,0.02,0.02], 'm' ) )
+                         , 't'   : PA_( UQA_( [0.55,0.57,0.59,0.6], 0.02, 's' ) )
+                         , 'run' : ['a','a','b','b'] } )
+
+  df['g'] = 2*df.h/df.t**2
+  assert str(df.g.dtype) == 'uncertain[meter / second ** 2]'
+  for i in range(4):
+    g = 2*df.h[i]/df.t[i]**2
+    assert Close( df.g[i].nominal.magnitude    , g.nominal.magnitude    , 1e-10 )
+    assert Close( df.g[i].uncertainty.magnitude, g.uncertainty.magnitude, 1e-10 )
+
+  total = df.h.sum()
+  assert Close( total.nominal.magnitude    , 6.6 )
+  assert Close( total.uncertainty.magnitude, (2*0.01**2 + 2*0.02**2)**0.5 )
+  assert Close( df.h.mean().uncertainty.magnitude, total.uncertainty.magnitude/4 )
+
+  means = df.groupby('run').h.mean()
+  assert str(means.dtype) == 'uncertain[meter]'
+  assert Close( means['a'].nominal.magnitude    , 1.55 )
+  assert Close( means['b'].uncertainty.magnitude, 0.02*2**0.5/2 )
+
+  # selection, sorting and concatenation
+  assert df.sort_values('g').index.tolist() == [2,1,0,3]
+  assert Close( df[ df.run == 'b' ].h.iloc[0].nominal.magnitude, 1.7 )
+  assert pandas.concat( [df,df] ).shape == (8,4)
+
+  h = df.h.copy()
+  h[0] = UQ_( Q_(100.,'cm'), Q_(1,'cm') )
+  h[1] = None
+  assert Close( h[0].nominal.magnitude, 1 )
+  assert h.isna().tolist() == [False,True,False,False]
+  assert Close( df.h[0].nominal.magnitude, 1.5 )
+
+def test_comparisons_and_unsupported_aggregations():
+  h = pandas.Series( PA_( UQA_( [1.5,1.6,1.5], [0.01,0.01,0.02], 'm' ) ) )
+
+  # scalars are broadcast, and converted to the units of the column
+  assert ( h == UQ_( Q_(150.,'cm'), Q_(1,'cm') ) ).tolist() == [True,False,False]
+  assert ( h.array == UQ_( Q_(1.5,'m'), Q_(0.02,'m') ) ).tolist() == [False,False,True]
+  assert ( h == UQ_( Q_(1.5,'s'), Q_(0.01,'s') ) ).tolist() == [False,False,False]
+  assert ( h == h ).tolist() == [True,True,True]
+
+  # pandas expects a TypeError for aggregations a dtype does not support
+  df = pandas.DataFrame( { 'h' : h, 'run' : ['a','a','b'] } )
+  with pytest.raises(TypeError):
+    df.groupby('run').h.median()
+  with pytest.raises(TypeError):
+    df.h.array._groupby_op( how='median', has_dropped_na=False, min_count=-1, ngroups=2, ids=numpy.array([0,0,1]) )
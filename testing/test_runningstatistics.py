@@ -0,0 +1,59 @@
+from pyErrorProp import UncertaintyConvention
+from Utils import *
+
+import numpy
+import pytest
+
+uconv = UncertaintyConvention()
+UQ_ = uconv.UncertainQuantity
+Q_  = UQ_.Quantity
+
+TimeData = [ 1,2,3,4,2,3,3,4,2,4,3,5,3,4,2,4,5 ]*Q_('s')
+
+def test_matches_calc_uncertainquantity():
+  x = uconv.calc_UncertainQuantity( TimeData )
+
+  # one value at a time
+  stats = uconv.RunningStatistics()
+  for t in TimeData:
+    stats.add( t )
+  assert len(stats) == 17
+  assert Close( stats.calc_UQ().nominal.magnitude    , x.nominal.magnitude    , 1e-12 )
+  assert Close( stats.calc_UQ().uncertainty.magnitude, x.uncertainty.magnitude, 1e-12 )
+
+  # an array, or chunks generated by an iterator
+  def chunks():
+    for i in range(0,len(TimeData),5):
+      yield TimeData[i:i+5]
+
+  for stats in ( uconv.RunningStatistics( TimeData ), uconv.RunningStatistics( chunks() ) ):
+    y = stats.calc_UQ()
+    assert str(y.nominal.units) == 'second'
+    assert Close( y.nominal.magnitude    , x.nominal.magnitude    , 1e-12 )
+    assert Close( y.uncertainty.magnitude, x.uncertainty.magnitude, 1e-12 )
+    assert Close( stats.std_dev.magnitude, numpy.std( TimeData.magnitude, ddof=1 ), 1e-12 )
+
+  assert str( uconv.RunningStatistics( TimeData ).calc_UQ( round = True ) ) == str( uconv.calc_UQ( TimeData, round = True ) )
+
+  # decimal magnitudes
+  y = uconv.RunningStatistics( [ Q_('1','m'), Q_('2','m'), Q_('3','m') ] ).calc_UQ()
+  assert str(y.uncertainty.magnitude).startswith( '0.577350269' )
+
+def test_merge():
+  a = uconv.RunningStatistics( TimeData[:6] )
+  b = uconv.RunningStatistics( TimeData[6:].to('ms') )
+  c = uconv.RunningStatistics()
+
+  # accumulators, or their state, can be merged. units are converted.
+  c.merge( a.state ).merge( b )
+  x = uconv.calc_UQ( TimeData )
+  assert c.count == 17
+  assert Close( c.calc_UQ().nominal.magnitude    , x.nominal.magnitude    , 1e-12 )
+  assert Close( c.calc_UQ().uncertainty.magnitude, x.uncertainty.magnitude, 1e-12 )
+
+  # offset units
+  a = uconv.RunningStatistics( Q_([20.,21.,22.],'degC') )
+  a.merge( uconv.RunningStatistics( Q_([293.15,294.15,295.15],'K') ) )
+  y = a.calc_UQ()
+  assert Close( y.nominal.magnitude    , 21 )
+  assert Close( y.uncertainty.magnitude, numpy.std( [20,21,22]*2, ddof=1 )/6**0.5 )
@@ -265,3 +265,49 @@ def test_normalization():
   assert type(x.nominal.magnitude) == xtype
 
   
+
+def test_storage():
+  x = UQ_( Q_(1.5,'m'), Q_(1,'cm') )
+
+  # uncertainties are stored in the nominal units, so properties don't convert
+  assert str(x.uncertainty.units) == 'meter'
+  assert Close( x.uncertainty.magnitude, 0.01 )
+
+  T = UQ_( Q_(20.,'degC'), Q_(1.,'degC') )
+  assert str(T.uncertainty.units) == 'delta_degree_Celsius'
+
+  # the properties return new quantities, so modifying them does not change x
+  x.nominal.ito('cm')
+  x.uncertainty.ito('mm')
+  assert Close( x.nominal.magnitude, 1.5 )
+  assert str(x.nominal.units) == 'meter'
+  assert Close( x.uncertainty.magnitude, 0.01 )
+
+  nom = x.nominal
+  x.ito('cm')
+  assert Close( x.nominal.magnitude, 150 )
+  assert Close( x.uncertainty.magnitude, 1 )
+  assert str(x.uncertainty.units) == 'centimeter'
+  assert Close( nom.magnitude, 1.5 )
+
+  T.ito('degF')
+  assert Close( T.nominal.magnitude, 68 )
+  assert Close( T.uncertainty.magnitude, 1.8 )
+  assert str(T.uncertainty.units) == 'delta_degree_Fahrenheit'
+
+def test_compact_representation():
+  import weakref
+  x = UQ_( '2.5 +/- 0.5 m' )
+  y = 2*x
+
+  for v in (x,y):
+    assert not hasattr(v,'__dict__')
+    assert weakref.ref(v)() is v
+
+  # units are shared
+  assert x._unit is y._unit
+
+  # quantities are created when needed
+  assert y.nominal is not y.nominal
+  assert Close( y.nominal.magnitude, 5 )
+  assert Close( y.uncertainty.magnitude, 1 )
@@ -0,0 +1,335 @@
+from pyErrorProp import UncertaintyConvention
+from Utils import *
+
+import numpy
+import pint
+import pytest
+
+uconv = UncertaintyConvention()
+UQ_  = uconv.UncertainQuantity
+UQA_ = uconv.UncertainQuantityArray
+Q_   = UQ_.Quantity
+
+
+def test_construction():
+  x = UQA_( Q_([1.,2.,3.],'m'), Q_([1.,2.,3.],'cm') )
+
+  assert x.shape == (3,)
+  assert len(x) == 3
+  assert x.nominal.magnitude.tolist() == [1,2,3]
+  assert Close( x.uncertainty.magnitude[2], 0.03 )
+  assert str(x.units) == 'meter'
+
+  x = UQA_( [1.,2.,3.], 0.1, 'm' )
+  assert x.uncertainty.magnitude.tolist() == [0.1,0.1,0.1]
+
+  x = UQA_( Q_([2.,4.],'m'), Q_(1,'percent') )
+  assert Close( x.uncertainty.magnitude[0], 0.02 )
+  assert Close( x.uncertainty.magnitude[1], 0.04 )
+
+  x = UQA_( [1.,2.], unit='m' )
+  assert x.uncertainty.magnitude.tolist() == [0,0]
+
+  x = UQA_( [20.,30.], [1.,2.], 'degC' )
+  assert str(x.uncertainty.units) == 'delta_degree_Celsius'
+
+def test_indexing():
+  x = UQA_( [1.,2.,3.,4.], [0.1,0.2,0.3,0.4], 'm' )
+
+  y = x[1]
+  assert Close( y.nominal.magnitude, 2 )
+  assert Close( y.uncertainty.magnitude, 0.2 )
+
+  y = x[1:3]
+  assert y.nominal.magnitude.tolist() == [2,3]
+  assert y.uncertainty.magnitude.tolist() == [0.2,0.3]
+
+  y = x[ x.nominal.magnitude > 2 ]
+  assert y.nominal.magnitude.tolist() == [3,4]
+
+  assert [ v.nominal.magnitude for v in x ] == [1,2,3,4]
+
+  # elements of arrays in percent keep their (absolute) uncertainty
+  x = UQA_( Q_([10.,20.],'percent'), Q_(1,'percent') )
+  assert x._unc.tolist() == [0.1,0.2]
+  assert str(x[0].nominal.units) == 'percent'
+  assert Close( x[0].uncertainty.magnitude, 0.1 )
+  assert [ v.uncertainty.magnitude for v in x ] == [0.1,0.2]
+
+  y = uconv.parse_many( [ '1.5 +- 1 %' ] )[0]
+  assert Close( y.nominal.magnitude, 1.5 )
+  assert Close( y.uncertainty.magnitude, 0.015 )
+
+  # elements and slices are the same objects while they are alive, and keep the correlations of the array
+  x = UQA_( [1.,2.,3.], [0.1,0.1,0.2], 'm' )
+  assert (x[1] - x[1]).uncertainty.magnitude == 0
+  assert (x[0:2] - x[0:2]).uncertainty.magnitude.tolist() == [0,0]
+  assert Close( (x[0] - x[1]).uncertainty.magnitude, 0.1*2**0.5 )
+
+  t = UQ_( Q_(2.,'s'), Q_(0.1,'s') )
+  y = x**2*t
+  for i in range(3):
+    assert Close( y[i].correlation(x[i]), y.correlation(x)[i], 1e-10 )
+    assert Close( x[i].correlation(y[i]), y.correlation(x)[i], 1e-10 )
+    assert Close( y[i].correlation(t)   , y.correlation(t)[i], 1e-10 )
+  assert numpy.all( y[1:].correlation(x[1:]) == y.correlation(x)[1:] )
+  z = y[2] - x[2]**2*t
+  assert Close( z.uncertainty.magnitude, 0 )
+
+def test_conversions():
+  x = UQA_( [1.,2.], [0.01,0.02], 'm' )
+
+  y = x.to('cm')
+  assert Close( y.nominal.magnitude[1], 200 )
+  assert Close( y.uncertainty.magnitude[1], 2 )
+  assert str(x.units) == 'meter'
+
+  x.ito('cm')
+  assert Close( x.nominal.magnitude[1], 200 )
+  assert Close( x.uncertainty.magnitude[1], 2 )
+  assert str(x.units) == 'centimeter'
+
+  x = UQA_( [20.,30.], [1.,2.], 'degC' )
+  y = x.to('degF')
+  assert Close( y.nominal.magnitude[0], 68 )
+  assert Close( y.uncertainty.magnitude[0], 1.8 )
+
+def test_arithmetic_matches_scalars():
+  h = UQA_( [1.5,1.5,1.5], [0.01,0.01,0.01], 'm' )
+  t = UQA_( [0.5,0.55,0.6], [0.02,0.02,0.01], 's' )
+
+  g = 2*h/t**2
+
+  for i in range(len(g)):
+    gg = 2*UQ_( Q_(1.5,'m'), Q_(0.01,'m') )/UQ_( t.nominal[i], t.uncertainty[i] )**2
+    assert Close( g.nominal.magnitude[i], gg.nominal.magnitude, 1e-10 )
+    assert Close( g.uncertainty.magnitude[i], gg.uncertainty.magnitude, 1e-10 )
+
+  assert str(g.units) == 'meter / second ** 2'
+
+  z = h - h
+  assert z.nominal.magnitude.tolist() == [0,0,0]
+  assert z.uncertainty.magnitude.tolist() == [0,0,0]
+
+  z = -h
+  assert z.nominal.magnitude.tolist() == [-1.5,-1.5,-1.5]
+  z = abs(z)
+  assert z.nominal.magnitude.tolist() == [1.5,1.5,1.5]
+  assert Close( z.uncertainty.magnitude[0], 0.01 )
+
+  z = numpy.array([1.,2.,3.])*h
+  assert z.nominal.magnitude.tolist() == [1.5,3,4.5]
+
+  z = Q_( numpy.array([1.,2.,3.]), 's' )*h
+  assert str(z.units) == 'meter * second'
+
+def test_correlations():
+  x = UQ_( Q_(2.,'m'), Q_(0.1,'m') )
+  h = UQA_( [1.,2.], [0.1,0.1], 'm' )
+
+  y = x*h
+  assert Close( y.uncertainty.magnitude[0], ( (1*0.1)**2 + (2*0.1)**2 )**0.5 )
+
+  r = y.correlation(x)
+  assert Close( r[0], 1*0.1/y.uncertainty.magnitude[0] )
+  assert Close( r[1], 2*0.1/y.uncertainty.magnitude[1] )
+
+  # the h contribution cancels, leaving only x
+  z = y - Q_(2.,'m')*h
+  assert Close( z.uncertainty.magnitude[0], 0.1 )
+  assert Close( z.uncertainty.magnitude[1], 0.2 )
+
+def test_with_error_decorator():
+  @uconv.WithError
+  def CalcGravity( h, t ):
+    return 2*h/t**2
+
+  h = UQ_( Q_(1.5,'m'), Q_(1,'cm') )
+  t = UQA_( [0.5,0.6], [0.02,0.01], 's' )
+
+  g = CalcGravity( h, t )
+
+  gg = CalcGravity( h, t[1] )
+  assert Close( g.nominal.magnitude[1], gg.nominal.magnitude, 1e-10 )
+  assert Close( g.uncertainty.magnitude[1], gg.uncertainty.magnitude, 1e-10 )
+
+def test_propagate_many():
+  import math
+
+  def CalcGravity( h, t ):
+    return 2*h/t**2
+
+  CalcGravityWithError = uconv.WithError(CalcGravity)
+
+  rows = [ ( UQ_( Q_(1.5,'m'), Q_(1,'cm') ), UQ_( Q_(t,'s'), Q_(0.02,'s') ) ) for t in (0.5,0.55,0.6) ]
+  rows[1][0].correlated( rows[1][1], 0.5 )
+
+  g = uconv.propagate_many( CalcGravity, rows )
+  assert g.shape == (3,)
+  assert str(g.units) == 'meter / second ** 2'
+  for i,row in enumerate(rows):
+    gg = CalcGravityWithError( *row )
+    assert Close( g.nominal.magnitude[i]    , gg.nominal.magnitude    , 1e-10 )
+    assert Close( g.uncertainty.magnitude[i], gg.uncertainty.magnitude, 1e-10 )
+
+  # results are not added to the correlation registry
+  assert len( uconv.correlations.dependencies( rows[0][0] ) ) == 0
+  assert len( uconv.correlations.dependencies( rows[1][0] ) ) == 1
+
+  # columns, in chunks
+  columns = { 'h' : ( Q_([1.5,1.6,1.7],'m'), Q_(1,'cm') )
+            , 't' : UQA_( [0.5,0.55,0.6], [0.02,0.02,0.02], 's' ) }
+  g = uconv.propagate_many( CalcGravity, columns, chunk_size = 2 )
+  gg = CalcGravityWithError( UQA_( *columns['h'] ), columns['t'] )
+  assert g.nominal.magnitude.tolist() == gg.nominal.magnitude.tolist()
+  assert Close( g.uncertainty.magnitude[2], gg.uncertainty.magnitude[2], 1e-10 )
+
+  # exact and scalar columns
+  g = uconv.propagate_many( CalcGravity, { 'h' : Q_(1.5,'m'), 't' : columns['t'] } )
+  assert Close( g.uncertainty.magnitude[0], CalcGravityWithError( Q_(1.5,'m'), columns['t'][0] ).uncertainty.magnitude, 1e-10 )
+
+  # functions that don't support arrays are evaluated for each row
+  def f( x ):
+    return Q_( math.sin( x.to('rad').magnitude ) )
+
+  y = uconv.propagate_many( f, { 'x' : ( Q_([0.,1.],'rad'), Q_(0.01,'rad') ) }, chunk_size = 1 )
+  assert Close( y.nominal.magnitude[1], math.sin(1) )
+  assert Close( y.uncertainty.magnitude[0], 0.01, 1e-3 )
+
+  # empty inputs give an empty result, without calling the function
+  for columns in ( [], {} ):
+    y = uconv.propagate_many( f, columns )
+    assert y.shape == (0,)
+    assert len(y.nominal.magnitude) == 0
+
+
+def test_rounding():
+  # arrays are rounded numerically, which should give the same result as rounding each element
+  rng = numpy.random.default_rng(5)
+  nom = rng.normal(0,1,1000)*10.0**rng.integers(-6,6,1000)
+  unc = numpy.abs(rng.normal(0,1,1000))*10.0**rng.integers(-6,6,1000)
+  # exact ties, carries into the next decade, and zero uncertainties
+  nom = numpy.concatenate( [nom, [2.675, 0.45, -2.5, 12.5, 1.05, 7.0, 3.14159]] )
+  unc = numpy.concatenate( [unc, [0.01,  0.25,  0.15, 5.0,  0.96, 0.0, 0.0195 ]] )
+
+  x = UQA_( nom, unc, 'm' )
+  for n in (None,1,2,3):
+    y = round(x,n) if n is not None else round(x)
+    assert str(y.units) == 'meter'
+    for i in range(len(x)):
+      z = round(x[i],n) if n is not None else round(x[i])
+      assert y._nom[i] == z.nominal.magnitude
+      assert y._unc[i] == z.uncertainty.magnitude
+
+  # nominal values with many more digits than the uncertainty (coefficients above 2**53), and large exponents
+  nom = rng.normal(0,1,2000)*10.0**rng.integers(-30,30,2000)
+  unc = numpy.abs( nom*rng.normal(0,1,2000) )*10.0**rng.integers(-20,2,2000)
+  xx = UQA_( nom, unc, 'm' )
+  for n in (None,2):
+    y = round(xx,n) if n is not None else round(xx)
+    for i in range(len(xx)):
+      z = round(xx[i],n) if n is not None else round(xx[i])
+      assert y._nom[i] == z.nominal.magnitude
+      assert y._unc[i] == z.uncertainty.magnitude
+
+  # tiny (and huge) values are rounded without spurious overflow warnings
+  import warnings
+  xx = UQA_( [1.2345e-300, 1.2345e300], [1e-305, 1e295], 'm' )
+  with warnings.catch_warnings():
+    warnings.simplefilter('error')
+    y = round(xx)
+  for i in range(2):
+    assert y._nom[i] == round(xx[i]).nominal.magnitude
+
+  y = round(x)
+  assert y._nom[-7:].tolist() == [2.675, 0.4, -2.5, 12, 1.0, 7.0, 3.142]
+  assert y._unc[-7:].tolist() == [0.010, 0.3, 0.15, 5, 1.0, 0.0, 0.020]
+
+  # normalize rounds in place
+  z = x[-7:]
+  assert z.normalize() is z
+  assert x._nom[-7:].tolist() == y._nom[-7:].tolist()
+  assert x._unc[-7:].tolist() == y._unc[-7:].tolist()
+
+  data = numpy.array( [[1.,2.,3.,4.],[10.,21.,33.,40.]] )
+  x = uconv.calc_UncertainQuantity( Q_(data,'s'), round=True, axis=1 )
+  assert x._nom.tolist() == [2.5, 26]
+  assert x._unc.tolist() == [0.6, 7]
+
+
+def test_parse_many():
+  strings = [ '9.81 +/- 0.02 m/s^2', '981 +- 2 cm/s^2', '9.81 m/s^2 +/- 2 cm/s^2', ' 1e1+/-1 m/s**2 ', '-2 m/s^2 +/- 3 percent', '2.5 m/s^2 +/- 1%' ]
+  x = uconv.parse_many( strings )
+  assert isinstance( x, UQA_ )
+  assert str(x.units) == 'meter / second ** 2'
+  for i,s in enumerate(strings):
+    y = UQ_(s).to('m/s^2')
+    assert Close( x._nom[i], y.nominal.magnitude )
+    assert Close( x._unc[i], y.uncertainty.magnitude )
+
+  # percent as units
+  x = uconv.parse_many( [ '1.5 +- 1 %', '1.5 +- 1%' ] )
+  assert str(x.units) == 'percent'
+  assert Close( x._nom[1], 150 )
+  assert Close( x._unc[0], 0.015 )
+  assert Close( x._unc[1], 1.5 )
+
+  # offset units, and strings that have to be parsed by UncertainQuantity
+  x = uconv.parse_many( [ '20 +/- 0.5 degC', '300 +/- 1 K', 'nan +/- 1 degC' ] )
+  assert str(x.units) == 'degree_Celsius'
+  assert Close( x._nom[1], 26.85 )
+  assert Close( x._unc[1], 1 )
+  assert numpy.isnan( x._nom[2] )
+
+  x = uconv.parse_many( [ '20 +/- 0.5 m', '42/2 +/- 0.5 m' ] )
+  assert Close( x._nom[1], 21 )
+  assert Close( x._unc[1], 0.5 )
+
+  with pytest.raises(pint.errors.DimensionalityError):
+    uconv.parse_many( [ '1 m +/- 0.1 s' ] )
+
+  assert len( uconv.parse_many( [] ) ) == 0
+
+
+def test_save_and_load(tmp_path):
+  x = UQA_( numpy.linspace(0,1,1001), numpy.linspace(0.01,0.02,1001), 'm' )
+  y = UQA_( numpy.linspace(20,30,1001), 0.5, 'degC' )
+  z = UQ_( Q_(9.8,'m/s^2'), Q_(0.1,'m/s^2') )
+  x.correlated( y, numpy.linspace(-1,1,1001) )
+  x.correlated( z, 0.5 )
+
+  filename = str( tmp_path / 'data.uqd' )
+  uconv.save( filename, { 'x' : x, 'y' : y, 'z' : z, 'w' : [ UQ_(1,0.1), UQ_(2,0.2) ] } )
+
+  for mmap_mode in (None,'r'):
+    data = uconv.load( filename, mmap_mode=mmap_mode )
+    assert list(data.keys()) == ['x','y','z','w']
+    assert numpy.all( data['x']._nom == x._nom )
+    assert numpy.all( data['x']._unc == x._unc )
+    assert str(data['y'].units) == 'degree_Celsius'
+    assert numpy.all( data['y']._nom == y._nom )
+    assert isinstance( data['z'], UQ_ )
+    assert data['z'].nominal.magnitude == 9.8
+    assert str(data['z'].uncertainty.units) == 'meter / second ** 2'
+    assert data['w']._nom.tolist() == [1,2]
+
+    # correlations are restored
+    assert numpy.all( data['x'].correlation( data['y'] ) == numpy.linspace(-1,1,1001) )
+    assert data['x'].correlation( data['z'] ) == 0.5
+    assert data['y'].correlation( data['z'] ) == 0
+
+    # the loaded arrays can be used like any other
+    assert Close( (data['x'] + data['x'])[500].nominal, Q_(1,'m') )
+
+  assert isinstance( data['x']._nom, numpy.memmap )
+
+  # a single array
+  uconv.save( filename, x[:10], correlations = False )
+  data = uconv.load( filename )
+  assert isinstance( data, UQA_ )
+  assert data._nom.tolist() == x._nom[:10].tolist()
+
+  with open( filename, 'wb' ) as f:
+    f.write( b'not a data set' )
+  with pytest.raises(ValueError):
+    uconv.load( filename )
@@ -1,5 +1,6 @@
 from pyErrorProp import UncertaintyConvention
 import numpy
+import pytest
 from Utils import *
 
 uconv = UncertaintyConvention()
@@ -19,6 +20,48 @@ def test_from_data():
   assert Close( x.nominal.magnitude    , 2 )
   assert Close( x.uncertainty.magnitude, numpy.std( numpy.array([1,2,3]), ddof=1 )/(3.**0.5) )
 
+def test_from_array_data():
+  data = Q_( numpy.array([[1.,2.,3.,4.],[2.,4.,6.,9.]]), 'm' )
+
+  x = uconv.calc_UncertainQuantity( data )
+  y = uconv.calc_UncertainQuantity( list(data.flatten()) )
+  assert str(x.nominal.units) == 'meter'
+  assert Close( x.nominal.magnitude    , y.nominal.magnitude    , 1e-12 )
+  assert Close( x.uncertainty.magnitude, y.uncertainty.magnitude, 1e-12 )
+
+  # many data sets at once
+  x = uconv.calc_UncertainQuantity( data, axis=1 )
+  assert x.shape == (2,)
+  assert str(x.units) == 'meter'
+  for i in range(2):
+    y = uconv.calc_UncertainQuantity( list(data[i]) )
+    assert Close( x.nominal.magnitude[i]    , y.nominal.magnitude    , 1e-12 )
+    assert Close( x.uncertainty.magnitude[i], y.uncertainty.magnitude, 1e-12 )
+
+  x = uconv.calc_UncertainQuantity( data.magnitude, axis=0 )
+  assert x.shape == (4,)
+  assert Close( x.uncertainty.magnitude[3], 2.5 )
+
+def test_from_grouped_data():
+  values = Q_( numpy.array([1.,5.,2.,6.,3.,8.,7.]), 'm' )
+  keys   = numpy.array(['a','b','a','b','a','b','c'])
+
+  groups,x = uconv.calc_UncertainQuantity_grouped( values, keys )
+  assert groups.tolist() == ['a','b','c']
+  assert str(x.units) == 'meter'
+  for i,k in enumerate(['a','b']):
+    y = uconv.calc_UncertainQuantity( list( values[keys == k] ) )
+    assert Close( x.nominal.magnitude[i]    , y.nominal.magnitude    , 1e-12 )
+    assert Close( x.uncertainty.magnitude[i], y.uncertainty.magnitude, 1e-12 )
+
+  # a single reading has no standard error
+  assert x.nominal.magnitude[2] == 7
+  assert numpy.isnan( x.uncertainty.magnitude[2] )
+
+  groups,x = uconv.calc_UQ_grouped( [1.,2.,3.,4.], [2,1,2,1] )
+  assert groups.tolist() == [1,2]
+  assert x.nominal.magnitude.tolist() == [3,2]
+
 def test_from_data_with_decimal():
   data = [ Q_( '1', 'm' )
          , Q_( '2', 'm' )
@@ -167,3 +210,385 @@ def test_z_value_calculations():
 
 
 
+
+def test_ep_decorator_with_executor():
+  import concurrent.futures, threading
+
+  x = UQ_( '65 mile +/- 2%' )
+  t = UQ_( '1 hr +/- 5 min' )
+
+  # the nominal and both perturbed evaluations must all be running at the same time
+  # to get past the barrier.
+  barrier = threading.Barrier(3, timeout=10)
+
+  def velocity(x,t):
+    barrier.wait()
+    return x/t
+
+  with concurrent.futures.ThreadPoolExecutor(4) as pool:
+    v = uconv.WithError(executor=pool)(velocity)(x,t=t)
+
+  vv = x/t
+
+  assert Close( v.nominal.magnitude     , vv.nominal.magnitude )
+  assert Close( v.uncertainty.magnitude , vv.uncertainty.magnitude )
+  assert Close( v.correlation(x)        , vv.correlation(x) )
+
+def _velocity(x,t):
+  return x/t
+
+def test_ep_decorator_with_process_pool(monkeypatch):
+  import concurrent.futures, sys
+  from pyErrorProp import ReverseModePropagator
+
+  x = UQ_( '65 mile +/- 2%' )
+  t = UQ_( '1 hr +/- 5 min' )
+  vv = x/t
+
+  with concurrent.futures.ProcessPoolExecutor(2) as pool:
+    v = uconv.WithError(executor=pool)(_velocity)(x,t=t)
+
+  # results are rebuilt in the convention's unit registry
+  assert isinstance( v.nominal, Q_ )
+  assert v.nominal.units == vv.nominal.units
+  assert Close( v.nominal.magnitude     , vv.nominal.magnitude )
+  assert Close( v.uncertainty.magnitude , vv.uncertainty.magnitude )
+  assert Close( v.correlation(x)        , vv.correlation(x) )
+
+  # the function is replaced by its decorated version in its module,
+  # like @uconv.WithError(executor=pool)
+  with concurrent.futures.ProcessPoolExecutor(2) as pool:
+    monkeypatch.setattr( sys.modules[__name__], '_velocity', uconv.WithError(executor=pool)(_velocity) )
+    v = _velocity(x,t)
+  assert Close( v.nominal.magnitude     , vv.nominal.magnitude )
+  assert Close( v.uncertainty.magnitude , vv.uncertainty.magnitude )
+
+  # executors are only supported by the PositiveIntervalPropagator
+  conv = UncertaintyConvention( _EP = ReverseModePropagator )
+  with concurrent.futures.ThreadPoolExecutor(2) as pool:
+    with pytest.raises(TypeError):
+      conv.WithError(executor=pool)(_velocity)
+
+def test_ep_decorator_with_coroutine():
+  import asyncio, inspect
+  from pyErrorProp import ForwardModePropagator, UncertaintyConvention
+
+  x = UQ_( '65 mile +/- 2%' )
+  t = UQ_( '1 hr +/- 5 min' )
+
+  @uconv.WithError
+  async def velocity(x,t):
+    # the nominal and both perturbed evaluations must all be awaited at the same time
+    # to get past the barrier.
+    running.append(None)
+    while len(running) < 3:
+      await asyncio.sleep(0)
+    return x/t
+
+  assert inspect.iscoroutinefunction(velocity)
+
+  running = []
+  v = asyncio.run( asyncio.wait_for( velocity(x,t=t), 10 ) )
+  vv = x/t
+
+  assert Close( v.nominal.magnitude     , vv.nominal.magnitude )
+  assert Close( v.uncertainty.magnitude , vv.uncertainty.magnitude )
+  assert Close( v.correlation(x)        , vv.correlation(x) )
+
+  fconv = UncertaintyConvention( _EP=ForwardModePropagator )
+  x = fconv.UncertainQuantity( '65 mile +/- 2%' )
+  t = fconv.UncertainQuantity( '1 hr +/- 5 min' )
+
+  @fconv.WithError
+  async def velocity(x,t):
+    await asyncio.sleep(0)
+    return x/t
+
+  v = asyncio.run( velocity(x,t) )
+  assert Close( v.uncertainty.magnitude , (x/t).uncertainty.magnitude, 1e-2 )
+
+def test_ep_decorator_with_cache():
+  calls = []
+
+  @uconv.WithError(cache=2)
+  def velocity(x,t):
+    calls.append(None)
+    return x/t
+
+  x = UQ_( '65 mile +/- 2%' )
+  t = UQ_( '1 hr +/- 5 min' )
+
+  v1 = velocity(x,t)
+  assert len(calls) == 3
+  v2 = velocity(x,t)
+  assert len(calls) == 3
+  assert velocity.cache_info() == (1,1,2,1)
+
+  assert Close( v2.nominal.magnitude     , v1.nominal.magnitude )
+  assert Close( v2.uncertainty.magnitude , v1.uncertainty.magnitude )
+
+  # hits create new quantities with their own correlations
+  assert v2 is not v1
+  assert Close( v2.correlation(x), v1.correlation(x) )
+  assert Close( v2.correlation(v1), 1 )
+  assert Close( (v2 - v1).uncertainty.magnitude, 0 )
+
+  # an equal, but independent, argument uses the cached evaluations,
+  # but the result is correlated to the new argument
+  xx = UQ_( '65 mile +/- 2%' )
+  v3 = velocity(xx,t)
+  assert len(calls) == 3
+  assert Close( v3.correlation(xx), v1.correlation(x) )
+  assert Close( v3.correlation(x), 0 )
+
+  # a different uncertainty is a miss
+  velocity( UQ_( '65 mile +/- 1%' ), t )
+  assert len(calls) == 6
+
+  # least recently used entries are evicted
+  velocity( UQ_( '66 mile +/- 1%' ), t )
+  velocity( x, t )
+  assert len(calls) == 12
+  assert velocity.cache_info().currsize == 2
+
+  velocity.cache_clear()
+  assert velocity.cache_info() == (0,0,2,0)
+
+def test_lineage_limits():
+  conv = UncertaintyConvention( correlation_cutoff = 0.05, max_dependencies = 5 )
+  UQ = conv.UncertainQuantity
+
+  xs = [ UQ( '1 +/- 0.1 m' ) for i in range(200) ]
+  s = xs[0]
+  for x in xs[1:]:
+    s = s + x
+
+  # the inputs are independent, so the uncertainty is not affected
+  assert Close( s.uncertainty.magnitude, 0.1*200**0.5 )
+  assert len( conv.correlations.dependencies(s) ) <= 5
+  # the result is correlated to every input by ~1/sqrt(200), but only the largest 5 are kept
+  assert s.correlation(xs[-1]) == 0
+
+  info = conv.lineage_info()
+  assert info.pruned > 0
+  assert info.max_pruned < 0.5
+
+  # without limits, all correlations are kept
+  xs = [ UQ_( '1 +/- 0.1 m' ) for i in range(20) ]
+  s = sum( xs[1:], xs[0] )
+  assert Close( s.correlation(xs[-1]), 20**-0.5 )
+  assert uconv.lineage_info().pruned == 0
+
+  # compact removes existing correlations
+  conv.correlation_cutoff = 0.2
+  x = UQ( '1 +/- 0.1 m' )
+  y = UQ( '1 +/- 0.1 m' )
+  x.correlated(y,0.1)
+  z = UQ( '1 +/- 0.1 m' )
+  x.correlated(z,0.3)
+  assert conv.compact() >= 1
+  assert x.correlation(y) == 0
+  assert x.correlation(z) == 0.3
+
+def test_lazy_evaluation():
+  from pyErrorProp import ReverseModePropagator
+
+  lconv = UncertaintyConvention( lazy = True )
+  econv = UncertaintyConvention( _EP = ReverseModePropagator )
+
+  results = []
+  for conv in (lconv,econv):
+    UQ = conv.UncertainQuantity
+    x = UQ( '2.5 +/- 0.5 m' )
+    y = UQ( '3.5 +/- 0.1 s' )
+    w = UQ( '40 +/- 1 cm' )
+    x.correlated(w,0.3)
+
+    z = (x*y + w*y)/(x+w) - y**2/y + y*(-x)/x
+    results.append( (z.nominal.magnitude, z.uncertainty.magnitude, z.correlation(y), z.correlation(w)) )
+
+  for l,e in zip(*results):
+    assert abs( l - e ) < 1e-10
+
+  UQ = lconv.UncertainQuantity
+  x = UQ( '2.5 +/- 0.5 m' )
+  y = UQ( '3.5 +/- 0.1 m' )
+
+  # operators only record the operation
+  a = x*2
+  b = a + y
+  assert b._expr is not None and b._unit is None
+  assert Close( b.nominal.magnitude, 8.5 )
+  assert Close( b.uncertainty.magnitude, ( 1 + 0.1**2 )**0.5 )
+  # intermediate results are never evaluated or registered
+  assert a._unit is None
+  assert len( lconv.correlations.dependencies(x) ) == 1
+
+  # evaluated lazy quantities still account for shared leaves
+  c = b - a
+  assert Close( c.uncertainty.magnitude, 0.1 )
+  assert Close( c.correlation(y), 1 )
+  assert "{:.1f}".format(c) == '3.5 +/- 0.1 meter'
+  # evaluated quantities are leaves
+  assert b._expr is None
+
+  # reading a result in a loop only evaluates the new operations
+  class CountingPropagator(ReverseModePropagator):
+    def __propagate_errors__(self, f, *args, **kargs):
+      leaves.append( len(args) )
+      return super(CountingPropagator,self).__propagate_errors__( f, *args, **kargs )
+  leaves = []
+  cconv = UncertaintyConvention( lazy = CountingPropagator )
+  UQ = cconv.UncertainQuantity
+  x = UQ( '2.5 +/- 0.5 m' )
+  s = x
+  for i in range(200):
+    s = s + x*0.5
+    assert Close( s.nominal.magnitude, 2.5*(1 + 0.5*(i+1)) )
+  assert max(leaves) == 2
+  assert Close( s.uncertainty.magnitude, 0.5*(1 + 0.5*200) )
+  assert Close( s.correlation(x), 1 )
+
+def test_compiled_functions():
+  from pyErrorProp import ReverseModePropagator
+
+  rconv = UncertaintyConvention( _EP = ReverseModePropagator )
+  UQ  = rconv.UncertainQuantity
+  UQA = rconv.UncertainQuantityArray
+  Q   = UQ.Quantity
+
+  calls = []
+  def CalcGravity(h,t,n=2):
+    calls.append(None)
+    return n*h/t**2 + numpy.sin(t/Q(1,'s'))*Q(1,'m/s^2')
+
+  CalcGravityWithError = rconv.WithError(CalcGravity)
+  CalcGravityCompiled  = rconv.compile(CalcGravity)
+
+  h = UQ( Q(1.5,'m'), Q(1,'cm') )
+  for t in ( UQ( Q(0.55,'s'), Q(0.02,'s') ), UQ( Q(0.60,'s'), Q(0.01,'s') ), Q(0.57,'s') ):
+    g  = CalcGravityWithError(h,t)
+    gg = CalcGravityCompiled(h,t)
+    assert str(gg.nominal.units) == 'meter / second ** 2'
+    assert Close( gg.nominal.magnitude    , g.nominal.magnitude    , 1e-10 )
+    assert Close( gg.uncertainty.magnitude, g.uncertainty.magnitude, 1e-10 )
+    assert Close( gg.correlation(h)       , g.correlation(h)       , 1e-10 )
+
+  # one trace for each signature (argument units, and the values of exact arguments)
+  del calls[:]
+  CalcGravityCompiled( h, UQ( Q(0.50,'s'), Q(0.01,'s') ) )
+  assert len(calls) == 0
+  CalcGravityCompiled( h, UQ( Q(500,'ms'), Q(10,'ms') ) )
+  CalcGravityCompiled( h, UQ( Q(0.50,'s'), Q(0.01,'s') ), n=3 )
+  assert len(calls) == 2
+  assert len(CalcGravityCompiled.kernels) == 4
+
+  # arrays are traced once, with their shape
+  t = UQA( [0.55,0.60], [0.02,0.01], 's' )
+  g = CalcGravityCompiled(h,t)
+  assert len(calls) == 3
+  CalcGravityCompiled( h, UQA( [0.5,0.6,0.7], 0.01, 's' ) )
+  assert len(calls) == 3
+  assert isinstance( g, UQA )
+  for i in range(2):
+    gg = CalcGravityWithError(h,t[i])
+    assert Close( g.nominal.magnitude[i]    , gg.nominal.magnitude    , 1e-10 )
+    assert Close( g.uncertainty.magnitude[i], gg.uncertainty.magnitude, 1e-10 )
+    assert Close( g.correlation(h)[i]       , gg.correlation(h)       , 1e-10 )
+
+  # offset units
+  T = UQ( Q(20.,'degC'), Q(1,'delta_degC') )
+  K = rconv.compile( lambda T: T.to('K')*2 )(T)
+  assert Close( K.nominal.magnitude    , 586.3 )
+  assert Close( K.uncertainty.magnitude, 2 )
+
+def test_compiled_functions_with_exact_arguments():
+  from pyErrorProp import ReverseModePropagator
+
+  rconv = UncertaintyConvention( _EP = ReverseModePropagator )
+  UQ  = rconv.UncertainQuantity
+  UQA = rconv.UncertainQuantityArray
+  Q   = UQ.Quantity
+
+  f = rconv.compile( lambda a,x: a*x )
+  x = UQ( 2., 0.1 )
+  for z in ( f(x,3.0), f(3.0,x) ):
+    assert isinstance( z, UQ )
+    assert Close( z.nominal.magnitude    , 6 )
+    assert Close( z.uncertainty.magnitude, 0.3 )
+    assert Close( z.correlation(x)       , 1 )
+
+  # exact arguments are constants, so each value has its own kernel
+  z = f(x,4.0)
+  assert Close( z.nominal.magnitude    , 8 )
+  assert Close( z.uncertainty.magnitude, 0.4 )
+
+  z = f( Q(3.0,'s'), UQ( Q(2.,'m'), Q(0.1,'m') ) )
+  assert str(z.nominal.units) == 'meter * second'
+  assert Close( z.nominal.magnitude    , 6 )
+  assert Close( z.uncertainty.magnitude, 0.3 )
+
+  # arrays are evaluated on their magnitudes, with element-wise correlations
+  xs = UQA( [1.,2.,3.], [0.1,0.1,0.3], 'm' )
+  z = f( xs, Q(2.,'s') )
+  assert isinstance( z, UQA )
+  assert str(z.nominal.units) == 'meter * second'
+  assert numpy.all( Close( z.nominal.magnitude    , numpy.array([2,4,6]) ) )
+  assert numpy.all( Close( z.uncertainty.magnitude, numpy.array([0.2,0.2,0.6]) ) )
+  assert numpy.all( Close( z.correlation(xs)      , numpy.array([1,1,1]) ) )
+
+  zz = f( xs, UQ( Q(2.,'s'), Q(0.2,'s') ) )
+  w  = rconv.WithError( lambda a,x: a*x )( xs, UQ( Q(2.,'s'), Q(0.2,'s') ) )
+  assert numpy.all( Close( zz.nominal.magnitude    , w.nominal.magnitude     ) )
+  assert numpy.all( Close( zz.uncertainty.magnitude, w.uncertainty.magnitude ) )
+  assert numpy.all( Close( zz.correlation(xs)      , w.correlation(xs)       ) )
+
+def test_compiled_functions_with_control_flow():
+  from pyErrorProp import ReverseModePropagator, CompiledPropagator, TraceError
+
+  rconv = UncertaintyConvention( _EP = ReverseModePropagator )
+  UQ  = rconv.UncertainQuantity
+  UQA = rconv.UncertainQuantityArray
+  Q   = UQ.Quantity
+
+  # comparisons can not be replayed, these functions are evaluated with the convention's propagator
+  def f(x):
+    if x > Q(0,'m'):
+      return 2*x
+    return -3*x
+  f = rconv.compile(f)
+  for x,y,dy in ( (1.,2.,0.2), (-1.,3.,0.3) ):
+    z = f( UQ( Q(x,'m'), Q(0.1,'m') ) )
+    assert Close( z.nominal.magnitude    , y  )
+    assert Close( z.uncertainty.magnitude, dy )
+
+  m = rconv.compile( lambda x,y: max(x,y) )
+  assert Close( m( UQ(3.,0.1), UQ(2.,0.2) ).nominal.magnitude, 3 )
+  assert Close( m( UQ(1.,0.1), UQ(2.,0.2) ).uncertainty.magnitude, 0.2 )
+
+  # so are functions with unhashable constants
+  g = rconv.compile( lambda x,c: x*c[0] )
+  assert Close( g( UQ(3.,0.1), [2.] ).uncertainty.magnitude, 0.2 )
+
+  # abs is recorded, not replayed from one branch
+  a = rconv.compile( lambda x: abs(x) )
+  assert Close( a( UQ(3.,0.1) ).nominal.magnitude, 3 )
+  assert Close( a( UQ(-3.,0.1) ).nominal.magnitude, 3 )
+  assert a( UQA( [-1.,2.], [0.1,0.1] ) ).nominal.magnitude.tolist() == [1,2]
+
+  # reductions of scalars are fine, arrays must be element-wise
+  s = rconv.compile( lambda x: numpy.sum(x) )
+  assert Close( s( UQ(2.,0.1) ).uncertainty.magnitude, 0.1 )
+  with pytest.raises(TypeError):
+    s( UQA( [1.,1.,1.], [0.08,0.08,0.08], 'm' ) )
+
+  # the propagator raises a TraceError itself, once for each signature
+  p = CompiledPropagator()
+  calls = []
+  def h(x):
+    calls.append(None)
+    return x if x > 0 else -x
+  for i in range(2):
+    with pytest.raises(TraceError):
+      p.kernel( h, (UQ(1.,0.1),), {} )
+  assert len(calls) == 1
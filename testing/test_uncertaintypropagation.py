@@ -1,7 +1,7 @@
 from pyErrorProp import UncertaintyConvention
 from Utils import *
 
-import sys
+import sys, decimal
 import pytest
 
 from inspect import signature
@@ -476,3 +476,48 @@ def test_error_propagation_with_mpf():
 
 
 
+
+
+def test_operators_match_generic_propagation():
+  import operator
+  from pyErrorProp import ForwardModePropagator
+
+  for conv in [ uconv, UncertaintyConvention(_EP=ForwardModePropagator) ]:
+    UQ_ = conv.UncertainQuantity
+    Q_  = UQ_.Quantity
+
+    x = UQ_( '2.5 +/- 0.5 m' )
+    y = UQ_( '3.5 +/- 0.1 s' )
+    w = UQ_( '40 +/- 1 cm' )
+    x.correlated(w,0.3)
+
+    cases = [ ( x + w        , operator.__add__     , (x,w) )
+            , ( w - x        , operator.__sub__     , (w,x) )
+            , ( x * y        , operator.__mul__     , (x,y) )
+            , ( x / y        , operator.__truediv__ , (x,y) )
+            , ( 2 / y        , operator.__truediv__ , (2,y) )
+            , ( x**2         , operator.__pow__     , (x,2) )
+            , ( x**0.5       , operator.__pow__     , (x,0.5) )
+            , ( -x           , operator.__sub__     , (0,x) )
+            , ( x*x          , operator.__mul__     , (x,x) )
+            , ( x + Q_(3,'cm'), operator.__add__    , (x,Q_(3,'cm')) )
+            ]
+
+    for z,f,args in cases:
+      zz = conv.__propagate_errors__( f, args )
+      assert str(z.nominal.units) == str(zz.nominal.units)
+      assert Close( z.nominal.magnitude    , zz.nominal.magnitude, 1e-12 )
+      assert Close( z.uncertainty.magnitude, zz.uncertainty.to(z.uncertainty.units).magnitude, 1e-12 )
+      assert Close( z.correlation(w)       , zz.correlation(w), 1e-12 )
+
+  # Decimal magnitudes still use the generic propagation
+  D = uconv.UncertainQuantity( decimal.Decimal('1.5'), decimal.Decimal('0.1'), 'm' )
+  assert type( (D*D).nominal.magnitude ) == decimal.Decimal
+
+  # the cached operator units are limited, even if many different exponents are used
+  conv = UncertaintyConvention()
+  x = conv.UncertainQuantity( '2.5 +/- 0.5 m' )
+  for i in range(2000):
+    z = x**(1 + i/1000)
+  assert Close( z.nominal.magnitude, 2.5**2.999 )
+  assert len(conv._OPERATOR_UNITS) <= conv._OPERATOR_UNITS.maxsize